@@ -5,27 +5,22 @@ from argparse import Namespace
 
 from functions.d4j import check_out, get_failed_tests, get_properties, run_all_tests
 from functions.my_types import TestFailure
-from functions.sbfl import get_all_sbfl_res
+from functions.sbfl_table import SBFLTable, load_sbfl_table
 from projects import ALL_BUGS
 from Utils.path_manager import PathManager
 
 root = os.path.dirname(__file__)
 
-def compare(test_failure_obj: TestFailure, all_sbfl_res):
+def compare(test_failure_obj: TestFailure, sbfl_table: SBFLTable):
     for method in test_failure_obj.buggy_methods:
         class_full_name = method.class_full_name
-        idx = class_full_name.rfind('.')
-        assert idx != -1
-        class_full_name = class_full_name[:idx] + "$" + class_full_name[idx+1:]
-        start_line = method.loc[0][0]
-        end_line = method.loc[1][0]
+        assert class_full_name.rfind('.') != -1
+        start_line = method.loc[0][0] + 1
+        end_line = method.loc[1][0] + 1
         
-        for sbfl_res in all_sbfl_res:
-            if class_full_name in sbfl_res:
-                for line_num in sbfl_res[class_full_name]:
-                    if start_line <= line_num <= end_line:
-                        return True
-        return False
+        if sbfl_table.covers(class_full_name, start_line, end_line):
+            return True
+    return False
 
 def run_one_bug(config: str, version: str, project: str, bugID: int, clear: bool = True, subproj: str = ""):
     args = Namespace(
@@ -68,12 +63,12 @@ def run_one_bug(config: str, version: str, project: str, bugID: int, clear: bool
     #          SBFL results
     # ----------------------------------------
 
-    all_sbfl_res = get_all_sbfl_res(path_manager)
+    sbfl_table = load_sbfl_table(path_manager)
 
     # ----------------------------------------
     #           Compare
     # ----------------------------------------
-    if_covered = compare(test_failure_obj, all_sbfl_res)
+    if_covered = compare(test_failure_obj, sbfl_table)
     
     if clear:
         shutil.rmtree(os.path.join(path_manager.bug_path, "buggy"))
@@ -6,9 +6,12 @@ from pathlib import Path
 from pprint import pprint
 from typing import List
 
+import numpy as np
 from llama_index.core.schema import NodeWithScore
 
 sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from Evaluation.ranking import RankedEntries, topn_metrics
+from functions.ground_truth import GroundTruthMethod
 from functions.my_types import TestFailure
 from projects import ALL_BUGS
 from Utils.path_manager import PathManager
@@ -30,23 +33,16 @@ from Utils.path_manager import PathManager
 #         json.dump(results, f, indent=4)
 
 
-def evaluate_sf(path_manager, sbfl_res, buggy_method):
-    results = {"matches":[]}
-    bug_file = buggy_method["loc"]
-    bug_class_name = bug_file.split("/")[-1].split(".")[0]
-    bug_method_name = buggy_method["method_signature"]["method_name"]
-    start_line = buggy_method["start"]
-    end_line = buggy_method["end"]
-    for rank, methods in enumerate(sbfl_res):
-        for _, class_name, method_name, line_numbers in methods:
-            for line_number in line_numbers:
-                if (
-                    class_name == bug_class_name
-                    and method_name == bug_method_name
-                    and start_line <= line_number <= end_line
-                ):
-                    results["matches"].append(rank + 1)
-                    break
+def evaluate_sf(path_manager, sbfl_res, buggy_method: GroundTruthMethod):
+    """
+    "matches" holds the index of the rank group of every matched method (the dense rank),
+    "ranks" the best / worst / average rank of the same methods, counting tied methods.
+    """
+    ranks = RankedEntries.from_rank_groups(sbfl_res).match_ranks(buggy_method.class_name,
+                                                                 buggy_method.start_line,
+                                                                 buggy_method.end_line,
+                                                                 buggy_method.method_name)
+    results = {"matches": ranks.pop("dense"), "ranks": ranks}
 
     if len(results["matches"]) == 0:
         print(f"Warning: no matched indexes found for {path_manager.project}-{path_manager.bug_id}")
@@ -55,25 +51,13 @@ def evaluate_sf(path_manager, sbfl_res, buggy_method):
         json.dump(results, f, indent=4)
 
 
-def evaluate_mf(path_manager, sbfl_res, buggy_method):
-    results = {"matches":[]}
-    buggy_funcs = buggy_method["functions"]
-    for buggy_func in buggy_funcs:
-        func_res = []
-        bug_file = buggy_func["path"]
-        bug_class_name = bug_file.split("/")[-1].split(".")[0]
-        start_line = buggy_func["start_loc"]
-        end_line = buggy_func["end_loc"]
-        for rank, methods in enumerate(sbfl_res):
-            for _, class_name, _, line_numbers in methods:
-                for line_number in line_numbers:
-                    if (
-                        class_name == bug_class_name
-                        and start_line <= line_number <= end_line
-                    ):
-                        func_res.append(rank + 1)
-                        break
-        results["matches"].append(func_res)
+def evaluate_mf(path_manager, sbfl_res, buggy_methods: List[GroundTruthMethod]):
+    results = {"matches":[], "ranks": []}
+    entries = RankedEntries.from_rank_groups(sbfl_res)
+    for buggy_method in buggy_methods:
+        func_ranks = entries.match_ranks(buggy_method.class_name, buggy_method.start_line, buggy_method.end_line)
+        results["matches"].append(func_ranks.pop("dense"))
+        results["ranks"].append(func_ranks)
 
     if len(results["matches"]) == 0:
         print(f"Warning: no matched indexes found for {path_manager.project}-{path_manager.bug_id}")
@@ -82,7 +66,15 @@ def evaluate_mf(path_manager, sbfl_res, buggy_method):
         json.dump(results, f, indent=4)
 
 
-def evaluate_all_sf(res_path: str, patches_path: str=None):
+def _bug_ranks(results, rank_type: str) -> List[float]:
+    """The ranks of a result.json, results written before tie-aware ranks only have the dense ones."""
+    if rank_type == "dense":
+        return results["matches"]
+    return results.get("ranks", {}).get(rank_type, results["matches"])
+
+
+def evaluate_all_sf(res_path: str, patches_path: str=None, rank_type: str="dense"):
+    """`rank_type` selects which of the tie-aware ranks of "result.json" the metrics use."""
     all_bugs = ALL_BUGS
     top_n = OrderedDict()
     mfr = OrderedDict()
@@ -91,13 +83,12 @@ def evaluate_all_sf(res_path: str, patches_path: str=None):
 
     version = "GrowingBugs"
     for proj in all_bugs:
-        if proj not in top_n:
-            top_n[proj] = OrderedDict({"top_1": 0, "top_3": 0, "top_5": 0, "top_10": 0, "total": 0})
         if proj not in verbose:
             verbose[proj] = OrderedDict()
 
-        mfr_tmp = []
-        mar_tmp = []
+        # first and mean rank of every bug, NaN if the buggy method is not ranked
+        first_ranks = []
+        mean_ranks = []
 
         for bug_id in all_bugs[proj][0]:
             if bug_id in all_bugs[proj][1]:
@@ -114,21 +105,14 @@ def evaluate_all_sf(res_path: str, patches_path: str=None):
                 continue
             with open(res_file, 'r') as f:
                 results = json.load(f)
-                matched_indexes = results["matches"]
-            top_n[proj]["total"] += 1
+                matched_indexes = _bug_ranks(results, rank_type)
             verbose[proj][bug_id] = results
             if matched_indexes:
-                if matched_indexes[0] == 1:
-                    top_n[proj]["top_1"] += 1
-                if matched_indexes[0] <= 3:
-                    top_n[proj]["top_3"] += 1
-                if matched_indexes[0] <= 5:
-                    top_n[proj]["top_5"] += 1
-                if matched_indexes[0] <= 10:
-                    top_n[proj]["top_10"] += 1
-                mfr_tmp.append(matched_indexes[0])
-                mar_tmp.append(sum(matched_indexes) / len(matched_indexes))
+                first_ranks.append(min(matched_indexes))
+                mean_ranks.append(sum(matched_indexes) / len(matched_indexes))
             else:
+                first_ranks.append(np.nan)
+                mean_ranks.append(np.nan)
                 print(f"Warning: no matched indexes found for {version}-{proj}-{bug_id}")
 
             if patches_path:
@@ -146,15 +130,10 @@ def evaluate_all_sf(res_path: str, patches_path: str=None):
                     print(f"Warning: patch file not found for {version}-{proj}-{bug_id}")
                     verbose[proj][bug_id]["status"] = "NONE"
 
-        if mfr_tmp:
-            mfr[proj] = sum(mfr_tmp) / len(mfr_tmp)
-        else:
-            mfr[proj] = None
-
-        if mar_tmp:
-            mar[proj] = sum(mar_tmp) / len(mar_tmp)
-        else:
-            mar[proj] = None
+        metrics = topn_metrics(first_ranks, mean_ranks)
+        mfr[proj] = metrics.pop("MFR")
+        mar[proj] = metrics.pop("MAR")
+        top_n[proj] = OrderedDict(metrics)
 
     all_zero_projecs = []
     for proj in top_n:
@@ -0,0 +1,110 @@
+"""
+Tie-aware ranks for method level SBFL results and the Top-N / MFR / MAR metrics.
+
+A rank group of `parse_sbfl_version_2` holds the methods that share a score, so every
+method of a group can be given:
+    best:    1 + number of methods in the groups before it
+    worst:   number of methods in the groups before it and in its own group
+    average: mean of best and worst
+    dense:   index of its group + 1 (the rank reported in "matches")
+"""
+
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.interval_index import LineIndex
+
+RANK_TYPES = ["best", "worst", "average", "dense"]
+TOP_N = [1, 3, 5, 10]
+
+
+def assign_ranks(scores: np.ndarray, rank_type: str = "average") -> np.ndarray:
+    """Rank items by descending score, where tied items get the best / worst / average / dense rank."""
+    if rank_type not in RANK_TYPES:
+        raise ValueError(f"Unknown rank type: {rank_type}")
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.float64)
+    _, inverse, counts = np.unique(-np.nan_to_num(scores, nan=-np.inf), return_inverse=True, return_counts=True)
+    if rank_type == "dense":
+        return (inverse + 1).astype(np.float64)
+    worst = np.cumsum(counts)
+    best = worst - counts + 1
+    if rank_type == "best":
+        return best[inverse].astype(np.float64)
+    if rank_type == "worst":
+        return worst[inverse].astype(np.float64)
+    return ((best + worst) / 2)[inverse]
+
+
+@dataclass
+class RankedEntries():
+    """The method entries of the rank groups of a SBFL result, flattened in ranking order."""
+    groups: np.ndarray
+    class_names: np.ndarray
+    method_names: np.ndarray
+    # covered lines of all entries, valued by the index of their entry
+    line_index: LineIndex
+
+    @classmethod
+    def from_rank_groups(cls, sbfl_res) -> "RankedEntries":
+        groups, class_names, method_names, line_numbers, line_entries = [], [], [], [], []
+        for rank, methods in enumerate(sbfl_res):
+            for _, class_name, method_name, lines in methods:
+                line_entries.extend([len(groups)] * len(lines))
+                line_numbers.extend(lines)
+                groups.append(rank)
+                class_names.append(class_name)
+                method_names.append(method_name)
+        return cls(np.array(groups, dtype=np.int64),
+                   np.array(class_names, dtype=object),
+                   np.array(method_names, dtype=object),
+                   LineIndex(np.array(line_numbers, dtype=np.int64), np.array(line_entries, dtype=np.int64)))
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def ranks(self, rank_type: str) -> np.ndarray:
+        """The rank of every entry, where all entries of a rank group are tied."""
+        return assign_ranks(-self.groups.astype(np.float64), rank_type)
+
+    def match(self, class_name: str, start_line: int, end_line: int, method_name: Optional[str] = None) -> np.ndarray:
+        """Return the (sorted) indexes of the entries of `class_name` with a line in [start_line, end_line]."""
+        entries = np.unique(self.line_index.values_in(start_line, end_line))
+        keep = self.class_names[entries] == class_name
+        if method_name is not None:
+            keep &= self.method_names[entries] == method_name
+        return entries[keep]
+
+    def match_ranks(self, class_name: str, start_line: int, end_line: int,
+                    method_name: Optional[str] = None) -> Dict[str, List[float]]:
+        """The ranks of every matched entry, for each rank type."""
+        entries = self.match(class_name, start_line, end_line, method_name)
+        res = {}
+        for rank_type in RANK_TYPES:
+            ranks = self.ranks(rank_type)[entries]
+            res[rank_type] = ranks.tolist() if rank_type == "average" else ranks.astype(np.int64).tolist()
+        return res
+
+
+def topn_metrics(first_ranks, mean_ranks=None, top_n: List[int] = TOP_N) -> Dict[str, Optional[float]]:
+    """
+    Compute Top-N counts, MFR (mean first rank) and MAR (mean average rank) over bugs
+    in one pass. A bug without any match has a NaN first rank: it counts in "total"
+    but in none of the other metrics.
+    """
+    first_ranks = np.asarray(first_ranks, dtype=np.float64)
+    matched = ~np.isnan(first_ranks)
+    metrics = {f"top_{n}": int(np.count_nonzero(first_ranks[matched] <= n)) for n in top_n}
+    metrics["total"] = len(first_ranks)
+    metrics["MFR"] = float(first_ranks[matched].mean()) if matched.any() else None
+    if mean_ranks is not None:
+        mean_ranks = np.asarray(mean_ranks, dtype=np.float64)
+        has_mean = ~np.isnan(mean_ranks)
+        metrics["MAR"] = float(mean_ranks[has_mean].mean()) if has_mean.any() else None
+    return metrics
@@ -2,10 +2,26 @@
 # So as to save the disk space.
 import os
 import sys
+from pathlib import Path
 
 from tqdm import tqdm # type: ignore
 
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.spectrum import MATRIX_FILE, TESTS_FILE, SpectrumStore, get_store_file, read_test_runtimes
+from SBFL.shard_tests import TEST_TIMES_FILE, update_test_times
+
 res_dir = sys.argv[1]
+# results/<PID>/test_times.json
+history_file = os.path.join(os.path.dirname(os.path.normpath(res_dir)), TEST_TIMES_FILE)
+
+# keep the coverage matrix as a compact spectrum.npz instead of GZoltar's dense txt files,
+# so that rankings of any formula can be recomputed with functions/sbfl_formulas.py
+for root, dirs, files in os.walk(res_dir):
+    if MATRIX_FILE in files:
+        SpectrumStore.from_gzoltar(root).save(get_store_file(root))
+    # and the test runtimes, to balance the shards of the next runs of the project
+    if TESTS_FILE in files:
+        update_test_times(history_file, read_test_runtimes(root))
 
 # recursively list all files in a directory
 for root, dirs, files in tqdm(os.walk(res_dir)):
@@ -23,5 +39,7 @@ for root, dirs, files in tqdm(os.walk(res_dir)):
             write_f.close()
             os.remove(file_path)
             os.rename(file_path + ".new", file_path)
+        elif file_path == get_store_file(root):
+            continue
         else:
             os.remove(file_path)
\ No newline at end of file
@@ -18,7 +18,9 @@ localize(){  # 1st arg: PID, 2nd arg: BID
 
   # Checkout
   cd "$work_dir"
-  rm -rf "$PID-${BID}b"; "$D4J_HOME/framework/bin/defects4j" checkout -p "$PID" -v "${BID}b" -w "$PID-${BID}b"
+  # the compiled checkout is copied from the cache shared with the dataset stages (functions/checkout_cache.py)
+  python "$work_dir/../functions/checkout_cache.py" checkout "$D4J_HOME/framework/bin/defects4j" "$PID" "$BID" b "$PID-${BID}b"
+  cached=$?
 
 
   # Collect metadata
@@ -32,9 +34,11 @@ localize(){  # 1st arg: PID, 2nd arg: BID
   echo "$PID-${BID}b's bin dir: $src_classes_dir" >&2
   echo "$PID-${BID}b's test bin dir: $test_classes_dir" >&2
 
-  # Compile
+  # Compile, unless the cached checkout is compiled already
   cd "$work_dir/$PID-${BID}b"
-  "$D4J_HOME/framework/bin/defects4j" compile
+  if [ $cached -ne 0 ]; then
+    "$D4J_HOME/framework/bin/defects4j" compile
+  fi
 
   # Collect unit tests to run GZoltar with
 
@@ -3,6 +3,8 @@
 PID=$1
 BID=$2
 SID=$3
+SHARDS=${GZ_SHARDS:-1}  # number of JVMs the tests are split into, set by scheduler.py
+TEST_SELECTION=${GZ_TEST_SELECTION:-all}  # all, relevant, loaded_classes or budgeted, see select_tests.py
 work_dir=$(pwd)
 
 export GZOLTAR_AGENT_JAR=$work_dir/gzoltaragent.jar
@@ -13,6 +15,30 @@ export LC_ALL=en_US.UTF-8
 export LANG=en_US.UTF-8
 export LANGUAGE=en_US.UTF-8
 
+runTests(){  # 1st arg: test methods file, 2nd arg: coverage file
+  java -XX:MaxMetaspaceSize=4096M -javaagent:$GZOLTAR_AGENT_JAR=destfile=$2,buildlocation=$src_classes_dir,includes=$classes_to_debug,excludes="",inclnolocationclasses=false,output="FILE" \
+    -cp "$src_classes_dir:$D4J_HOME/framework/projects/lib/junit-4.11.jar:$test_classpath:$GZOLTAR_CLI_JAR" \
+    com.gzoltar.cli.Main runTestMethods \
+      --testMethods "$1" \
+      --collectCoverage
+}
+
+report(){  # 1st arg: coverage file, 2nd arg: output dir
+  java -cp "$src_classes_dir:$D4J_HOME/framework/projects/lib/junit-4.11.jar:$test_classpath:$GZOLTAR_CLI_JAR" \
+      com.gzoltar.cli.Main faultLocalizationReport \
+        --buildLocation "$src_classes_dir" \
+        --granularity "line" \
+        --inclPublicMethods \
+        --inclStaticConstructors \
+        --inclDeprecatedMethods \
+        --dataFile "$1" \
+        --outputDirectory "$2" \
+        --family "sfl" \
+        --formula "Tarantula:Ochiai:Jaccard:Ample:Ochiai2:DStar2" \
+        --metric "entropy" \
+        --formatter "txt"
+}
+
 localize(){  # 1st arg: PID, 2nd arg: BID
   PID=$1
   BID=$2
@@ -21,17 +47,20 @@ localize(){  # 1st arg: PID, 2nd arg: BID
   # Checkout
   cd "$work_dir"
 
+  # the compiled checkout is copied from the cache shared with the dataset stages (functions/checkout_cache.py)
+  python "$work_dir/../functions/checkout_cache.py" checkout "$D4J_HOME/framework/bin/defects4j" "$PID" "$BID" b "$PID-${BID}b" --subproj "$SID"
+  cached=$?
   if [ "$SID" = "None" ]; then
-    rm -rf "$PID-${BID}b"; "$D4J_HOME/framework/bin/defects4j" checkout -p "$PID" -v "${BID}b" -w "$PID-${BID}b"
     bug_dir="$work_dir/$PID-${BID}b"
   else
-    rm -rf "$PID-${BID}b"; "$D4J_HOME/framework/bin/defects4j" checkout -p "$PID" -v "${BID}b" -w "$PID-${BID}b" -s "$SID"
     bug_dir="$work_dir/$PID-${BID}b/$SID"
   fi
 
-  # Compile
+  # Compile, unless the cached checkout is compiled already
   cd "$bug_dir"
-  "$D4J_HOME/framework/bin/defects4j" compile
+  if [ $cached -ne 0 ]; then
+    "$D4J_HOME/framework/bin/defects4j" compile
+  fi
 
   # Collect metadata
   cd "$bug_dir"
@@ -55,6 +84,17 @@ localize(){  # 1st arg: PID, 2nd arg: BID
       "$test_classes_dir" \
       --outputFile "$unit_tests_file" \
       --includes "$relevant_tests"
+
+  if [ "$TEST_SELECTION" != "all" ]; then
+    # keep the selected tests only, budgeted selection uses the spectrum of a previous run in $GZ_SELECTION_SPECTRUM
+    test_src_dir=$($D4J_HOME/framework/bin/defects4j export -p dir.src.tests)
+    python "$work_dir/select_tests.py" filter "$unit_tests_file" "$TEST_SELECTION" \
+      --project_dir "$D4J_HOME/framework/projects/$PID" \
+      --bid "$BID" \
+      --test_dir "$bug_dir/$test_src_dir" \
+      --budget "${GZ_TEST_BUDGET:-100}" \
+      ${GZ_SELECTION_SPECTRUM:+--spectrum "$GZ_SELECTION_SPECTRUM"}
+  fi
   head "$unit_tests_file"
 
   # Collect classes to perform fault localization on
@@ -77,12 +117,19 @@ localize(){  # 1st arg: PID, 2nd arg: BID
   cd "$bug_dir"
 
   ser_file="$bug_dir/gzoltar.ser"
+  test_times_file="$work_dir/results/$PID/test_times.json"
   export _JAVA_OPTIONS="-Xmx6144M -XX:MaxHeapSize=4096M"
-  java -XX:MaxMetaspaceSize=4096M -javaagent:$GZOLTAR_AGENT_JAR=destfile=$ser_file,buildlocation=$src_classes_dir,includes=$classes_to_debug,excludes="",inclnolocationclasses=false,output="FILE" \
-    -cp "$src_classes_dir:$D4J_HOME/framework/projects/lib/junit-4.11.jar:$test_classpath:$GZOLTAR_CLI_JAR" \
-    com.gzoltar.cli.Main runTestMethods \
-      --testMethods "$unit_tests_file" \
-      --collectCoverage
+  if [ "$SHARDS" -gt 1 ]; then
+    # split the tests into balanced shards, each run by its own JVM in parallel
+    n_shards=$(python "$work_dir/shard_tests.py" split "$unit_tests_file" "$SHARDS" --history "$test_times_file")
+    for ((i = 0; i < n_shards; i++)); do
+      runTests "$bug_dir/unit_tests.shard_$i.txt" "$bug_dir/gzoltar.shard_$i.ser" > "$bug_dir/shard_$i.log" 2>&1 &
+    done
+    wait
+    cat "$bug_dir"/shard_*.log
+  else
+    runTests "$unit_tests_file" "$ser_file"
+  fi
 
   echo "Run GZoltar for $PID-${BID}b succeeds!"
   # Generate fault localization report
@@ -90,19 +137,17 @@ localize(){  # 1st arg: PID, 2nd arg: BID
 
   cd "$bug_dir"
 
-  java -cp "$src_classes_dir:$D4J_HOME/framework/projects/lib/junit-4.11.jar:$test_classpath:$GZOLTAR_CLI_JAR" \
-      com.gzoltar.cli.Main faultLocalizationReport \
-        --buildLocation "$src_classes_dir" \
-        --granularity "line" \
-        --inclPublicMethods \
-        --inclStaticConstructors \
-        --inclDeprecatedMethods \
-        --dataFile "$ser_file" \
-        --outputDirectory "$bug_dir" \
-        --family "sfl" \
-        --formula "Tarantula:Ochiai:Jaccard:Ample:Ochiai2:DStar2" \
-        --metric "entropy" \
-        --formatter "txt"
+  if [ "$SHARDS" -gt 1 ]; then
+    # merge the spectra of the shards into sfl/txt and rank the merged spectrum
+    shard_dirs=()
+    for ((i = 0; i < n_shards; i++)); do
+      report "$bug_dir/gzoltar.shard_$i.ser" "$bug_dir/shard_$i"
+      shard_dirs+=("$bug_dir/shard_$i/sfl/txt")
+    done
+    python "$work_dir/shard_tests.py" merge "$bug_dir/sfl/txt" "${shard_dirs[@]}" --history "$test_times_file"
+  else
+    report "$ser_file" "$bug_dir"
+  fi
   
   echo "Generate FL report for $PID-${BID}b succeeds!"
 }
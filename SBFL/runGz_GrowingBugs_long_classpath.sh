@@ -21,17 +21,20 @@ localize(){  # 1st arg: PID, 2nd arg: BID
   # Checkout
   cd "$work_dir"
 
+  # the compiled checkout is copied from the cache shared with the dataset stages (functions/checkout_cache.py)
+  python "$work_dir/../functions/checkout_cache.py" checkout "$D4J_HOME/framework/bin/defects4j" "$PID" "$BID" b "$PID-${BID}b" --subproj "$SID"
+  cached=$?
   if [ "$SID" = "None" ]; then
-    rm -rf "$PID-${BID}b"; "$D4J_HOME/framework/bin/defects4j" checkout -p "$PID" -v "${BID}b" -w "$PID-${BID}b"
     bug_dir="$work_dir/$PID-${BID}b"
   else
-    rm -rf "$PID-${BID}b"; "$D4J_HOME/framework/bin/defects4j" checkout -p "$PID" -v "${BID}b" -w "$PID-${BID}b" -s "$SID"
     bug_dir="$work_dir/$PID-${BID}b/$SID"
   fi
 
-  # Compile
+  # Compile, unless the cached checkout is compiled already
   cd "$bug_dir"
-  "$D4J_HOME/framework/bin/defects4j" compile
+  if [ $cached -ne 0 ]; then
+    "$D4J_HOME/framework/bin/defects4j" compile
+  fi
 
   # Collect metadata
   cd "$bug_dir"
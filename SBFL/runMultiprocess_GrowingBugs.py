@@ -1,54 +1,19 @@
-import os
-import shutil
-import subprocess as sp
-import time
+import sys
 from pathlib import Path
 
-logDir = 'logs'
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from SBFL.scheduler import GzScheduler, check_results, make_jobs
 
-maxProcessNum = 8
-processPool = []  # storing (process, "pid-bid")
+maxProcessNum = 8  # upper bound, the scheduler also bounds it by the CPUs and the memory
+retries = 1  # reruns of a bug without a valid result
+shardDict = {}  # number of JVMs the tests of a project are split into, e.g. {'Closure': 8}
+testSelection = 'all'  # tests run by GZoltar: all, relevant, loaded_classes or budgeted (see select_tests.py)
 
-def waitPatchPoolFinish():
-    while (len(processPool) > 0):
-        time.sleep(1)
-        valuesToRemove = []
-        for process, projId in processPool:
-            exitCode = process.poll()
-            if exitCode is None:
-                continue
-            else:
-                if exitCode != 0:
-                    print('[ERROR] process {} finished with non-zero exit code!'.format(projId))
-                valuesToRemove.append((process, projId))
-                print('===== Finished {} ====='.format(projId))
-        for value in valuesToRemove:
-            processPool.remove(value)
-
-def runGz(pid: str, bid: str, sid: str):
-    while (len(processPool) >= maxProcessNum):
-        time.sleep(1)
-        valuesToRemove = []
-        for process, projId in processPool:
-            exitCode = process.poll()
-            if exitCode is None:
-                continue
-            else:
-                if exitCode != 0:
-                    print('[ERROR] process {} finished with non-zero exit code!'.format(projId))
-                valuesToRemove.append((process, projId))
-                print('===== Finished {} ====='.format(projId))
-        for value in valuesToRemove:
-            processPool.remove(value)
-    logPath = os.path.join(logDir, pid+'-'+bid+'.log')
-    with open(logPath, 'w') as f:
-        if pid in ["Qpid_client", "Appformer_uberfire_workbench_client"]:
-            process = sp.Popen("bash runGz_GrowingBugs_long_classpath.sh {} {} {}".format(pid, bid, sid), stdout=f, stderr=f, shell=True, universal_newlines=True)
-        else:
-            process = sp.Popen("bash runGz_GrowingBugs.sh {} {} {}".format(pid, bid, sid), stdout=f, stderr=f, shell=True, universal_newlines=True)
-        # process = sp.Popen("echo {}-{}".format(pid, bid), stdout=f, stderr=f, shell=True, universal_newlines=True)
-    processPool.append((process, pid + '-' + bid))
-    print('===== Start {}-{} ====='.format(pid, bid))
+def getCommand(pid: str, bid: str, sid: str):
+    # the subproject is passed as is, runGz_GrowingBugs.sh checks for 'None'
+    if pid in ["Qpid_client", "Appformer_uberfire_workbench_client"]:
+        return ["bash", "runGz_GrowingBugs_long_classpath.sh", pid, bid, sid]
+    return ["bash", "runGz_GrowingBugs.sh", pid, bid, sid]
 
 d4j140ProjNames = ['Chart', 'Closure', 'Lang', 'Math', 'Mockito', 'Time']
 
@@ -330,51 +295,10 @@ projDict = {
 }
 
 def checkResults():
-    for pid in projDict:
-        bidList = projDict[pid][0]
-        deprecatedBidList = projDict[pid][1]
-        bidList = [bid for bid in bidList if bid not in deprecatedBidList]
-
-        for bid in bidList:
-            bidResultDir = 'results/{}/{}'.format(pid, bid)
-            if not os.path.isdir(bidResultDir):
-                print('[ERROR] results/{}/{} does not exist'.format(pid, bid))
-            else:
-                ochiaiFile = 'results/{}/{}/ochiai.ranking.csv'.format(pid, bid)
-                # if the file does not exist or the file is empty or it only contains one line
-                if not os.path.isfile(ochiaiFile):
-                    print('[ERROR] results/{}/{}/ochiai.ranking.csv does not exist'.format(pid, bid))
-                else:
-                    linesNum = sp.check_output('cat results/{}/{}/ochiai.ranking.csv | wc -l '.format(pid, bid), shell=True, universal_newlines=True).strip()
-                    if linesNum == '1' or linesNum == '0':
-                        print('[ERROR] results/{}/{}/ochiai.ranking.csv is empty or only has one line!'.format(pid, bid))      
+    check_results(make_jobs(projDict, getCommand, shardDict))
 
 def main():
-    os.makedirs(logDir, exist_ok=True)
-    for pid in projDict:
-        bidList = projDict[pid][0]
-        deprecatedBidList = projDict[pid][1]
-        bidList = [bid for bid in bidList if bid not in deprecatedBidList]
-        sid = projDict[pid][2]
-        if sid == 'None':
-            sid = ""
-
-        for bid in bidList:
-            bidResultDir = 'results/{}/{}'.format(pid, bid)
-            if os.path.isdir(bidResultDir):
-                ochiaiFile = 'results/{}/{}/ochiai.ranking.csv'.format(pid, bid)
-                linesNum = sp.check_output('cat results/{}/{}/ochiai.ranking.csv | wc -l '.format(pid, bid), shell=True, universal_newlines=True).strip()
-                if not os.path.isfile(ochiaiFile) or (os.path.isfile(ochiaiFile) and linesNum == '1'):
-                    print('Removing {} because the result is invalid'.format(bidResultDir))
-                    shutil.rmtree(bidResultDir)
-                else:
-                    print("results/{}/{} already exists, skipping".format(pid, bid))
-                    continue
-            if os.path.isfile(os.path.join(logDir, pid + '-' + str(bid)+'.log')):
-                os.remove(os.path.join(logDir, pid + '-' + str(bid)+'.log'))
-            runGz(pid, str(bid), sid)
-
-    waitPatchPoolFinish()
+    GzScheduler(maxProcessNum, retries=retries, env={'GZ_TEST_SELECTION': testSelection}).run(make_jobs(projDict, getCommand, shardDict))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,295 @@
+"""
+Scheduler for the GZoltar jobs of the runMultiprocess*.py scripts.
+
+Every running job has a worker thread blocked on its process, so the next job starts as
+soon as one exits. A job is only admitted while its JVMs (one per test shard) fit in the
+free CPUs and in the available memory: the memory of a JVM of a project is estimated from
+the peak RSS of its past jobs, recorded in the JSON ledger along with the status of every
+job. Invalid results are retried.
+"""
+
+import json
+import os
+import shutil
+import subprocess as sp
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+SBFL_DIR = Path(__file__).resolve().parent
+JAVA_HEAP_MB = 6144  # -Xmx of runGz*.sh, the estimate of a project without history
+MEMORY_HEADROOM = 1.2  # margin on the peak RSS of past jobs
+MEMORY_RESERVE_MB = 2048  # left to the system
+RESULT_FILE = "ochiai.ranking.csv"
+
+# statuses of a job in the ledger
+JOB_STATUSES = ["pending", "running", "done", "skipped", "failed"]
+
+
+@dataclass
+class GzJob():
+    pid: str
+    bid: str
+    command: List[str]
+    shards: int = 1  # JVMs running the tests, passed to runGz*.sh as GZ_SHARDS
+
+    @property
+    def name(self) -> str:
+        return f"{self.pid}-{self.bid}"
+
+
+def make_jobs(proj_dict,
+              get_command: Callable[[str, str, Optional[str]], List[str]],
+              shard_dict: Optional[Dict[str, int]] = None) -> List[GzJob]:
+    """
+    Make the jobs of the non deprecated bugs of a `projDict`, i.e. {pid: (bids, deprecated bids[, sid])}.
+    `get_command(pid, bid, sid)` returns the command of a bug, run in the SBFL directory.
+    `shard_dict` gives the number of test shards of the projects with long test runs.
+    """
+    shard_dict = shard_dict or {}
+    jobs = []
+    for pid in proj_dict:
+        bid_list = proj_dict[pid][0]
+        deprecated_bid_list = proj_dict[pid][1]
+        sid = proj_dict[pid][2] if len(proj_dict[pid]) > 2 else None
+        for bid in bid_list:
+            if bid in deprecated_bid_list:
+                continue
+            jobs.append(GzJob(pid, str(bid), get_command(pid, str(bid), sid), shard_dict.get(pid, 1)))
+    return jobs
+
+
+def get_result_dir(results_dir, pid: str, bid: str) -> str:
+    return os.path.join(results_dir, pid, str(bid))
+
+
+def check_result(result_dir) -> Optional[str]:
+    """Return why the result of a bug is invalid, or None if it is valid."""
+    if not os.path.isdir(result_dir):
+        return f"{result_dir} does not exist"
+    result_file = os.path.join(result_dir, RESULT_FILE)
+    if not os.path.isfile(result_file):
+        return f"{result_file} does not exist"
+    with open(result_file, "r") as f:
+        # the header and at least one ranked line
+        if f.readline() == "" or f.readline() == "":
+            return f"{result_file} is empty or only has one line"
+    return None
+
+
+def read_meminfo() -> Dict[str, int]:
+    """Fields of /proc/meminfo in MB, empty where it is not available."""
+    meminfo = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                meminfo[key] = int(value.split()[0]) // 1024
+    except (OSError, ValueError):
+        pass
+    return meminfo
+
+
+def get_max_jobs(max_jobs: Optional[int] = None) -> int:
+    """At most `max_jobs` jobs and one per CPU, the rest is left to `ResourceGate`."""
+    limits = [os.cpu_count() or 1]
+    if max_jobs:
+        limits.append(max_jobs)
+    return max(1, min(limits))
+
+
+class ResourceGate():
+    """
+    Admit jobs while the CPUs and the memory reserved by the running jobs, plus the new one,
+    fit in the CPUs and in the memory available when the gate was created, and while the
+    memory available now (other processes included) still holds the new job.
+    A job is always admitted when none runs.
+    """
+
+    def __init__(self, reserve_mb: int = MEMORY_RESERVE_MB, poll_interval: float = 5.0):
+        self.reserve_mb = reserve_mb
+        self.poll_interval = poll_interval
+        available = read_meminfo().get("MemAvailable")
+        self.budget_mb = None if available is None else available - reserve_mb
+        self.budget_cpus = os.cpu_count() or 1
+        self.reserved_mb = 0
+        self.reserved_cpus = 0
+        self.running = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, mb: int, cpus: int) -> bool:
+        if self.running == 0:
+            return True
+        if self.reserved_cpus + cpus > self.budget_cpus:
+            return False
+        if self.budget_mb is None:
+            return True
+        available = read_meminfo().get("MemAvailable", self.budget_mb + self.reserve_mb)
+        return self.reserved_mb + mb <= self.budget_mb and mb <= available - self.reserve_mb
+
+    def acquire(self, mb: int, cpus: int = 1):
+        with self._cond:
+            # memory is also freed by other processes, so check again from time to time
+            while not self._fits(mb, cpus):
+                self._cond.wait(self.poll_interval)
+            self.reserved_mb += mb
+            self.reserved_cpus += cpus
+            self.running += 1
+
+    def release(self, mb: int, cpus: int = 1):
+        with self._cond:
+            self.reserved_mb -= mb
+            self.reserved_cpus -= cpus
+            self.running -= 1
+            self._cond.notify_all()
+
+
+class Ledger():
+    """JSON file with the status of every job, rewritten on each update."""
+
+    def __init__(self, ledger_file):
+        self.ledger_file = ledger_file
+        self.jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        # keep the history of the previous runs, e.g. the peak RSS of the jobs
+        if os.path.isfile(ledger_file):
+            with open(ledger_file, "r") as f:
+                self.jobs = json.load(f)["jobs"]
+
+    def update(self, name: str, **fields):
+        with self._lock:
+            self.jobs.setdefault(name, {}).update(fields)
+            tmp_file = f"{self.ledger_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump({"updated": time.strftime("%Y-%m-%d %H:%M:%S"), "jobs": self.jobs}, f, indent=2)
+            os.replace(tmp_file, self.ledger_file)
+
+    def estimate_memory(self, pid: str, default_mb: int = JAVA_HEAP_MB) -> int:
+        """Memory of a JVM of project `pid`: the largest peak RSS of its past jobs with a margin."""
+        with self._lock:
+            # jobs that failed may have stopped before reaching their peak
+            peaks = [job["peak_rss_mb"] for job in self.jobs.values()
+                     if job.get("pid") == pid and job["status"] in ["done", "skipped"] and job.get("peak_rss_mb")]
+        if not peaks:
+            return default_mb
+        return int(max(peaks) * MEMORY_HEADROOM)
+
+    def count(self) -> Dict[str, int]:
+        with self._lock:
+            statuses = [job["status"] for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in JOB_STATUSES if statuses.count(status)}
+
+
+class GzScheduler():
+
+    def __init__(self,
+                 max_jobs: Optional[int] = None,
+                 heap_mb: int = JAVA_HEAP_MB,
+                 retries: int = 1,
+                 work_dir=SBFL_DIR,
+                 log_dir=None,
+                 results_dir=None,
+                 ledger_file=None,
+                 memory_reserve_mb: int = MEMORY_RESERVE_MB,
+                 env: Optional[Dict[str, str]] = None):
+        self.max_jobs = get_max_jobs(max_jobs)
+        self.heap_mb = heap_mb
+        self.memory_reserve_mb = memory_reserve_mb
+        # extra environment of all jobs, e.g. GZ_TEST_SELECTION
+        self.env = env or {}
+        self.retries = retries
+        self.work_dir = str(work_dir)
+        self.log_dir = log_dir or os.path.join(self.work_dir, "logs")
+        self.results_dir = results_dir or os.path.join(self.work_dir, "results")
+        self.ledger = Ledger(ledger_file or os.path.join(self.work_dir, "ledger.json"))
+
+    def run(self, jobs: List[GzJob]) -> Dict[str, int]:
+        """Run the jobs without a valid result, and return the number of jobs of each status."""
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.resource_gate = ResourceGate(self.memory_reserve_mb)
+        todo = []
+        for job in jobs:
+            result_dir = get_result_dir(self.results_dir, job.pid, job.bid)
+            if os.path.isdir(result_dir):
+                error = check_result(result_dir)
+                if error is None:
+                    print(f"{result_dir} already exists, skipping")
+                    self.ledger.update(job.name, status="skipped", pid=job.pid, result_dir=result_dir)
+                    continue
+                print(f"Removing {result_dir} because the result is invalid: {error}")
+                shutil.rmtree(result_dir)
+            self.ledger.update(job.name, status="pending", pid=job.pid, attempts=0)
+            todo.append(job)
+
+        print(f"===== {len(todo)} jobs, at most {self.max_jobs} at a time, "
+              f"{self.resource_gate.budget_mb} MB of memory =====")
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as executor:
+            futures = {executor.submit(self._run_job, job): job for job in todo}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    self.ledger.update(job.name, status="failed", error=repr(e))
+                    print(f"[ERROR] {job.name} failed: {e!r}")
+        counts = self.ledger.count()
+        print(f"===== Finished: {counts} =====")
+        return counts
+
+    def _run_process(self, job: GzJob, log_file, mode: str):
+        """Run the command of a job, and return its exit code and peak RSS in MB."""
+        with open(log_file, mode) as f:
+            env = dict(os.environ, **self.env, GZ_SHARDS=str(job.shards))
+            process = sp.Popen(job.command, cwd=self.work_dir, env=env, stdout=f, stderr=sp.STDOUT,
+                               universal_newlines=True)
+            # the rusage of the shell covers the JVMs it waited for, ru_maxrss is in KB on Linux
+            # and is the peak of the largest one, i.e. of one shard
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, rusage.ru_maxrss // 1024
+
+    def _run_job(self, job: GzJob):
+        result_dir = get_result_dir(self.results_dir, job.pid, job.bid)
+        log_file = os.path.join(self.log_dir, f"{job.name}.log")
+        memory_mb = self.ledger.estimate_memory(job.pid, self.heap_mb)
+        for attempt in range(1, self.retries + 2):
+            self.resource_gate.acquire(memory_mb * job.shards, job.shards)
+            try:
+                start_time = time.time()
+                self.ledger.update(job.name, status="running", attempts=attempt, log_file=log_file,
+                                   shards=job.shards, memory_mb=memory_mb, start_time=time.strftime("%Y-%m-%d %H:%M:%S"))
+                print(f"===== Start {job.name} (attempt {attempt}, {job.shards} x {memory_mb} MB) =====")
+                returncode, peak_rss_mb = self._run_process(job, log_file, "w" if attempt == 1 else "a")
+            finally:
+                self.resource_gate.release(memory_mb * job.shards, job.shards)
+
+            # the result decides, as runGz*.sh exits with the status of its last step only
+            error = check_result(result_dir)
+            if returncode != 0:
+                print(f"[ERROR] process {job.name} finished with non-zero exit code {returncode}!")
+            elapsed = round(time.time() - start_time, 3)
+            self.ledger.update(job.name, returncode=returncode, elapsed=elapsed, peak_rss_mb=peak_rss_mb)
+            if error is None:
+                self.ledger.update(job.name, status="done", error=None, result_dir=result_dir)
+                print(f"===== Finished {job.name} ({peak_rss_mb} MB) =====")
+                return
+            if returncode in [-9, 137]:
+                # likely killed by the OOM killer before reaching its peak, reserve more for the retry
+                error = f"killed, {error}"
+                memory_mb = max(int(memory_mb * 1.5), self.heap_mb)
+            print(f"[ERROR] {job.name} attempt {attempt}: {error}")
+            self.ledger.update(job.name, error=error)
+            shutil.rmtree(result_dir, ignore_errors=True)
+        self.ledger.update(job.name, status="failed")
+
+
+def check_results(jobs: List[GzJob], results_dir=None):
+    """Print the jobs without a valid result."""
+    results_dir = results_dir or os.path.join(SBFL_DIR, "results")
+    for job in jobs:
+        error = check_result(get_result_dir(results_dir, job.pid, job.bid))
+        if error:
+            print(f"[ERROR] {error}")
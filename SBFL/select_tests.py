@@ -0,0 +1,229 @@
+# Select the tests GZoltar runs for a bug, and measure how the selection changes the rankings.
+#
+# modes:
+#     all             every test method (relevant_tests="*")
+#     relevant        the test classes of Defects4J's relevant_tests/<BID>
+#     loaded_classes  the test classes whose source refers to a class of loaded_classes/<BID>.src
+#     budgeted        the failing tests plus at most --budget passing tests that cover the lines
+#                     of the failing tests most diversely, according to a previous spectrum
+#
+# usage:
+#     (from runGz_GrowingBugs.sh) python select_tests.py filter <unit_tests.txt> <mode> --project_dir ... --bid ...
+#     python select_tests.py report <spectrum_dir> <mode> --project_dir ... --bid ... [--formulas ochiai dstar]
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from Evaluation.ranking import assign_ranks
+from functions.sbfl import SBFL_FORMULAS
+from functions.sbfl_formulas import compute_scores
+from functions.spectrum import SpectrumStore, load_spectrum
+from functions.utils import auto_read
+
+SELECTION_MODES = ["all", "relevant", "loaded_classes", "budgeted"]
+DEFAULT_BUDGET = 100
+TOP_N = [1, 5, 10]
+
+
+def test_class_of(test_name: str) -> str:
+    """"org.foo.BarTest#testX" ==> "org.foo.BarTest" """
+    return test_name.split("#")[0]
+
+
+def read_class_list(list_file) -> List[str]:
+    if not os.path.isfile(list_file):
+        return []
+    with open(list_file, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def read_relevant_tests(project_dir, bid) -> List[str]:
+    """Test classes of `<D4J_HOME>/framework/projects/<PID>/relevant_tests/<BID>`."""
+    return read_class_list(os.path.join(project_dir, "relevant_tests", str(bid)))
+
+
+def read_loaded_classes(project_dir, bid) -> List[str]:
+    """Source classes of `<D4J_HOME>/framework/projects/<PID>/loaded_classes/<BID>.src`."""
+    return read_class_list(os.path.join(project_dir, "loaded_classes", f"{bid}.src"))
+
+
+def read_trigger_tests(project_dir, bid) -> List[str]:
+    """Failing tests of `trigger_tests/<BID>`, i.e. the "--- org.foo.BarTest::testX" lines."""
+    trigger_file = os.path.join(project_dir, "trigger_tests", str(bid))
+    if not os.path.isfile(trigger_file):
+        return []
+    with open(trigger_file, "r", errors="replace") as f:
+        return [line[4:].strip().replace("::", "#") for line in f if line.startswith("--- ")]
+
+
+def refers_to(test_source: str, test_package: str, class_name: str) -> bool:
+    """
+    If a test source refers to `class_name`: its simple name appears as a word, and the class
+    is in the package of the test, or is imported (by name or with its package).
+    """
+    package, _, simple_name = class_name.split("$")[0].rpartition(".")
+    if not re.search(rf"\b{re.escape(simple_name)}\b", test_source):
+        return False
+    return (package == test_package
+            or f"{package}.{simple_name}" in test_source
+            or f"import {package}.*" in test_source)
+
+
+def tests_touching_classes(test_classes: List[str], test_dir, classes: List[str]) -> List[str]:
+    """Test classes whose source (under `test_dir`) refers to any of `classes`."""
+    res = []
+    for test_class in test_classes:
+        test_file = os.path.join(test_dir, test_class.split("$")[0].replace(".", "/") + ".java")
+        if not os.path.isfile(test_file):
+            # keep what cannot be checked
+            res.append(test_class)
+            continue
+        test_source = auto_read(test_file)
+        test_package = test_class.rpartition(".")[0]
+        if any(refers_to(test_source, test_package, class_name) for class_name in classes):
+            res.append(test_class)
+    return res
+
+
+def select_budgeted(store: SpectrumStore, budget: int) -> np.ndarray:
+    """
+    Return the ids of the failing tests and of at most `budget` passing tests, chosen greedily
+    by the number of lines covered by the failing tests they cover and the tests chosen so far
+    do not. Once those lines are all covered, the greedy choice starts over for diversity.
+    """
+    entry_tests = store.entry_tests
+    entry_failed = store.failed[entry_tests]
+    target = np.zeros(store.n_elements, dtype=bool)
+    target[store.indices[entry_failed]] = True
+    # entries of the passing tests on the lines covered by the failing tests
+    keep = ~entry_failed & target[store.indices]
+    tests, elements = entry_tests[keep], store.indices[keep]
+
+    available = ~store.failed
+    covered = np.zeros(store.n_elements, dtype=bool)
+    chosen = []
+    while len(chosen) < budget and available.any():
+        gains = np.bincount(tests[~covered[elements] & available[tests]], minlength=store.n_tests)
+        gains[~available] = -1
+        best = int(np.argmax(gains))
+        if gains[best] <= 0:
+            if not covered.any():
+                break
+            covered[:] = False
+            continue
+        chosen.append(best)
+        available[best] = False
+        covered[elements[tests == best]] = True
+    return np.sort(np.concatenate([np.flatnonzero(store.failed), np.array(chosen, dtype=np.int64)]))
+
+
+def select_test_names(mode: str,
+                      test_names: List[str],
+                      project_dir=None,
+                      bid=None,
+                      test_dir=None,
+                      store: Optional[SpectrumStore] = None,
+                      budget: int = DEFAULT_BUDGET) -> List[str]:
+    """Return the selected tests of `test_names` ("org.foo.BarTest#testX"), in their order."""
+    if mode not in SELECTION_MODES:
+        raise ValueError(f"Unknown test selection mode: {mode}")
+    if mode == "all":
+        return list(test_names)
+    if mode == "budgeted":
+        if store is None or not store.test_names:
+            print("[WARNING] budgeted selection needs a previous spectrum with test names, keep all tests")
+            return list(test_names)
+        selected = {store.test_names[i] for i in select_budgeted(store, budget).tolist()}
+        # new tests and the failing tests are kept even if the previous spectrum did not have them
+        known = set(store.test_names)
+        selected |= {name for name in test_names if name not in known}
+    else:
+        test_classes = sorted({test_class_of(name) for name in test_names})
+        if mode == "relevant":
+            relevant = set(read_relevant_tests(project_dir, bid))
+            selected_classes = {c for c in test_classes if c.split("$")[0] in relevant}
+        else:
+            selected_classes = set(tests_touching_classes(test_classes, test_dir, read_loaded_classes(project_dir, bid)))
+        selected = {name for name in test_names if test_class_of(name) in selected_classes}
+    if project_dir is not None:
+        selected |= set(read_trigger_tests(project_dir, bid))
+    return [name for name in test_names if name in selected]
+
+
+def filter_unit_tests(unit_tests_file, mode: str, **kwargs) -> int:
+    """Rewrite GZoltar's `unit_tests.txt` ("JUNIT,org.foo.BarTest#testX" lines) with the selected tests only."""
+    with open(unit_tests_file, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    names = {line.split(",", 1)[-1]: line for line in lines}
+    selected = select_test_names(mode, list(names), **kwargs)
+    with open(unit_tests_file, "w") as f:
+        f.writelines(names[name] + "\n" for name in selected)
+    print(f"[{mode}] {len(selected)}/{len(names)} tests selected")
+    return len(selected)
+
+
+def compare_rankings(full: SpectrumStore, reduced: SpectrumStore, formula: str) -> Dict:
+    """
+    How the ranking of the reduced spectrum differs from the full one: the share of the full
+    top-N lines still in the top-N, and the mean change of the (average) rank of the full top-10.
+    """
+    full_ranks = assign_ranks(compute_scores(full.counts(), formula), "average")
+    reduced_ranks = assign_ranks(compute_scores(reduced.counts(), formula), "average")
+    res = {}
+    for n in TOP_N:
+        full_top = full_ranks <= n
+        res[f"top_{n}_kept"] = float((full_top & (reduced_ranks <= n)).sum() / max(full_top.sum(), 1))
+    top = full_ranks <= max(TOP_N)
+    res["top_10_rank_shift"] = float(np.abs(reduced_ranks[top] - full_ranks[top]).mean()) if top.any() else None
+    return res
+
+
+def report(spectrum_dir, mode: str, formulas: List[str] = SBFL_FORMULAS, **kwargs) -> Dict:
+    """Select tests from the spectrum of a full run, and compare the rankings with and without the selection."""
+    full = load_spectrum(spectrum_dir)
+    if mode == "budgeted":
+        kwargs["store"] = full
+    selected = set(select_test_names(mode, full.test_names, **kwargs))
+    test_ids = np.array([i for i, name in enumerate(full.test_names) if name in selected], dtype=np.int64)
+    reduced = full.select_tests(test_ids)
+    return {
+        "mode": mode,
+        "tests": len(test_ids),
+        "total_tests": full.n_tests,
+        "failing_tests": int(reduced.failed.sum()),
+        "total_failing_tests": int(full.failed.sum()),
+        "formulas": {formula: compare_rankings(full, reduced, formula) for formula in formulas},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select the tests of a GZoltar run")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    filter_parser = subparsers.add_parser("filter")
+    filter_parser.add_argument("unit_tests_file", type=str)
+    report_parser = subparsers.add_parser("report")
+    report_parser.add_argument("spectrum_dir", type=str, help="Spectrum of a run with all tests")
+    report_parser.add_argument("--formulas", type=str, nargs="+", default=SBFL_FORMULAS)
+    for sub_parser in [filter_parser, report_parser]:
+        sub_parser.add_argument("mode", type=str, choices=SELECTION_MODES)
+        sub_parser.add_argument("--project_dir", type=str, default=None, help="<D4J_HOME>/framework/projects/<PID>")
+        sub_parser.add_argument("--bid", type=str, default=None)
+        sub_parser.add_argument("--test_dir", type=str, default=None, help="Test sources of the checkout")
+        sub_parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET)
+    filter_parser.add_argument("--spectrum", type=str, default=None, help="Previous spectrum for budgeted selection")
+    args = parser.parse_args()
+
+    kwargs = {"project_dir": args.project_dir, "bid": args.bid, "test_dir": args.test_dir, "budget": args.budget}
+    if args.command == "filter":
+        if args.mode == "budgeted" and args.spectrum:
+            kwargs["store"] = load_spectrum(args.spectrum)
+        filter_unit_tests(args.unit_tests_file, args.mode, **kwargs)
+    else:
+        print(json.dumps(report(args.spectrum_dir, args.mode, args.formulas, **kwargs), indent=2))
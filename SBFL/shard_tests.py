@@ -0,0 +1,111 @@
+# Split the test methods of a bug into shards run by separate GZoltar JVMs,
+# and merge the spectra of the shards into one before ranking.
+#
+# usage (from runGz_GrowingBugs.sh):
+#     python shard_tests.py split <unit_tests.txt> <n_shards> --history results/<PID>/test_times.json
+#     python shard_tests.py merge <output_dir> <shard spectrum dirs...> --history results/<PID>/test_times.json
+import argparse
+import heapq
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.sbfl import SBFL_FORMULAS
+from functions.sbfl_formulas import rank_spectrum
+from functions.spectrum import SpectrumStore, get_store_file, read_test_runtimes
+
+TEST_TIMES_FILE = "test_times.json"  # per project, in results/<PID>/
+
+
+def get_shard_file(unit_tests_file, shard_id: int) -> str:
+    root, ext = os.path.splitext(unit_tests_file)
+    return f"{root}.shard_{shard_id}{ext}"
+
+
+def load_test_times(history_file) -> Dict[str, int]:
+    if history_file and os.path.isfile(history_file):
+        with open(history_file, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def update_test_times(history_file, runtimes: Dict[str, int]):
+    """Merge the runtimes of a run into the history of a project, the latest run wins."""
+    test_times = load_test_times(history_file)
+    test_times.update(runtimes)
+    os.makedirs(os.path.dirname(os.path.abspath(history_file)), exist_ok=True)
+    # bugs of a project may finish at the same time, so write to a private file first
+    tmp_file = f"{history_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(test_times, f)
+    os.replace(tmp_file, history_file)
+
+
+def split_tests(tests: List[str], n_shards: int, test_times: Dict[str, int]) -> List[List[str]]:
+    """
+    Longest processing time first: give the slowest remaining test to the least loaded shard.
+    Tests without history weigh the median known runtime (all tests weigh 1 without history).
+    """
+    n_shards = max(1, min(n_shards, len(tests)))
+    known = sorted(test_times[t] for t in tests if t in test_times)
+    default = known[len(known) // 2] if known else 1
+    weights = [max(test_times.get(t, default), 1) for t in tests]
+
+    shards = [[] for _ in range(n_shards)]
+    loads = [(0, i) for i in range(n_shards)]
+    for i in sorted(range(len(tests)), key=lambda i: -weights[i]):
+        load, shard_id = heapq.heappop(loads)
+        shards[shard_id].append(i)
+        heapq.heappush(loads, (load + weights[i], shard_id))
+    # keep the order of the test list within a shard, so tests of a class stay together
+    return [[tests[i] for i in sorted(shard)] for shard in shards]
+
+
+def split(unit_tests_file, n_shards: int, history_file=None) -> int:
+    """Write the shards next to `unit_tests_file` and return their number."""
+    with open(unit_tests_file, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    # lines of GZoltar's listTestMethods look like "JUNIT,org.foo.BarTest#testX"
+    names = {line.split(",", 1)[-1]: line for line in lines}
+    shards = split_tests(list(names), n_shards, load_test_times(history_file))
+    for shard_id, shard in enumerate(shards):
+        with open(get_shard_file(unit_tests_file, shard_id), "w") as f:
+            f.writelines(names[name] + "\n" for name in shard)
+    return len(shards)
+
+
+def merge(output_dir, shard_dirs: List[str], history_file=None, formulas: List[str] = SBFL_FORMULAS):
+    """Merge the spectra of the shards into `output_dir` and rank it with `formulas`."""
+    store = SpectrumStore.merge([SpectrumStore.from_gzoltar(shard_dir) for shard_dir in shard_dirs])
+    os.makedirs(output_dir, exist_ok=True)
+    store.save(get_store_file(output_dir))
+    rank_spectrum(output_dir, formulas)
+    if history_file:
+        runtimes = {}
+        for shard_dir in shard_dirs:
+            runtimes.update(read_test_runtimes(shard_dir))
+        update_test_times(history_file, runtimes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split tests into GZoltar shards and merge their spectra")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    split_parser = subparsers.add_parser("split")
+    split_parser.add_argument("unit_tests_file", type=str)
+    split_parser.add_argument("n_shards", type=int)
+    split_parser.add_argument("--history", type=str, default=None)
+    merge_parser = subparsers.add_parser("merge")
+    merge_parser.add_argument("output_dir", type=str)
+    merge_parser.add_argument("shard_dirs", type=str, nargs="+")
+    merge_parser.add_argument("--history", type=str, default=None)
+    merge_parser.add_argument("--formulas", type=str, nargs="+", default=SBFL_FORMULAS)
+    args = parser.parse_args()
+
+    if args.command == "split":
+        # the number of shards is read by the shell script
+        print(split(args.unit_tests_file, args.n_shards, args.history))
+    else:
+        merge(args.output_dir, args.shard_dirs, args.history, args.formulas)
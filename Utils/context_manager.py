@@ -12,6 +12,7 @@ class WorkDir():
     
     def __exit__(self, exc_type, exc_value, traceback):
         os.chdir(self.cwd)
-        return True
+        # errors in the body are swallowed, but not interrupts such as KeyboardInterrupt or a bug timeout
+        return exc_type is None or issubclass(exc_type, Exception)
 
 
@@ -80,6 +80,7 @@ class PathManager():
         self.test_prefix = None
         self.src_class_prefix = None
         self.test_class_prefix = None
+        self.index_workers = 1
 
         for path in [
             self.res_path,
@@ -136,6 +137,8 @@ class PathManager():
             # self.chat_rerank_top_n = hyper["chat_rerank_top_n"]
             # sbfl
             self.sbfl_formula = hyper["sbfl_formula"]
+            # processes of the project indexer, run_all already runs bugs in parallel
+            self.index_workers = hyper.get("index_workers", 1)
             if self.sbfl_formula:
                 self.sbfl_file = os.path.join(
                     self.root_path,
@@ -1,201 +1,255 @@
+import hashlib
 import os
 import sys
-from difflib import unified_diff
+from bisect import bisect_left
+from dataclasses import dataclass, field, fields
+from difflib import SequenceMatcher, unified_diff
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import tree_sitter
 from tree_sitter import Language, Parser
 from unidiff import PatchSet
 
 sys.path.append(Path(__file__).resolve().parents[2].as_posix())
 from functions.my_types import JMethod
+from functions.parser_pool import get_node_query, get_parser
 
 CLASS_DECLARATION_TYPES = ["class_declaration", "interface_declaration", "enum_declaration", "enum_body_declaration"]
 CLASS_BODY_TYPES = ["class_body", "interface_body", "enum_body"]
 METHOD_DECLARATION_TYPES = ["method_declaration", "constructor_declaration"]
 LANGUAGE = "java"
+DIFF_MODES = ["unified", "ast"]
+
+class SourceLines():
+    """UTF-8 source with the byte offset of every line, to slice whole lines out of it."""
+
+    def __init__(self, source: bytes):
+        self.source = source
+        newlines = np.flatnonzero(np.frombuffer(source, dtype=np.uint8) == ord("\n"))
+        # kept as int64 arrays, python int lists would take more memory than the source
+        self.line_starts = np.concatenate([[0], newlines + 1])
+        self.line_ends = np.append(newlines, len(source))
+
+    def get_lines(self, start_row: int, end_row: int) -> str:
+        """Lines [start_row, end_row] joined by newlines, i.e. `"\\n".join(code.split("\\n")[start_row: end_row + 1])`."""
+        end_row = min(end_row, len(self.line_ends) - 1)
+        if start_row > end_row:
+            return ""
+        return self.source[int(self.line_starts[start_row]): int(self.line_ends[end_row])].decode("utf8")
+
+
+class LazyJMethod(JMethod):
+    """
+    A `JMethod` whose code and text are sliced from the source of its file on first access.
+    The `code`, `text` and `class_full_name` keywords take the fields of a `JMethod`, so that
+    `dataclasses.replace` works on it (the copy holds its code and text, not the source).
+    """
+
+    def __init__(self, name, class_name, param_types, return_type, comment, loc,
+                 source: Optional[SourceLines] = None,
+                 code_rows: Optional[Tuple[int, int]] = None,
+                 text_rows: Optional[Tuple[int, int]] = None,
+                 code: Optional[str] = None,
+                 text: Optional[str] = None,
+                 class_full_name: Optional[str] = None):
+        self._source = source
+        self._code_rows = code_rows
+        self._text_rows = text_rows
+        self._code = code
+        self._text = text
+        super().__init__(name, class_name, param_types, return_type, None, comment, None, loc, class_full_name)
+
+    @property
+    def code(self) -> str:
+        if self._code is None:
+            self._code = self._source.get_lines(*self._code_rows)
+        return self._code
+
+    @code.setter
+    def code(self, value):
+        if value is not None:
+            self._code = value
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._source.get_lines(*self._text_rows)
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        if value is not None:
+            self._text = value
+
+    def __eq__(self, other):
+        # equal to the plain JMethod it is pickled or copied as
+        if not isinstance(other, JMethod):
+            return NotImplemented
+        return all(getattr(self, f.name) == getattr(other, f.name) for f in fields(JMethod))
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # pickled and copied as a plain JMethod, without the source of the whole file
+        return (JMethod, tuple(getattr(self, f.name) for f in fields(JMethod)))
+
+
+def get_param_types(method_declaration) -> List[str]:
+    type_list = []
+    c = method_declaration.child_by_field_name("parameters").named_children
+    for param in c:
+        if param.type == "spread_parameter":  # solve spread parameter, e.g., "final String[]..." -> "String[][]"
+            for child in param.children:
+                if child.type != "modifiers":
+                    arg = bytes.decode(child.text) + "[]"
+                    type_list.append(arg)
+                    break
+        else:
+            type_identifier = param.child_by_field_name("type")
+            if type_identifier is None:
+                continue
+            if type_identifier.type == "scoped_type_identifier":  # e.g., "Node.Type" -> "Type"
+                arg = bytes.decode(type_identifier.named_children[-1].text)
+            else:
+                arg = bytes.decode(type_identifier.text)
+            
+            # solve array parameter, e.g., "String" -> "String[]"
+            dimension = param.child_by_field_name("dimensions")
+            if dimension is not None:
+                arg += "[]"
+
+            # remove type parameters. e.g., "List<String>" -> "List"
+            if "<" in arg:
+                arg = arg.split("<")[0]
+            type_list.append(arg)
+    return type_list
+
+
+def get_return_type(method_declaration) -> str:
+    c = method_declaration.child_by_field_name("type")
+    if c is None:  # constructor
+        return ""
+    elif c.type == "generic_type":
+        c = c.named_children[0]
+    elif c.type == "scoped_type_identifier":  # e.g., "Node.Type" -> "Type"
+        c = c.named_children[-1]
+    return bytes.decode(c.text)
+
+
+def get_method_name(method_declaration) -> Optional[str]:
+    for child in method_declaration.children:
+        if child.type == "identifier":
+            return bytes.decode(child.text)
+
+
+def get_class_name_for_class_body(class_body, outer_class_name: Optional[str], declared_names: Tuple[str, ...],
+                                  counter: Dict[str, int]) -> str:
+    """
+    The name of a declared class is the names of all its enclosing declarations joined by "$",
+    an anonymous class is named by its enclosing class and its number in that class.
+    """
+    if class_body.parent.type in CLASS_DECLARATION_TYPES:  # declared class
+        assert len(declared_names) > 0, "class name not found"
+        return "$".join(declared_names)
+    # anonymous class
+    assert outer_class_name is not None, "class name not found"
+    counter[outer_class_name] += 1
+    return outer_class_name + "$" + str(counter[outer_class_name])
+
+
+def get_method_object(node: tree_sitter.Node, class_name: str, source: SourceLines) -> JMethod:
+    method_location = (node.start_point, node.end_point)
+    code_rows = (node.start_point[0], node.end_point[0])
+    if "comment" in node.prev_sibling.type:
+        method_comment = bytes.decode(node.prev_sibling.text)
+        text_rows = (node.prev_sibling.start_point[0], node.end_point[0])
+    else:
+        method_comment = ""
+        text_rows = code_rows
+    return LazyJMethod(get_method_name(node),
+                       class_name,
+                       get_param_types(node),
+                       get_return_type(node),
+                       method_comment,
+                       method_location,
+                       source,
+                       code_rows,
+                       text_rows)
+
 
 class JavaMethodExtractor:
-    def __init__(self) -> None:
-        try:
-            import tree_sitter_languages  # pants: no-infer-dep
-            self.parser = tree_sitter_languages.get_parser(LANGUAGE)
-        except ImportError:
-            raise ImportError(
-                "Please install tree_sitter_languages to use JavaClassSplitter."
-                "Or pass in a parser object."
-            )
-        except Exception:
-            print(
-                f"Could not get parser for language {LANGUAGE}. Check "
-                "https://github.com/grantjenks/py-tree-sitter-languages#license "
-                "for a list of valid languages."
-            )
-            raise
-
-    def get_java_methods(self, code: str, only_class: str = None) -> List[JMethod]:
+    @property
+    def parser(self) -> Parser:
+        """The parser of the calling thread, from the shared parser pool."""
+        return get_parser(LANGUAGE)
+
+    def get_java_methods(self, code: Union[str, bytes], only_class: str = None) -> List[JMethod]:
         """
         find all method declarations, including methods in inner classes.
         
-        ignore the nested relationship between methods, which means when there are 
-        inner-methods (such as methods of anonymous class or else) in a outer-method, 
-        only keep the outer-method.
+        the class bodies, class declarations and methods are captured by one tree-sitter
+        query and visited in source order with a stack of their enclosing captures, so the
+        AST is not walked in Python and deep nesting cannot hit the recursion limit. The
+        code and text of a method are sliced from the source when they are first read.
         
         args:
-            code: str, java code
+            code: str, java code, or its UTF-8 bytes (see `read_source_bytes`)
             only_class: str, if not None, only return methods in this class
         """
+        source = SourceLines(code if isinstance(code, bytes) else bytes(code, "utf8"))
+        tree = self.parser.parse(source.source)
+        query = get_node_query(tuple(CLASS_DECLARATION_TYPES + CLASS_BODY_TYPES + METHOD_DECLARATION_TYPES))
+        nodes = [node for node, _ in query.captures(tree.root_node)]
+        # outer nodes first when two nodes start at the same byte
+        nodes.sort(key=lambda node: (node.start_byte, -node.end_byte))
 
-        def get_param_types(method_declaration):
-            type_list = []
-            c = method_declaration.child_by_field_name("parameters").named_children
-            for param in c:
-                if param.type == "spread_parameter":  # solve spread parameter, e.g., "final String[]..." -> "String[][]"
-                    for child in param.children:
-                        if child.type != "modifiers":
-                            arg = bytes.decode(child.text) + "[]"
-                            type_list.append(arg)
-                            break
-                else:
-                    type_identifier = param.child_by_field_name("type")
-                    if type_identifier is None:
-                        continue
-                    if type_identifier.type == "scoped_type_identifier":  # e.g., "Node.Type" -> "Type"
-                        arg = bytes.decode(type_identifier.named_children[-1].text)
-                    else:
-                        arg = bytes.decode(type_identifier.text)
-                    
-                    # solve array parameter, e.g., "String" -> "String[]"
-                    dimension = param.child_by_field_name("dimensions")
-                    if dimension is not None:
-                        arg += "[]"
-
-                    # remove type parameters. e.g., "List<String>" -> "List"
-                    if "<" in arg:
-                        arg = arg.split("<")[0]
-                    type_list.append(arg)
-            return type_list
-        
-        def get_return_type(method_declaration):
-            c = method_declaration.child_by_field_name("type")
-            if c is None:  # constructor
-                return ""
-            elif c.type == "generic_type":
-                c = c.named_children[0]
-            elif c.type == "scoped_type_identifier":  # e.g., "Node.Type" -> "Type"
-                c = c.named_children[-1]
-            return bytes.decode(c.text)
-
-        def get_method_name(method_declaration):
-            for child in method_declaration.children:
-                if child.type == "identifier":
-                    return bytes.decode(child.text)
-
-        def get_class_name_for_method(node):
-            nonlocal loc2cname
-            while True:
-                if node.type in CLASS_BODY_TYPES:
-                    break
-                node = node.parent
-            return loc2cname[node.byte_range]
-
-        def get_method_object(node: tree_sitter.Node) -> JMethod:
-            class_name = get_class_name_for_method(node)
-            if only_class is not None:
-                if class_name != only_class:
-                    return None
-            method_code = "\n".join(code_list[node.start_point[0]: node.end_point[0] + 1])
-            method_name = get_method_name(node)
-            param_types = get_param_types(node)
-            return_type = get_return_type(node)
-            method_location = (node.start_point, node.end_point)
-            if "comment" in node.prev_sibling.type:
-                method_comment = bytes.decode(node.prev_sibling.text)
-                method_text = "\n".join(code_list[node.prev_sibling.start_point[0]: node.end_point[0] + 1])
-            else:
-                method_comment = ""
-                method_text = method_code
-            method = JMethod(method_name,
-                             class_name,
-                             param_types,
-                             return_type,
-                             method_code,
-                             method_comment,
-                             method_text,
-                             method_location)
-            return method
-        
-        def get_ancestor_class_body(class_body_node):
-            node = class_body_node.parent
-            while True:
-                if node.type in CLASS_BODY_TYPES:
-                    return node
-                node = node.parent
-                if node is None:
-                    break
-            return None
-        
-        def is_declared_class(class_body):
-            if class_body.parent.type in CLASS_DECLARATION_TYPES:
-                return True
-            return False
-        
-        def get_class_name_for_class_body(class_body):
-            if is_declared_class(class_body):  # declared class
-                classes = []
-                tmp_node = class_body.parent
-                while True:
-                    if tmp_node is None:
-                        break
-                    if tmp_node.type in CLASS_DECLARATION_TYPES:
-                        for child in tmp_node.children:
-                            if child.type == "identifier":
-                                classes.insert(0, bytes.decode(child.text))
-                    tmp_node = tmp_node.parent
-                assert len(classes) > 0, "class name not found"
-                return "$".join(classes)
-            else:  # anonymous class
-                nonlocal loc2cname, counter
-                ancestor_body = get_ancestor_class_body(class_body)
-                ancestor_cname = loc2cname[ancestor_body.byte_range]
-                counter[ancestor_cname] += 1
-                return ancestor_cname + "$" + str(counter[ancestor_cname])
-
-        def dfs(node):
-            node_childs = node.children
-            if len(node_childs) == 0:
-                return
-            for child in node_childs:
-                if child.type in METHOD_DECLARATION_TYPES:
-                    method = get_method_object(child)
-                    if method is not None:
-                        nonlocal methods
-                        methods.append(method)
-                    dfs(child)
-                elif child.type in CLASS_BODY_TYPES:
-                    class_name = get_class_name_for_class_body(child)
-                    loc = child.byte_range
-                    nonlocal loc2cname, counter
-                    counter[class_name] = 0
-                    loc2cname[loc] = class_name
-                    dfs(child)
-                else:
-                    dfs(child)
-
-        loc2cname = {}
         methods = []
-        counter = {}
-        code_list = code.split("\n")
-        tree = self.parser.parse(bytes(code, "utf8"))
-        dfs(tree.root_node)
+        counter = {}  # number of anonymous classes found so far in each class
+        # enclosing captures: (end byte, name of the innermost enclosing class body, names of the enclosing class declarations)
+        stack = [(len(source.source) + 1, None, ())]
+        for node in nodes:
+            while len(stack) > 1 and stack[-1][0] <= node.start_byte:
+                stack.pop()
+            _, class_name, declared_names = stack[-1]
+            if node.type in METHOD_DECLARATION_TYPES:
+                if only_class is None or class_name == only_class:
+                    methods.append(get_method_object(node, class_name, source))
+            elif node.type in CLASS_BODY_TYPES:
+                class_name = get_class_name_for_class_body(node, class_name, declared_names, counter)
+                counter[class_name] = 0
+            else:
+                # outer names first, as the names of one declaration are found from the last one
+                identifiers = [bytes.decode(child.text) for child in node.children if child.type == "identifier"]
+                declared_names = declared_names + tuple(reversed(identifiers))
+            stack.append((node.end_byte, class_name, declared_names))
         return methods
 
-    def get_buggy_methods(self, buggy_code: str, fixed_code: str):
-        buggy_lines = buggy_code.split("\n")
-        fixed_lines = fixed_code.split("\n")
+    def get_method_diff(self, buggy_code: str, fixed_code: str) -> "MethodDiff":
+        return diff_methods(self.get_java_methods(buggy_code), self.get_java_methods(fixed_code))
+
+    def get_buggy_methods(self, buggy_code: str, fixed_code: str, mode: str = "unified"):
+        """
+        Return the methods of the buggy file that are changed by the fix.
+        
+        args:
+            mode: "unified" diffs the whole files and returns the methods containing the
+                  first or last line of a hunk, as the ground truth has always been made;
+                  "ast" matches the methods of both versions and returns the changed and
+                  removed ones (see `diff_methods`). "ast" gives a different ground truth:
+                  a fix that only inserts or moves methods has no buggy method, and
+                  renumbered anonymous classes show up as removed methods.
+        """
+        assert mode in DIFF_MODES, f"unknown diff mode {mode}"
         methods = self.get_java_methods(buggy_code)
         assert len(methods) > 0, "no method found in buggy file"
+        if mode == "ast":
+            assert buggy_code != fixed_code, "buggy file and fixed file are the same"
+            return diff_methods(methods, self.get_java_methods(fixed_code)).get_buggy_methods()
+
+        buggy_lines = buggy_code.split("\n")
+        fixed_lines = fixed_code.split("\n")
         diff = list(unified_diff(buggy_lines, fixed_lines,
                     fromfile='text1',
                     tofile='text2',
@@ -216,4 +270,113 @@ class JavaMethodExtractor:
                 if start <= point <= end:
                     changed_buggy_methods.append(method)
                     break
-        return changed_buggy_methods
\ No newline at end of file
+        return changed_buggy_methods
+
+def get_method_key(method: JMethod) -> Tuple:
+    return (method.class_name, method.name, tuple(method.param_types))
+
+
+def body_hash(body: Union[str, bytes]) -> int:
+    """64-bit hash of the source of a method, to compare methods between versions."""
+    body = body if isinstance(body, bytes) else bytes(body, "utf8")
+    return int.from_bytes(hashlib.blake2b(body, digest_size=8).digest(), "little", signed=True)
+
+
+def get_changed_lines(buggy_method: JMethod, fixed_method: JMethod) -> List[int]:
+    """1-based lines of the buggy method that are replaced or removed by the fix, or next to an insertion."""
+    buggy_lines = buggy_method.code.split("\n")
+    fixed_lines = fixed_method.code.split("\n")
+    first_line = buggy_method.loc[0][0] + 1
+    changed_lines = set()
+    matcher = SequenceMatcher(None, buggy_lines, fixed_lines, autojunk=False)
+    for tag, i1, i2, _, _ in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if i1 == i2:  # insertion, between lines i1 - 1 and i1
+            i1, i2 = max(i1 - 1, 0), min(i1 + 1, len(buggy_lines))
+        changed_lines.update(range(first_line + i1, first_line + i2))
+    return sorted(changed_lines)
+
+
+def get_unordered(positions: List[int]) -> List[int]:
+    """Indexes of `positions` outside one of its longest increasing subsequences."""
+    tails, tail_ids, previous = [], [], [-1] * len(positions)
+    for i, position in enumerate(positions):
+        k = bisect_left(tails, position)
+        if k == len(tails):
+            tails.append(position)
+            tail_ids.append(i)
+        else:
+            tails[k] = position
+            tail_ids[k] = i
+        previous[i] = tail_ids[k - 1] if k > 0 else -1
+    ordered = set()
+    i = tail_ids[-1] if tail_ids else -1
+    while i != -1:
+        ordered.add(i)
+        i = previous[i]
+    return [i for i in range(len(positions)) if i not in ordered]
+
+
+@dataclass
+class MethodChange():
+    buggy_method: JMethod
+    fixed_method: JMethod
+    changed_lines: List[int] = field(default_factory=list)  # 1-based lines of the buggy method
+
+
+@dataclass
+class MethodDiff():
+    """Methods of a buggy and a fixed file, matched by class, name and parameter types."""
+    changed: List[MethodChange] = field(default_factory=list)
+    removed: List[JMethod] = field(default_factory=list)  # only in the buggy file
+    added: List[JMethod] = field(default_factory=list)  # only in the fixed file
+    moved: List[MethodChange] = field(default_factory=list)  # unchanged, but reordered among the other methods
+    unchanged: List[MethodChange] = field(default_factory=list)
+
+    @property
+    def buggy_methods(self) -> List[JMethod]:
+        return [change.buggy_method for change in self.changed] + self.removed
+
+    def get_buggy_methods(self, include_moved: bool = False) -> List[JMethod]:
+        """The changed and removed methods (and the moved ones if `include_moved`), in buggy source order."""
+        methods = self.buggy_methods
+        if include_moved:
+            methods = methods + [change.buggy_method for change in self.moved]
+        return sorted(methods, key=lambda method: method.loc)
+
+
+def diff_methods(buggy_methods: List[JMethod], fixed_methods: List[JMethod]) -> MethodDiff:
+    """
+    Match the methods of two versions of a file by their signature and compare the hashes of
+    their code, lines are only diffed inside the methods whose hashes differ. Overloads with
+    the same signature (e.g. in anonymous classes) are matched in source order.
+    """
+    fixed_by_key: Dict[Tuple, List[int]] = {}
+    for j, method in enumerate(fixed_methods):
+        fixed_by_key.setdefault(get_method_key(method), []).append(j)
+    for ids in fixed_by_key.values():
+        ids.reverse()
+
+    method_diff = MethodDiff()
+    matched = []  # (buggy index, fixed index) of the methods with unchanged code
+    matched_fixed = set()
+    for i, buggy_method in enumerate(buggy_methods):
+        ids = fixed_by_key.get(get_method_key(buggy_method))
+        if not ids:
+            method_diff.removed.append(buggy_method)
+            continue
+        j = ids.pop()
+        matched_fixed.add(j)
+        fixed_method = fixed_methods[j]
+        if body_hash(buggy_method.code) != body_hash(fixed_method.code):
+            method_diff.changed.append(MethodChange(buggy_method, fixed_method, get_changed_lines(buggy_method, fixed_method)))
+        else:
+            matched.append((i, j))
+    method_diff.added = [method for j, method in enumerate(fixed_methods) if j not in matched_fixed]
+
+    moved = set(get_unordered([j for _, j in matched]))
+    for k, (i, j) in enumerate(matched):
+        change = MethodChange(buggy_methods[i], fixed_methods[j])
+        (method_diff.moved if k in moved else method_diff.unchanged).append(change)
+    return method_diff
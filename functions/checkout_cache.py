@@ -0,0 +1,225 @@
+"""
+A cache of compiled Defects4J / GrowingBugs checkouts shared by the SBFL scripts and the dataset stages.
+
+An entry is the checkout of (project, bug, version "b"/"f", subproject) of one framework,
+stored under the hash of that key and compiled once. Users get their own copy of the tree
+(a reflink clone where the file system supports it), so tests and `git clean` never touch
+the cached one. Entries are evicted least recently used first when the cache grows over
+its disk budget.
+
+usage (from the SBFL scripts):
+    python checkout_cache.py checkout <D4J exec> <PID> <BID> b <dest> [--subproj SID]
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+root = Path(__file__).resolve().parents[1].as_posix()
+sys.path.append(root)
+from functions.utils import run_command
+from functions.workspace import clone_tree
+
+CHECKOUT_CACHE_DIR = os.environ.get("CHECKOUT_CACHE_DIR", os.path.join(root, "Projects", "checkout_cache"))
+CHECKOUT_CACHE_GB = float(os.environ.get("CHECKOUT_CACHE_GB", 100))
+META_FILE = "meta.json"
+TREE_DIR = "tree"
+
+
+def get_cache_key(bug_exec, project, bug_id, version: str, subproj=None) -> str:
+    """Hash of the checkout identity, the framework is part of it since trees differ between installations."""
+    framework = Path(bug_exec).resolve().parents[1].as_posix()
+    identity = json.dumps([framework, project, str(bug_id), version, subproj or ""])
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+
+def get_tree_size(path) -> int:
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
+@contextmanager
+def file_lock(lock_file, shared: bool = False, blocking: bool = True):
+    """flock on `lock_file`, yielding False if `blocking` is off and the lock is taken."""
+    with open(lock_file, "a") as f:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(f, flags if blocking else flags | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class CheckoutCache():
+
+    def __init__(self, cache_dir=CHECKOUT_CACHE_DIR, budget_gb: float = CHECKOUT_CACHE_GB):
+        self.cache_dir = cache_dir
+        self.budget = int(budget_gb * 1024 ** 3)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # guards adding and evicting entries
+        self.index_lock = os.path.join(self.cache_dir, ".lock")
+
+    def get_entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def read_meta(self, key: str) -> Optional[Dict]:
+        meta_file = os.path.join(self.get_entry_dir(key), META_FILE)
+        if not os.path.isfile(meta_file):
+            return None
+        with open(meta_file, "r") as f:
+            return json.load(f)
+
+    def touch(self, key: str):
+        """Mark an entry as used now, the mtime of its meta file is its LRU time."""
+        os.utime(os.path.join(self.get_entry_dir(key), META_FILE))
+
+    def build(self, key: str, bug_exec, project, bug_id, version: str, subproj=None) -> Dict:
+        """Check out and compile an entry next to its final place, then move it in."""
+        entry_dir = self.get_entry_dir(key)
+        tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        tree_dir = os.path.join(tmp_dir, TREE_DIR)
+        cmd = [bug_exec, "checkout", "-p", project, "-v", f"{bug_id}{version}", "-w", tree_dir]
+        if subproj:
+            cmd += ["-s", subproj]
+        result = run_command(cmd)
+        if not result.ok or not os.path.isdir(tree_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise RuntimeError(f"Checkout of {project}-{bug_id}{version} failed: {result.err}")
+        work_dir = os.path.join(tree_dir, subproj) if subproj else tree_dir
+        result = run_command([bug_exec, "compile", "-w", work_dir])
+        compiled = result.ok
+        if not compiled:
+            # keep the checkout anyway, users that need classes compile it themselves as before
+            print(f"[WARNING] Compiling {project}-{bug_id}{version} failed: {result.err}")
+        meta = {
+            "project": project,
+            "bug_id": str(bug_id),
+            "version": version,
+            "subproj": subproj or "",
+            "bug_exec": bug_exec,
+            "compiled": compiled,
+            "size": get_tree_size(tree_dir),
+            "created": time.time(),
+        }
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_dir, entry_dir)
+        return meta
+
+    def list_entries(self) -> List[str]:
+        keys = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            keys.extend(key for key in os.listdir(prefix_dir)
+                        if os.path.isfile(os.path.join(prefix_dir, key, META_FILE)))
+        return keys
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove the least recently used entries not in use until the cache fits in its budget."""
+        entries = []
+        for key in self.list_entries():
+            meta = self.read_meta(key)
+            entries.append((os.path.getmtime(os.path.join(self.get_entry_dir(key), META_FILE)), meta["size"], key))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.budget:
+                break
+            if key == keep:
+                continue
+            entry_dir = self.get_entry_dir(key)
+            with file_lock(f"{entry_dir}.lock", blocking=False) as locked:
+                if not locked:
+                    continue
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+    def get(self, bug_exec, project, bug_id, version: str, subproj=None) -> str:
+        """Return the key of the (compiled) checkout, building it if it is not cached yet."""
+        key = get_cache_key(bug_exec, project, bug_id, version, subproj)
+        entry_dir = self.get_entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        # only one process builds an entry, the others wait for it
+        with file_lock(f"{entry_dir}.lock"):
+            if self.read_meta(key) is None:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                self.build(key, bug_exec, project, bug_id, version, subproj)
+                built = True
+            else:
+                built = False
+            self.touch(key)
+        if built:
+            with file_lock(self.index_lock):
+                self.evict(keep=key)
+        return key
+
+    def check_out(self, bug_exec, project, bug_id, version: str, dest, subproj=None) -> Dict:
+        """Copy the compiled checkout to `dest` (the directory given to `defects4j checkout -w`)."""
+        while True:
+            key = self.get(bug_exec, project, bug_id, version, subproj)
+            entry_dir = self.get_entry_dir(key)
+            # a shared lock keeps the entry from being evicted while it is copied
+            with file_lock(f"{entry_dir}.lock", shared=True):
+                meta = self.read_meta(key)
+                if meta is None:
+                    # evicted between get and the lock
+                    continue
+                # never hardlinks, compiling the copy must not write into the cached tree
+                clone_tree(os.path.join(entry_dir, TREE_DIR), dest, modes=["reflink", "copy"])
+                return meta
+
+
+_checkout_cache = None
+
+
+def get_checkout_cache() -> CheckoutCache:
+    """The cache of this process, configured by $CHECKOUT_CACHE_DIR and $CHECKOUT_CACHE_GB."""
+    global _checkout_cache
+    if _checkout_cache is None:
+        _checkout_cache = CheckoutCache()
+    return _checkout_cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared cache of compiled checkouts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    checkout_parser = subparsers.add_parser("checkout")
+    checkout_parser.add_argument("bug_exec", type=str)
+    checkout_parser.add_argument("project", type=str)
+    checkout_parser.add_argument("bug_id", type=str)
+    checkout_parser.add_argument("version", type=str, choices=["b", "f"])
+    checkout_parser.add_argument("dest", type=str)
+    checkout_parser.add_argument("--subproj", type=str, default=None)
+    evict_parser = subparsers.add_parser("evict")
+    args = parser.parse_args()
+
+    cache = get_checkout_cache()
+    if args.command == "checkout":
+        subproj = None if args.subproj in [None, "", "None"] else args.subproj
+        meta = cache.check_out(args.bug_exec, args.project, args.bug_id, args.version, args.dest, subproj)
+        # the shell script compiles itself if the cached checkout does not compile
+        sys.exit(0 if meta["compiled"] else 3)
+    else:
+        with file_lock(cache.index_lock):
+            cache.evict()
@@ -13,6 +13,9 @@ from numpy import full
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from llama_index.core.storage.docstore.types import DEFAULT_PERSIST_FNAME
 
+from functions.checkout_cache import get_checkout_cache
+from functions.d4j_properties import get_properties_db
+from functions.ground_truth import put_modified_methods
 from functions.line_parser import (
     JavaClass,
     JavaMethod,
@@ -21,52 +24,139 @@ from functions.line_parser import (
     parse_test_report,
     parse_test_run_log,
 )
-from functions.MethodExtractor.java_method_extractor import JavaMethodExtractor
+from functions.method_cache import CachedJavaMethodExtractor
 from functions.my_types import JMethod, TestCase, TestClass, TestFailure
 from functions.utils import auto_read, clean_doc, git_clean, run_cmd
+from functions.workspace import make_version_tree, throwaway_tree
 from Utils.context_manager import WorkDir
 from Utils.path_manager import PathManager
 
 
-def check_out(path_manager: PathManager):
-    with WorkDir(path_manager.bug_path):
-        if not os.path.exists(path_manager.buggy_path):
-            if path_manager.subproj:
-                run_cmd(f"{path_manager.bug_exec} checkout -p {path_manager.project} -v {path_manager.bug_id}b -w buggy -s {path_manager.subproj}")
-            else:
-                run_cmd(f"{path_manager.bug_exec} checkout -p {path_manager.project} -v {path_manager.bug_id}b -w buggy")
-        if not os.path.exists(path_manager.fixed_path):
-            if path_manager.subproj:
-                run_cmd(f"{path_manager.bug_exec} checkout -p {path_manager.project} -v {path_manager.bug_id}f -w fixed -s {path_manager.subproj}")
-            else:
-                run_cmd(f"{path_manager.bug_exec} checkout -p {path_manager.project} -v {path_manager.bug_id}f -w fixed")
+COMPILED_STAMP = ".compiled"  # untracked file marking a checkout whose classes are up to date
 
 
-def run_single_test(test_case: TestCase, path_manager: PathManager):
-    test_output_dir = os.path.join(path_manager.cache_path,
-                                   test_case.test_class_name,
-                                   test_case.name)
-    os.makedirs(test_output_dir, exist_ok=True)
-    test_output_file = os.path.join(test_output_dir, "test_output.txt")
-    stack_trace_file = os.path.join(test_output_dir, "stack_trace.txt")
-    if os.path.exists(test_output_file) and os.path.exists(stack_trace_file):
+def get_checkout_dirs(path_manager: PathManager):
+    """The directories given to `defects4j checkout -w`, i.e. the buggy / fixed paths without the subproject."""
+    return os.path.join(path_manager.bug_path, "buggy"), os.path.join(path_manager.bug_path, "fixed")
+
+
+def check_out(path_manager: PathManager):
+    """
+    Copy the compiled buggy checkout from the shared checkout cache, and make the fixed one
+    from a clone of it by checking out the fixed version.
+    """
+    buggy_dir, fixed_dir = get_checkout_dirs(path_manager)
+    if not os.path.exists(path_manager.buggy_path):
+        meta = get_checkout_cache().check_out(path_manager.bug_exec,
+                                              path_manager.project,
+                                              path_manager.bug_id,
+                                              "b",
+                                              buggy_dir,
+                                              path_manager.subproj)
+        if meta["compiled"]:
+            open(os.path.join(path_manager.buggy_path, COMPILED_STAMP), "w").close()
+    if not os.path.exists(path_manager.fixed_path):
+        mode = make_version_tree(buggy_dir, fixed_dir, path_manager.project, path_manager.bug_id, "f")
+        path_manager.logger.info(f"[checkout] fixed version made from a {mode} clone of the buggy version")
+
+
+def compile_once(path_manager: PathManager):
+    """Compile the buggy checkout unless it is marked as compiled."""
+    stamp_file = os.path.join(path_manager.buggy_path, COMPILED_STAMP)
+    if os.path.exists(stamp_file):
+        return
+    run_cmd([path_manager.bug_exec, "compile", "-w", path_manager.buggy_path])
+    open(stamp_file, "w").close()
+
+
+def clean_buggy(path_manager: PathManager):
+    """Remove what tests left in the buggy checkout, keeping the compiled classes."""
+    git_clean(path_manager.buggy_path, excludes=[COMPILED_STAMP,
+                                                 path_manager.src_class_prefix,
+                                                 path_manager.test_class_prefix])
+
+
+TEST_TIMEOUT = 90  # seconds per test method
+
+
+def split_failing_tests(lines: List[str]) -> Dict[str, List[str]]:
+    """Split the `failing_tests` report of several tests into the lines of each test ("--- Class::method" first)."""
+    reports = {}
+    test_name = None
+    for line in lines:
+        if line.startswith("--- "):
+            test_name = line[4:].strip()
+            reports[test_name] = []
+        if test_name is not None:
+            reports[test_name].append(line)
+    return reports
+
+
+def run_tests(path_manager: PathManager, test_names: List[str], options: List[str] = ["-n"]) -> Dict[str, List[str]]:
+    """
+    Run tests ("Class::method") of the buggy checkout with one `defects4j test` (one JVM) per
+    test class, and return the `failing_tests` lines of every test, empty for passing tests.
+    """
+    test_classes = {}
+    for test_name in test_names:
+        test_class_name, test_method_name = test_name.split("::")
+        test_classes.setdefault(test_class_name, []).append(test_method_name)
+
+    compile_once(path_manager)
+    buggy_dir, _ = get_checkout_dirs(path_manager)
+    reports = {}
+    for test_class_name, test_method_names in test_classes.items():
+        # the methods are passed to the `methods` attribute of ant's junit task, which takes a comma separated list
+        methods = ",".join(dict.fromkeys(test_method_names))
+        with throwaway_tree(buggy_dir, path_manager.subproj, lambda _: clean_buggy(path_manager)) as test_dir:
+            run_cmd([path_manager.bug_exec, "test", *options, "-t", f"{test_class_name}::{methods}", "-w", test_dir],
+                    timeout=TEST_TIMEOUT * len(test_method_names))
+            failing_tests_file = os.path.join(test_dir, "failing_tests")
+            lines = []
+            if os.path.exists(failing_tests_file):
+                with open(failing_tests_file, "r") as f:
+                    lines = f.readlines()
+        reports.update(split_failing_tests(lines))
+    return {test_name: reports.get(test_name, []) for test_name in test_names}
+
+
+def get_test_output_files(path_manager: PathManager, test_name: str):
+    test_class_name = test_name.split("::")[0]
+    test_output_dir = os.path.join(path_manager.cache_path, test_class_name, test_name)
+    return os.path.join(test_output_dir, "test_output.txt"), os.path.join(test_output_dir, "stack_trace.txt")
+
+
+def run_failed_tests(test_names: List[str], path_manager: PathManager) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    Return the output and stack trace of every test, running the tests not cached yet in one
+    batch and caching their results in `<cache_path>/<test class>/<test>/`.
+    """
+    uncached = [name for name in test_names
+                if not all(os.path.exists(f) for f in get_test_output_files(path_manager, name))]
+    if uncached:
+        reports = run_tests(path_manager, uncached)
+        for test_name in uncached:
+            test_output, stack_trace = parse_test_report(reports[test_name]) if reports[test_name] else ([], [])
+            test_output_file, stack_trace_file = get_test_output_files(path_manager, test_name)
+            os.makedirs(os.path.dirname(test_output_file), exist_ok=True)
+            with open(test_output_file, "w") as f:
+                f.writelines(test_output)
+            with open(stack_trace_file, "w") as f:
+                f.writelines(stack_trace)
+
+    results = {}
+    for test_name in test_names:
+        test_output_file, stack_trace_file = get_test_output_files(path_manager, test_name)
         with open(test_output_file, "r") as f:
             test_output = f.readlines()
         with open(stack_trace_file, "r") as f:
             stack_trace = f.readlines()
-        return test_output, stack_trace
-    
-    git_clean(path_manager.buggy_path)
-    out, err = run_cmd(f"{path_manager.bug_exec} compile -w {path_manager.buggy_path}")
-    out, err = run_cmd(f"timeout 90 {path_manager.bug_exec} test -n -t {test_case.name} -w {path_manager.buggy_path}")
-    with open(f"{path_manager.buggy_path}/failing_tests", "r") as f:
-        test_res = f.readlines()
-    test_output, stack_trace = parse_test_report(test_res)
-    with open(test_output_file, "w") as f:
-        f.writelines(test_output)
-    with open(stack_trace_file, "w") as f:
-        f.writelines(stack_trace)
-    return test_output, stack_trace
+        results[test_name] = (test_output, stack_trace)
+    return results
+
+
+def run_single_test(test_case: TestCase, path_manager: PathManager):
+    return run_failed_tests([test_case.name], path_manager)[test_case.name]
 
 def run_test_with_instrument(test_case: TestCase, path_manager: PathManager):
     loaded_classes_file = os.path.join(path_manager.test_cache_dir, "load.log")
@@ -75,20 +165,21 @@ def run_test_with_instrument(test_case: TestCase, path_manager: PathManager):
     test_output_file = os.path.join(path_manager.test_cache_dir, "test_output.txt")
     stack_trace_file = os.path.join(path_manager.test_cache_dir, "stack_trace.txt")
     all_files = [loaded_classes_file, inst_methods_file, run_methods_file, test_output_file, stack_trace_file]
-    class_path = os.path.join(path_manager.buggy_path, path_manager.src_class_prefix)
 
     if (all(os.path.exists(f) for f in all_files)):
         path_manager.logger.info("[run all tests]     instrumentation already done, skip!")
     else:
         shutil.rmtree(path_manager.test_cache_dir, ignore_errors=True)
         os.makedirs(path_manager.test_cache_dir, exist_ok=True)
-        git_clean(path_manager.buggy_path)
-        cmd = f"{path_manager.bug_exec} test -n -w {path_manager.buggy_path} "\
-            f"-t {test_case.name} "\
-            f"-a -Djvmargs=-javaagent:{path_manager.agent_lib}=outputDir={path_manager.test_cache_dir},classesPath={class_path}"
-        run_cmd(cmd)
-        with open(f"{path_manager.buggy_path}/failing_tests", "r") as f:
-            test_res = f.readlines()
+        buggy_dir, _ = get_checkout_dirs(path_manager)
+        with throwaway_tree(buggy_dir, path_manager.subproj, lambda _: clean_buggy(path_manager)) as test_dir:
+            class_path = os.path.join(test_dir, path_manager.src_class_prefix)
+            cmd = f"{path_manager.bug_exec} test -n -w {test_dir} "\
+                f"-t {test_case.name} "\
+                f"-a -Djvmargs=-javaagent:{path_manager.agent_lib}=outputDir={path_manager.test_cache_dir},classesPath={class_path}"
+            run_cmd(cmd)
+            with open(f"{test_dir}/failing_tests", "r") as f:
+                test_res = f.readlines()
         test_output, stack_trace = parse_test_report(test_res)
         with open(test_output_file, "w") as f:
             f.writelines(test_output)
@@ -118,9 +209,9 @@ def get_test_method(path_manager: PathManager,
     if not os.path.exists(test_file):
         raise FileNotFoundError(f"Error: {test_file} not exists.")
     
-    code = auto_read(test_file)
+    code = auto_read(test_file, path_manager.project)
 
-    function_extractor = JavaMethodExtractor()
+    function_extractor = CachedJavaMethodExtractor()
     methods = function_extractor.get_java_methods(code)
     assert len(methods) > 0, f"Error: No method found in {test_file}."
     for method in methods:
@@ -149,6 +240,7 @@ def get_modified_methods(path_manager: PathManager):
     src_path = path_manager.src_prefix
     modified_classes = path_manager.modified_classes
     buggy_methods = []
+    function_extractor = CachedJavaMethodExtractor()
 
     for class_name in modified_classes:
         
@@ -171,11 +263,10 @@ def get_modified_methods(path_manager: PathManager):
         if not (os.path.exists(fixed_file) and os.path.exists(buggy_file)):
             raise FileNotFoundError(f"Warning: {fixed_file} or {buggy_file} not exists.")
         
-        buggy_code = auto_read(buggy_file)
+        buggy_code = auto_read(buggy_file, path_manager.project)
         
-        fixed_code = auto_read(fixed_file)
+        fixed_code = auto_read(fixed_file, path_manager.project)
 
-        function_extractor = JavaMethodExtractor()
         methods = function_extractor.get_buggy_methods(buggy_code, fixed_code)
         for method in methods:
             method.class_full_name = class_name
@@ -185,45 +276,23 @@ def get_modified_methods(path_manager: PathManager):
 
 def get_properties(path_manager: PathManager):
     """
-    Retrieves properties related to the project.
+    Retrieves properties related to the project, from the project-wide properties database.
     """
-    if os.path.exists(os.path.join(path_manager.bug_path, "properties.json")):
-        with open(os.path.join(path_manager.bug_path, "properties.json"), "r") as f:
+    old_properties_file = os.path.join(path_manager.bug_path, "properties.json")
+    db = get_properties_db()
+    properties = db.get(path_manager.bug_exec, path_manager.project, path_manager.bug_id, path_manager.subproj)
+    if properties is None and os.path.exists(old_properties_file):
+        # properties.json of earlier runs
+        with open(old_properties_file, "r") as f:
             properties = json.load(f)
-    else:
-        properties = {}
-        
-        # for some project such as Pool we have to compile first
-        # cmd = f"{path_manager.bug_exec} compile -w {path_manager.buggy_path}"
-        # out, err = run_cmd(cmd)
-        
-        cmd = f"{path_manager.bug_exec} export -p tests.trigger -w {path_manager.buggy_path}"
-        out, err = run_cmd(cmd)
-        properties["failed_test_names"] = out.split("\n")
-        
-        cmd = f"{path_manager.bug_exec} export -p dir.bin.classes -w {path_manager.buggy_path}"
-        out, err = run_cmd(cmd)
-        properties["src_class_prefix"] = out
-        
-        cmd = f"{path_manager.bug_exec} export -p dir.bin.tests -w {path_manager.buggy_path}"
-        out, err = run_cmd(cmd)
-        properties["test_class_prefix"] = out
-
-        cmd = f"{path_manager.bug_exec} export -p dir.src.classes -w {path_manager.buggy_path}"
-        out, err = run_cmd(cmd)
-        properties["src_prefix"] = out
+        db.put(path_manager.bug_exec, path_manager.project, path_manager.bug_id, path_manager.subproj, properties)
+    elif properties is None:
+        properties = db.load(path_manager.bug_exec,
+                             path_manager.project,
+                             path_manager.bug_id,
+                             path_manager.subproj,
+                             path_manager.buggy_path if os.path.exists(path_manager.buggy_path) else None)
 
-        cmd = f"{path_manager.bug_exec} export -p dir.src.tests -w {path_manager.buggy_path}"
-        out, err = run_cmd(cmd)
-        properties["test_prefix"] = out
-
-        cmd = f"{path_manager.bug_exec} export -p classes.modified -w {path_manager.buggy_path}"
-        out, err = run_cmd(cmd)
-        properties["modified_classes"] = out.split("\n")
-    
-        with open(os.path.join(path_manager.bug_path, "properties.json"), "w") as f:
-            json.dump(properties, f, indent=4)
-    
     path_manager.failed_test_names = properties["failed_test_names"]
     path_manager.src_class_prefix = properties["src_class_prefix"]
     path_manager.test_class_prefix = properties["test_class_prefix"]
@@ -262,6 +331,7 @@ def get_failed_tests(path_manager: PathManager) -> TestFailure:
     # get modified methods as the buggy methods for evaluation
     path_manager.logger.info("[get test failure object] get modified methods as the buggy methods for evaluation...")
     buggy_methods = get_modified_methods(path_manager)
+    put_modified_methods(path_manager, buggy_methods)
     
     path_manager.logger.info("[get test failure object] construct the TestFailure object...")
     test_failure = TestFailure(path_manager.project,
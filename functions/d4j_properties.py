@@ -0,0 +1,185 @@
+"""
+Bug properties (trigger tests, modified classes and the source / class directories) of all
+bugs, kept in one SQLite database instead of a properties.json per bug.
+
+The trigger tests and modified classes are read from the framework's projects/<PID>
+metadata, the source directories from the defects4j.build.properties of a checkout, so
+`defects4j export` only runs for the class directories.
+
+usage (pre-warm the database before a sweep):
+    python d4j_properties.py prewarm --config default --workers 8
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+root = Path(__file__).resolve().parents[1].as_posix()
+sys.path.append(root)
+from functions.checkout_cache import TREE_DIR, file_lock, get_checkout_cache
+from functions.utils import run_command
+
+PROPERTIES_DB = os.path.join(root, "Projects", "properties.db")
+PROPERTY_NAMES = {
+    # name in properties.json: name of `defects4j export -p`
+    "failed_test_names": "tests.trigger",
+    "src_class_prefix": "dir.bin.classes",
+    "test_class_prefix": "dir.bin.tests",
+    "src_prefix": "dir.src.classes",
+    "test_prefix": "dir.src.tests",
+    "modified_classes": "classes.modified",
+}
+LIST_PROPERTIES = ["failed_test_names", "modified_classes"]
+BUILD_PROPERTIES_FILE = "defects4j.build.properties"
+
+
+def get_framework_dir(bug_exec) -> str:
+    """<D4J_HOME>/framework from <D4J_HOME>/framework/bin/defects4j"""
+    return Path(bug_exec).resolve().parents[1].as_posix()
+
+
+def read_lines(file) -> Optional[List[str]]:
+    if not os.path.isfile(file):
+        return None
+    with open(file, "r", errors="replace") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def read_framework_properties(bug_exec, project, bug_id) -> Dict:
+    """Trigger tests and modified classes from `projects/<PID>` of the framework, no checkout needed."""
+    project_dir = os.path.join(get_framework_dir(bug_exec), "projects", project)
+    properties = {}
+    trigger_lines = read_lines(os.path.join(project_dir, "trigger_tests", str(bug_id)))
+    if trigger_lines is not None:
+        properties["failed_test_names"] = [line[4:].strip() for line in trigger_lines if line.startswith("--- ")]
+    modified_classes = read_lines(os.path.join(project_dir, "modified_classes", f"{bug_id}.src"))
+    if modified_classes is not None:
+        properties["modified_classes"] = modified_classes
+    return properties
+
+
+def read_build_properties(work_dir) -> Dict:
+    """Source directories from the `defects4j.build.properties` written by `defects4j checkout`."""
+    lines = read_lines(os.path.join(work_dir, BUILD_PROPERTIES_FILE)) or []
+    build = dict(line.split("=", 1) for line in lines if "=" in line and not line.startswith("#"))
+    properties = {}
+    for name in ["src_prefix", "test_prefix"]:
+        value = build.get(f"d4j.{PROPERTY_NAMES[name]}")
+        if value:
+            properties[name] = value
+    return properties
+
+
+def export_property(bug_exec, work_dir, name: str):
+    out = run_command([bug_exec, "export", "-p", PROPERTY_NAMES[name], "-w", work_dir]).out
+    return out.split("\n") if name in LIST_PROPERTIES else out
+
+
+def collect_properties(bug_exec, project, bug_id, work_dir) -> Dict:
+    """All properties of a bug, exporting with `defects4j export` only what the metadata files miss."""
+    properties = read_framework_properties(bug_exec, project, bug_id)
+    properties.update(read_build_properties(work_dir))
+    for name in PROPERTY_NAMES:
+        if name not in properties:
+            properties[name] = export_property(bug_exec, work_dir, name)
+    return properties
+
+
+class PropertiesDB():
+    """Bug properties of all projects, keyed by (framework, project, bug, subproject)."""
+
+    def __init__(self, db_file=PROPERTIES_DB):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS properties ("
+                         "framework TEXT, project TEXT, bug_id TEXT, subproj TEXT, properties TEXT, "
+                         "PRIMARY KEY (framework, project, bug_id, subproj))")
+
+    def connect(self) -> sqlite3.Connection:
+        # the workers of a sweep share the database
+        return sqlite3.connect(self.db_file, timeout=60)
+
+    def get(self, bug_exec, project, bug_id, subproj=None) -> Optional[Dict]:
+        with self.connect() as conn:
+            row = conn.execute("SELECT properties FROM properties WHERE framework=? AND project=? AND bug_id=? AND subproj=?",
+                               (get_framework_dir(bug_exec), project, str(bug_id), subproj or "")).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, bug_exec, project, bug_id, subproj, properties: Dict):
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO properties VALUES (?, ?, ?, ?, ?)",
+                         (get_framework_dir(bug_exec), project, str(bug_id), subproj or "", json.dumps(properties)))
+
+    def load(self, bug_exec, project, bug_id, subproj=None, work_dir=None) -> Dict:
+        """
+        Return the properties of a bug, collecting them from `work_dir` (its buggy checkout)
+        if they are not stored yet. Without `work_dir`, the cached checkout is used.
+        """
+        properties = self.get(bug_exec, project, bug_id, subproj)
+        if properties is not None:
+            return properties
+        if work_dir is not None:
+            properties = collect_properties(bug_exec, project, bug_id, work_dir)
+        else:
+            cache = get_checkout_cache()
+            entry_dir = cache.get_entry_dir(cache.get(bug_exec, project, bug_id, "b", subproj))
+            # keep the entry from being evicted while it is read
+            with file_lock(f"{entry_dir}.lock", shared=True):
+                tree = os.path.join(entry_dir, TREE_DIR)
+                properties = collect_properties(bug_exec, project, bug_id, os.path.join(tree, subproj) if subproj else tree)
+        self.put(bug_exec, project, bug_id, subproj, properties)
+        return properties
+
+
+_properties_db = None
+
+
+def get_properties_db() -> PropertiesDB:
+    global _properties_db
+    if _properties_db is None:
+        _properties_db = PropertiesDB()
+    return _properties_db
+
+
+def prewarm(bug_exec, all_bugs, workers: int = 4) -> int:
+    """Store the properties of every bug of `all_bugs` ({project: (bugIDs, deprecatedIDs, subproj)})."""
+    db = get_properties_db()
+    jobs = []
+    for proj, (bug_ids, deprecated_ids, subproj) in all_bugs.items():
+        subproj = "" if subproj == "None" else subproj
+        jobs.extend((proj, bug_id, subproj) for bug_id in bug_ids if bug_id not in deprecated_ids)
+
+    def load(job):
+        proj, bug_id, subproj = job
+        try:
+            db.load(bug_exec, proj, bug_id, subproj)
+            return True
+        except Exception as e:
+            print(f"[ERROR] {proj}-{bug_id}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(load, jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Project-wide database of bug properties")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prewarm_parser = subparsers.add_parser("prewarm")
+    prewarm_parser.add_argument("--config", type=str, default="default")
+    prewarm_parser.add_argument("--version", type=str, default="GrowingBugs")
+    prewarm_parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from projects import SBF
+    with open(os.path.join(root, "Config", args.config, "config.json"), "r", encoding="utf-8") as f:
+        dependencies = json.load(f)["dependencies"]
+    bug_exec = dependencies["GB_exec"] if args.version == "GrowingBugs" else dependencies["D4J_exec"]
+    print(f"{prewarm(bug_exec, SBF, args.workers)} bugs stored in {PROPERTIES_DB}")
@@ -5,20 +5,21 @@ import sys
 
 root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(root)
-from functions.d4j import check_out, get_properties
+from functions.d4j import check_out, get_properties, run_tests
+from functions.interval_index import MethodIntervalIndex
 from functions.line_parser import parse_test_report
-from functions.MethodExtractor.java_method_extractor import JavaMethodExtractor
-from functions.utils import run_cmd
+from functions.method_cache import CachedJavaMethodExtractor
 from projects import SBF
 from Utils.path_manager import PathManager
 
 ALL_BUGS = SBF
+TOP_RANKS = 50  # only the top ranks of the SBFL result are used to build the dataset
 
 
 def make_fix_dataset(path_manager: PathManager, sbfl_res):
 
     suspicious_methods = []
-    java_method_extractor = JavaMethodExtractor()
+    java_method_extractor = CachedJavaMethodExtractor()
 
     # check out the d4j project
     path_manager.logger.info("[checkout] start...")
@@ -28,8 +29,9 @@ def make_fix_dataset(path_manager: PathManager, sbfl_res):
     path_manager.logger.info("[get bug properties] start...")
     get_properties(path_manager)
 
-    # extract trigger tests
+    # extract trigger tests, all run in one batch
     trigger_tests = {}
+    test_reports = run_tests(path_manager, path_manager.failed_test_names, options=[])
     for failed_test in path_manager.failed_test_names:
         test_class_name, test_method_name = failed_test.split("::")
         test_path = test_class_name.replace(".", "/") + ".java"
@@ -46,13 +48,13 @@ def make_fix_dataset(path_manager: PathManager, sbfl_res):
         test_methods = java_method_extractor.get_java_methods(java_code)
         for test_method in test_methods:
             if test_method.name == test_method_name:
-                # run single test
-                cmd = f"{path_manager.bug_exec} test -t {failed_test} -w {path_manager.buggy_path}"
-                run_cmd(cmd)
-                test_report_file = os.path.join(path_manager.buggy_path, "failing_tests")
-                with open(test_report_file, "r") as f:
-                    text_lines = f.readlines()
-                _, error_msg_lines = parse_test_report(text_lines)
+                report_lines = test_reports.get(failed_test)
+                if report_lines:
+                    _, error_msg_lines = parse_test_report(report_lines)
+                else:
+                    # timed out, or failed outside the test method (e.g. in the class setup)
+                    path_manager.logger.warning(f"[trigger tests] no failure report of {failed_test}")
+                    error_msg_lines = []
                 clean_lines = error_msg_lines[:2]
                 test_info = {
                     "path": test_path,
@@ -66,7 +68,7 @@ def make_fix_dataset(path_manager: PathManager, sbfl_res):
         raise ValueError("No trigger test found")
 
     methods_cache = {}
-    for rank in sbfl_res[:50]:
+    for rank in sbfl_res[:TOP_RANKS]:
         for pkg_name, class_name, method_name, line_numbers in rank:
             java_file = os.path.join(
                 path_manager.buggy_path,
@@ -94,18 +96,21 @@ def make_fix_dataset(path_manager: PathManager, sbfl_res):
 
             key = f"{pkg_name}${class_name}"
             if key in methods_cache:
-                methods = methods_cache[key]
+                methods, interval_index = methods_cache[key]
             else:
                 with open(java_file, "r") as f:
                     java_code = f.read()
                 methods = java_method_extractor.get_java_methods(java_code)
-                methods_cache[key] = methods
-
-            for method in methods:
-                if (
-                    method.name == method_name
-                    and any(method.loc[0][0] + 1 <= ln <= method.loc[1][0] + 1 for ln in line_numbers)
-                ):  
+                interval_index = MethodIntervalIndex.from_methods(methods)
+                methods_cache[key] = (methods, interval_index)
+
+            # methods enclosing any of the covered lines
+            method_ids = set()
+            for ln in line_numbers:
+                method_ids.update(interval_index.enclosing(ln))
+            for method_idx in sorted(method_ids):
+                method = methods[method_idx]
+                if method.name == method_name:
                     suspicious_method = {
                         "buggy": method.code,
                         "fix": "",
@@ -127,25 +132,32 @@ def make_fix_dataset(path_manager: PathManager, sbfl_res):
 
 def sample_fix_dataset(all_bugs, top_k):
     version = "GrowingBugs"
+    dataset_files = {}
+    for proj in all_bugs:
+        bugIDs = all_bugs[proj][0]
+        deprecatedIDs = all_bugs[proj][1]
+        for bug_id in bugIDs:
+            if bug_id in deprecatedIDs:
+                continue
+
+            bug_name = f"{proj}-{bug_id}"
+            fl_res_dir = os.path.join(root, "DebugResult", "sf-evaluation", version, proj, bug_name)
+            dataset_files[bug_name] = os.path.join(fl_res_dir, "dataset_for_fix.json")
+    sample_datasets(dataset_files, top_k, os.path.join(root, "DebugResult", "sf-evaluation", version))
+
+
+def sample_datasets(dataset_files, top_k, output_dir):
+    """Write the i-th suspicious method of every bug to `dataset_rank_{i}.json`, for i in 1..top_k."""
+    datasets_for_fix = {}
+    for bug_name, dataset_file in dataset_files.items():
+        with open(dataset_file, "r") as f:
+            datasets_for_fix[bug_name] = json.load(f)
+
     for i in range(1, top_k+1):
         dataset = {}
-        for proj in all_bugs:
-            bugIDs = all_bugs[proj][0]
-            deprecatedIDs = all_bugs[proj][1]
-            subproj = all_bugs[proj][2]
-            if subproj == "None":
-                subproj = ""
-            for bug_id in bugIDs:
-                if bug_id in deprecatedIDs:
-                    continue
-
-                bug_name = f"{proj}-{bug_id}"
-                fl_res_dir = os.path.join(root, "DebugResult", "sf-evaluation", version, proj, bug_name)
-                dataset_file = os.path.join(fl_res_dir, "dataset_for_fix.json")
-                with open(dataset_file, "r") as f:
-                    dataset_for_fix = json.load(f)
-                if i <= len(dataset_for_fix):
-                    dataset[bug_name] = dataset_for_fix[i-1]
+        for bug_name, dataset_for_fix in datasets_for_fix.items():
+            if i <= len(dataset_for_fix):
+                dataset[bug_name] = dataset_for_fix[i-1]
 
-        with open(os.path.join(root, "DebugResult", "sf-evaluation", version, f"dataset_rank_{i}.json"), "w") as f:
+        with open(os.path.join(output_dir, f"dataset_rank_{i}.json"), "w") as f:
             json.dump(dataset, f, indent=2)
@@ -0,0 +1,212 @@
+"""
+Ground-truth buggy methods of all bugs, kept in one SQLite database instead of the
+GrowingBug-sf.json / GrowingBug-mf.json files that were loaded whole for every bug.
+
+A record is one (bug, buggy method): path, class, method, line range and body hash. The
+buggy and fixed bodies are kept in a separate table and only read by `get_bodies`. The
+"sf" and "mf" datasets are imported from the JSON files, the "modified" dataset is stored
+by `get_failed_tests` from the modified methods of each checkout. A JSON dataset is
+imported on its first lookup with `load`, and again when the file changes.
+
+usage (build the database ahead of a sweep):
+    python ground_truth.py build --sf Evaluation/GrowingBug-sf.json --mf Evaluation/GrowingBug-mf.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+root = Path(__file__).resolve().parents[1].as_posix()
+sys.path.append(root)
+from functions.MethodExtractor.java_method_extractor import body_hash
+from functions.my_types import JMethod
+
+GROUND_TRUTH_DB = os.environ.get("GROUND_TRUTH_DB", os.path.join(root, "Evaluation", "ground_truth.db"))
+DATASETS = ["sf", "mf", "modified"]
+
+
+@dataclass
+class GroundTruthMethod():
+    path: str  # source file, relative to the checkout
+    class_name: str  # file name without extension, as the SBFL rankings name classes
+    method_name: Optional[str]  # None if the dataset does not name it
+    start_line: int  # 1-based, inclusive
+    end_line: int
+    body_hash: int
+
+
+def get_class_name(path: str) -> str:
+    return path.split("/")[-1].split(".")[0]
+
+
+def _compress(body: Optional[str]) -> Optional[bytes]:
+    return None if body is None else zlib.compress(body.encode("utf-8"))
+
+
+def _decompress(blob: Optional[bytes]) -> Optional[str]:
+    return None if blob is None else zlib.decompress(blob).decode("utf-8")
+
+
+class GroundTruthDB():
+    """Buggy methods keyed by (dataset, bug name, index of the method in the bug)."""
+
+    def __init__(self, db_file=GROUND_TRUTH_DB):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS methods ("
+                         "dataset TEXT, bug TEXT, idx INTEGER, path TEXT, class_name TEXT, method_name TEXT, "
+                         "start_line INTEGER, end_line INTEGER, body_hash INTEGER, "
+                         "PRIMARY KEY (dataset, bug, idx))")
+            conn.execute("CREATE TABLE IF NOT EXISTS bodies ("
+                         "dataset TEXT, bug TEXT, idx INTEGER, buggy BLOB, fixed BLOB, "
+                         "PRIMARY KEY (dataset, bug, idx))")
+            conn.execute("CREATE TABLE IF NOT EXISTS sources ("
+                         "dataset TEXT PRIMARY KEY, json_file TEXT, mtime REAL)")
+
+    def connect(self) -> sqlite3.Connection:
+        # bug workers share the database
+        return sqlite3.connect(self.db_file, timeout=60)
+
+    def get(self, dataset: str, bug_name: str) -> List[GroundTruthMethod]:
+        """The buggy methods of a bug ("<project>-<bug id>"), empty if it is not stored."""
+        with self.connect() as conn:
+            rows = conn.execute("SELECT path, class_name, method_name, start_line, end_line, body_hash "
+                                "FROM methods WHERE dataset=? AND bug=? ORDER BY idx", (dataset, bug_name)).fetchall()
+        return [GroundTruthMethod(*row) for row in rows]
+
+    def get_bodies(self, dataset: str, bug_name: str, idx: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        """(buggy, fixed) source of the `idx`-th buggy method of a bug, None where unknown."""
+        with self.connect() as conn:
+            row = conn.execute("SELECT buggy, fixed FROM bodies WHERE dataset=? AND bug=? AND idx=?",
+                               (dataset, bug_name, idx)).fetchone()
+        return (None, None) if row is None else (_decompress(row[0]), _decompress(row[1]))
+
+    def get_bug_names(self, dataset: str) -> List[str]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT DISTINCT bug FROM methods WHERE dataset=?", (dataset,)).fetchall()
+        return [row[0] for row in rows]
+
+    def put(self, dataset: str, bug_name: str, methods: List[GroundTruthMethod],
+            bodies: List[Tuple[Optional[str], Optional[str]]]):
+        """Replace the buggy methods of a bug, `bodies` holds the (buggy, fixed) source of each method."""
+        with self.connect() as conn:
+            self._put(conn, dataset, bug_name, methods, bodies)
+
+    def _put(self, conn: sqlite3.Connection, dataset: str, bug_name: str, methods: List[GroundTruthMethod],
+             bodies: List[Tuple[Optional[str], Optional[str]]]):
+        conn.execute("DELETE FROM methods WHERE dataset=? AND bug=?", (dataset, bug_name))
+        conn.execute("DELETE FROM bodies WHERE dataset=? AND bug=?", (dataset, bug_name))
+        conn.executemany("INSERT INTO methods VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(dataset, bug_name, idx, m.path, m.class_name, m.method_name, m.start_line, m.end_line, m.body_hash)
+                          for idx, m in enumerate(methods)])
+        conn.executemany("INSERT INTO bodies VALUES (?, ?, ?, ?, ?)",
+                         [(dataset, bug_name, idx, _compress(buggy), _compress(fixed))
+                          for idx, (buggy, fixed) in enumerate(bodies)])
+
+    def ensure_dataset(self, dataset: str, json_file):
+        """Import `dataset` from `json_file` if it was not imported yet, or the file changed since."""
+        mtime = os.path.getmtime(json_file)
+        with self.connect() as conn:
+            row = conn.execute("SELECT json_file, mtime FROM sources WHERE dataset=?", (dataset,)).fetchone()
+        if row is not None and row[0] == os.path.abspath(json_file) and row[1] == mtime:
+            return
+        bugs = DATASET_READERS[dataset](json_file)
+        with self.connect() as conn:
+            conn.execute("DELETE FROM methods WHERE dataset=?", (dataset,))
+            conn.execute("DELETE FROM bodies WHERE dataset=?", (dataset,))
+            for bug_name, (methods, bodies) in bugs.items():
+                self._put(conn, dataset, bug_name, methods, bodies)
+            conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (dataset, os.path.abspath(json_file), mtime))
+
+    def load(self, dataset: str, bug_name: str, json_file=None) -> List[GroundTruthMethod]:
+        """The buggy methods of a bug, importing the dataset from `json_file` first if needed."""
+        if json_file is not None and os.path.exists(json_file):
+            self.ensure_dataset(dataset, json_file)
+        return self.get(dataset, bug_name)
+
+
+_ground_truth_db = None
+
+
+def get_ground_truth_db() -> GroundTruthDB:
+    global _ground_truth_db
+    if _ground_truth_db is None:
+        _ground_truth_db = GroundTruthDB()
+    return _ground_truth_db
+
+
+def read_sf(sf_file) -> Dict[str, Tuple[List[GroundTruthMethod], List[Tuple]]]:
+    """The single buggy method of each bug of GrowingBug-sf.json."""
+    with open(sf_file, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    bugs = {}
+    for bug_name, bug in dataset.items():
+        method = GroundTruthMethod(bug["loc"],
+                                   get_class_name(bug["loc"]),
+                                   bug["method_signature"]["method_name"],
+                                   int(bug["start"]),
+                                   int(bug["end"]),
+                                   body_hash(bug["buggy"]))
+        bugs[bug_name] = ([method], [(bug["buggy"], bug["fix"])])
+    return bugs
+
+
+def read_mf(mf_file) -> Dict[str, Tuple[List[GroundTruthMethod], List[Tuple]]]:
+    """The buggy methods ("functions") of each bug of GrowingBug-mf.json."""
+    with open(mf_file, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    bugs = {}
+    for bug_name, bug in dataset.items():
+        methods, bodies = [], []
+        for function in bug["functions"]:
+            methods.append(GroundTruthMethod(function["path"],
+                                             get_class_name(function["path"]),
+                                             None,
+                                             int(function["start_loc"]),
+                                             int(function["end_loc"]),
+                                             body_hash(function["buggy_function"])))
+            bodies.append((function["buggy_function"], function["fixed_function"]))
+        bugs[bug_name] = (methods, bodies)
+    return bugs
+
+
+DATASET_READERS = {"sf": read_sf, "mf": read_mf}
+
+
+def put_modified_methods(path_manager, methods: List[JMethod]):
+    """Store the modified methods of a bug (see `get_modified_methods`) as its "modified" ground truth."""
+    records, bodies = [], []
+    for method in methods:
+        path = os.path.join(path_manager.src_prefix, method.class_full_name.replace(".", "/") + ".java")
+        records.append(GroundTruthMethod(path,
+                                         get_class_name(path),
+                                         method.name,
+                                         method.loc[0][0] + 1,
+                                         method.loc[1][0] + 1,
+                                         body_hash(method.code)))
+        bodies.append((method.code, None))
+    get_ground_truth_db().put("modified", f"{path_manager.project}-{path_manager.bug_id}", records, bodies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database of the ground-truth buggy methods")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--sf", type=str, default=None, help="Path of GrowingBug-sf.json")
+    build_parser.add_argument("--mf", type=str, default=None, help="Path of GrowingBug-mf.json")
+    args = parser.parse_args()
+
+    db = get_ground_truth_db()
+    for dataset, json_file in [("sf", args.sf), ("mf", args.mf)]:
+        if json_file is None:
+            continue
+        db.ensure_dataset(dataset, json_file)
+        print(f"{len(db.get_bug_names(dataset))} {dataset} bugs stored in {db.db_file}")
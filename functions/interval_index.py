@@ -0,0 +1,116 @@
+"""
+Sorted indexes for the "is line x in [start, end]" checks between covered lines and methods.
+
+LineIndex: sorted line numbers (e.g. the covered lines of a class), answering which
+           lines fall in a method's range with two binary searches.
+MethodIntervalIndex: method ranges of a file (nested or disjoint, as in Java source),
+           answering which methods enclose a line.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class LineIndex():
+    """Sorted line numbers, each with an optional value (e.g. a score or a row id)."""
+
+    def __init__(self, lines: Sequence[int], values: Optional[Sequence] = None):
+        lines = np.asarray(lines, dtype=np.int64)
+        order = np.argsort(lines, kind="stable")
+        self.lines = lines[order]
+        self.values = None if values is None else np.asarray(values)[order]
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def span(self, start_line: int, end_line: int) -> Tuple[int, int]:
+        """Return the slice [lo, hi) of the sorted lines within [start_line, end_line]."""
+        lo = int(np.searchsorted(self.lines, start_line, side="left"))
+        hi = int(np.searchsorted(self.lines, end_line, side="right"))
+        return lo, max(lo, hi)
+
+    def any_in(self, start_line: int, end_line: int) -> bool:
+        lo, hi = self.span(start_line, end_line)
+        return hi > lo
+
+    def lines_in(self, start_line: int, end_line: int) -> np.ndarray:
+        lo, hi = self.span(start_line, end_line)
+        return self.lines[lo:hi]
+
+    def values_in(self, start_line: int, end_line: int) -> np.ndarray:
+        lo, hi = self.span(start_line, end_line)
+        return self.values[lo:hi]
+
+    @classmethod
+    def group_by(cls, keys: Sequence, lines: Sequence[int], values: Optional[Sequence] = None) -> Dict[object, "LineIndex"]:
+        """Build one index per key, e.g. per class name."""
+        groups: Dict[object, List[int]] = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+        lines = np.asarray(lines, dtype=np.int64)
+        if values is not None:
+            values = np.asarray(values)
+        return {key: cls(lines[ids], None if values is None else values[ids]) for key, ids in groups.items()}
+
+
+class MethodIntervalIndex():
+    """
+    Line ranges [start, end] of the methods of a file, which are either nested (inner and
+    anonymous classes, lambdas) or disjoint. Results are indexes into the given ranges.
+    """
+
+    def __init__(self, starts: Sequence[int], ends: Sequence[int]):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        # outer ranges first when two ranges start on the same line
+        self.order = np.lexsort((-ends, starts))
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        # the innermost range enclosing each range, -1 for top level ones
+        self.parents = np.full(len(self.starts), -1, dtype=np.int64)
+        stack = []
+        for i, end in enumerate(self.ends.tolist()):
+            while stack and self.ends[stack[-1]] < end:
+                stack.pop()
+            if stack:
+                self.parents[i] = stack[-1]
+            stack.append(i)
+
+    @classmethod
+    def from_methods(cls, methods) -> "MethodIntervalIndex":
+        """Index `JMethod`s by their 1-based line ranges."""
+        return cls([m.loc[0][0] + 1 for m in methods], [m.loc[1][0] + 1 for m in methods])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _innermost_sorted(self, lines: np.ndarray) -> np.ndarray:
+        # the range with the last start before a line encloses it, or one of its ancestors does
+        idx = np.searchsorted(self.starts, lines, side="right") - 1
+        outside = idx >= 0
+        outside[outside] = self.ends[idx[outside]] < lines[outside]
+        while outside.any():
+            idx[outside] = self.parents[idx[outside]]
+            outside &= idx >= 0
+            outside[outside] = self.ends[idx[outside]] < lines[outside]
+        return idx
+
+    def innermost(self, lines) -> np.ndarray:
+        """Return the index of the innermost range enclosing each line, or -1."""
+        lines = np.asarray(lines, dtype=np.int64)
+        if len(self.starts) == 0:
+            return np.full(lines.shape, -1, dtype=np.int64)
+        idx = self._innermost_sorted(lines)
+        return np.where(idx >= 0, self.order[np.maximum(idx, 0)], -1)
+
+    def enclosing(self, line: int) -> List[int]:
+        """Return the indexes of all ranges enclosing `line`, from the innermost outwards."""
+        if len(self.starts) == 0:
+            return []
+        idx = int(self._innermost_sorted(np.array([line], dtype=np.int64))[0])
+        res = []
+        while idx != -1:
+            res.append(int(self.order[idx]))
+            idx = int(self.parents[idx])
+        return res
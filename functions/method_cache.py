@@ -0,0 +1,129 @@
+"""
+A persistent cache of extracted Java methods, keyed by the SHA-256 of the source file.
+
+Bugs of a project share almost all of their source files, so the methods of a file version
+are extracted once for all bugs. A record keeps the name, class, parameter and return types,
+comment, location and the line ranges of the code and text of each method; the code and
+text are sliced again from the source they are requested with. The records of all files
+are kept in one SQLite database, least recently used files are evicted over its size cap.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional, Union
+
+root = Path(__file__).resolve().parents[1].as_posix()
+sys.path.append(root)
+from functions.MethodExtractor.java_method_extractor import JavaMethodExtractor, LazyJMethod, SourceLines
+from functions.my_types import JMethod
+
+METHOD_CACHE_DB = os.environ.get("METHOD_CACHE_DB", os.path.join(root, "Projects", "method_cache.db"))
+METHOD_CACHE_MB = float(os.environ.get("METHOD_CACHE_MB", 1024))
+TOUCH_INTERVAL = 3600  # seconds, the LRU time of an entry is only updated this often
+EXTRACTOR_VERSION = 1  # bump when the extraction changes, to ignore the records of older versions
+
+
+def to_record(method: LazyJMethod) -> list:
+    return [method.name, method.class_name, method.param_types, method.return_type,
+            method.comment, method.loc, method._code_rows, method._text_rows]
+
+
+def from_record(record: list, source: SourceLines) -> LazyJMethod:
+    name, class_name, param_types, return_type, comment, loc, code_rows, text_rows = record
+    loc = (tuple(loc[0]), tuple(loc[1]))
+    return LazyJMethod(name, class_name, param_types, return_type, comment, loc,
+                       source, tuple(code_rows), tuple(text_rows))
+
+
+class MethodCache():
+
+    def __init__(self, db_file=METHOD_CACHE_DB, max_mb: float = METHOD_CACHE_MB):
+        self.db_file = db_file
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS methods ("
+                         "sha256 TEXT PRIMARY KEY, version INTEGER, records BLOB, size INTEGER, last_used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS methods_last_used ON methods (last_used)")
+            # running total of the sizes, so a put does not scan the table
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM methods))")
+
+    def connect(self) -> sqlite3.Connection:
+        # bug workers share the database
+        return sqlite3.connect(self.db_file, timeout=60)
+
+    def get(self, sha256: str) -> Optional[list]:
+        with self.connect() as conn:
+            row = conn.execute("SELECT records, last_used FROM methods WHERE sha256=? AND version=?",
+                               (sha256, EXTRACTOR_VERSION)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > TOUCH_INTERVAL:
+                conn.execute("UPDATE methods SET last_used=? WHERE sha256=?", (now, sha256))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, sha256: str, records: list):
+        blob = zlib.compress(json.dumps(records).encode("utf-8"))
+        with self.connect() as conn:
+            # the size of a replaced entry and the total are read and written in one transaction
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT size FROM methods WHERE sha256=?", (sha256,)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO methods VALUES (?, ?, ?, ?, ?)",
+                         (sha256, EXTRACTOR_VERSION, blob, len(blob), time.time()))
+            self.add_size(conn, len(blob) - (row[0] if row else 0))
+            total = conn.execute("SELECT total_size FROM meta WHERE id=0").fetchone()[0]
+            if total > self.max_bytes:
+                self.evict(conn, total - int(self.max_bytes * 0.9))
+
+    def add_size(self, conn: sqlite3.Connection, n_bytes: int):
+        conn.execute("UPDATE meta SET total_size = total_size + ? WHERE id=0", (n_bytes,))
+
+    def evict(self, conn: sqlite3.Connection, n_bytes: int):
+        """Delete the least recently used entries until `n_bytes` are freed."""
+        victims = []
+        freed = 0
+        for sha256, size in conn.execute("SELECT sha256, size FROM methods ORDER BY last_used"):
+            if freed >= n_bytes:
+                break
+            victims.append((sha256,))
+            freed += size
+        conn.executemany("DELETE FROM methods WHERE sha256=?", victims)
+        self.add_size(conn, -freed)
+
+
+_method_cache = None
+
+
+def get_method_cache() -> MethodCache:
+    global _method_cache
+    if _method_cache is None:
+        _method_cache = MethodCache()
+    return _method_cache
+
+
+class CachedJavaMethodExtractor(JavaMethodExtractor):
+    """`JavaMethodExtractor` that extracts every distinct file content once, through the method cache."""
+
+    def get_java_methods(self, code: Union[str, bytes], only_class: str = None) -> List[JMethod]:
+        source_bytes = code if isinstance(code, bytes) else bytes(code, "utf8")
+        sha256 = hashlib.sha256(source_bytes).hexdigest()
+        cache = get_method_cache()
+        records = cache.get(sha256)
+        if records is None:
+            methods = super().get_java_methods(source_bytes)
+            cache.put(sha256, [to_record(method) for method in methods])
+        else:
+            source = SourceLines(source_bytes)
+            methods = [from_record(record, source) for record in records]
+        if only_class is not None:
+            methods = [method for method in methods if method.class_name == only_class]
+        return methods
@@ -0,0 +1,178 @@
+"""
+Method level SBFL computed from the line spectrum of a bug.
+
+The covered lines are mapped to the methods that `JavaMethodExtractor.get_java_methods`
+finds in the buggy source, so that a method appears exactly once in the ranking,
+whatever the order of the lines in GZoltar's output.
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.interval_index import MethodIntervalIndex
+from functions.method_cache import CachedJavaMethodExtractor
+from functions.my_types import JMethod
+from functions.sbfl import get_sbfl_file
+from functions.sbfl_formulas import compute_scores
+from functions.spectrum import SpectrumStore, load_spectrum, split_element
+from functions.utils import read_source_bytes
+from Utils.path_manager import PathManager
+
+# any: a method is covered by a test if any of its lines is, and the formula is applied to the method spectrum
+# max / mean: the formula is applied to the lines, and a method gets the max / mean score of its lines
+AGGREGATIONS = ["any", "max", "mean"]
+
+# (package, class name, method name, start line, end line), lines are 1-based
+MethodKey = Tuple[str, str, str, int, int]
+
+
+@dataclass
+class MethodRanking():
+    """Methods in ranking order, with their scores, counts and covered lines."""
+    methods: List[MethodKey]
+    scores: np.ndarray
+    ef: np.ndarray
+    ep: np.ndarray
+    lines: List[List[int]]
+
+    def __len__(self) -> int:
+        return len(self.methods)
+
+    def rank_groups(self, top_k: Optional[int] = None):
+        """Return the methods grouped by equal score, in the format of `parse_sbfl_version_2`."""
+        res = []
+        last_score = None
+        for i, (pkg_name, class_name, method_name, _, _) in enumerate(self.methods):
+            score = self.scores[i]
+            if score == 0:
+                break
+            if last_score is None or score != last_score:
+                if top_k is not None and len(res) >= top_k:
+                    break
+                res.append([])
+                last_score = score
+            res[-1].append((pkg_name, class_name, method_name, self.lines[i]))
+        return res
+
+
+class SourceMethods():
+    """Methods of the source files of a checkout, extracted once per file."""
+
+    def __init__(self, src_path: str):
+        self.src_path = src_path
+        self.extractor = CachedJavaMethodExtractor()
+        self._methods: Dict[str, List[JMethod]] = {}
+        self._interval_indexes: Dict[str, MethodIntervalIndex] = {}
+
+    def get_methods(self, pkg_name: str, class_name: str) -> List[JMethod]:
+        outer_class = class_name.split("$")[0]
+        java_file = os.path.join(self.src_path, pkg_name.replace(".", "/"), outer_class + ".java")
+        if java_file not in self._methods:
+            if os.path.exists(java_file):
+                self._methods[java_file] = self.extractor.get_java_methods(read_source_bytes(java_file, self.src_path))
+            else:
+                self._methods[java_file] = []
+        return self._methods[java_file]
+
+    def get_interval_index(self, pkg_name: str, class_name: str) -> MethodIntervalIndex:
+        """The line ranges of `get_methods`, indexed to find the method enclosing a line."""
+        key = f"{pkg_name}.{class_name.split('$')[0]}"
+        if key not in self._interval_indexes:
+            self._interval_indexes[key] = MethodIntervalIndex.from_methods(self.get_methods(pkg_name, class_name))
+        return self._interval_indexes[key]
+
+
+def map_elements_to_methods(elements: List[str],
+                            source_methods: Optional[SourceMethods] = None) -> Tuple[List[MethodKey], np.ndarray]:
+    """
+    Map each line element of a spectrum to a method. Lines outside of any extracted method
+    (e.g. field initializers) and all lines when no source is given are grouped by the
+    method signature in GZoltar's element name instead.
+    """
+    split_elements = [split_element(e) for e in elements]
+    element_groups = np.full(len(elements), -1, dtype=np.int64)
+    keys: Dict[MethodKey, int] = {}
+
+    if source_methods is not None:
+        by_class: Dict[Tuple[str, str], List[int]] = {}
+        for i, (pkg_name, class_name, _, _) in enumerate(split_elements):
+            by_class.setdefault((pkg_name, class_name.split("$")[0]), []).append(i)
+        for (pkg_name, outer_class), element_ids in by_class.items():
+            methods = source_methods.get_methods(pkg_name, outer_class)
+            lines = np.array([split_elements[i][3] for i in element_ids])
+            method_ids = source_methods.get_interval_index(pkg_name, outer_class).innermost(lines)
+            for i, method_idx in zip(element_ids, method_ids.tolist()):
+                if method_idx == -1:
+                    continue
+                method = methods[method_idx]
+                key = (pkg_name, method.class_name, method.name, method.loc[0][0] + 1, method.loc[1][0] + 1)
+                element_groups[i] = keys.setdefault(key, len(keys))
+
+    # fall back to GZoltar's method signature, spanning the covered lines of the method
+    fallback: Dict[str, List[int]] = {}
+    for i in np.flatnonzero(element_groups == -1).tolist():
+        fallback.setdefault(elements[i][:elements[i].rfind(":")], []).append(i)
+    for element_ids in fallback.values():
+        pkg_name, class_name, method_name, _ = split_elements[element_ids[0]]
+        lines = [split_elements[i][3] for i in element_ids]
+        key = (pkg_name, class_name, method_name, min(lines), max(lines))
+        element_groups[element_ids] = keys.setdefault(key, len(keys))
+    return list(keys), element_groups
+
+
+def rank_methods(store: SpectrumStore,
+                 formula: str,
+                 source_methods: Optional[SourceMethods] = None,
+                 aggregation: str = "any") -> MethodRanking:
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation policy: {aggregation}")
+    elements = store.elements
+    methods, element_groups = map_elements_to_methods(elements, source_methods)
+    method_counts = store.group_counts([str(m) for m in methods], element_groups)
+
+    if aggregation == "any":
+        scores = compute_scores(method_counts, formula)
+    else:
+        line_scores = np.nan_to_num(compute_scores(store.counts("line"), formula), nan=-np.inf)
+        order = np.argsort(element_groups, kind="stable")
+        starts = np.flatnonzero(np.diff(element_groups[order], prepend=-1))
+        if aggregation == "max":
+            scores = np.maximum.reduceat(line_scores[order], starts)
+        else:
+            scores = np.add.reduceat(line_scores[order], starts) / np.diff(np.append(starts, len(order)))
+
+    # sort by descending score, ties by method key, so that the ranking is deterministic
+    key_order = np.argsort(np.argsort(np.array([repr(m) for m in methods], dtype=object)))
+    ranked = np.lexsort((key_order, -np.nan_to_num(scores, nan=-np.inf)))
+
+    element_lines = np.array([split_element(e)[3] for e in elements], dtype=np.int64)
+    lines = [[] for _ in methods]
+    for i in np.argsort(element_lines, kind="stable").tolist():
+        lines[element_groups[i]].append(int(element_lines[i]))
+    return MethodRanking([methods[i] for i in ranked.tolist()],
+                         scores[ranked],
+                         method_counts.ef[ranked],
+                         method_counts.ep[ranked],
+                         [lines[i] for i in ranked.tolist()])
+
+
+def load_method_ranks(path_manager: PathManager,
+                      aggregation: str = "any",
+                      top_k: Optional[int] = None,
+                      use_source: bool = True):
+    """
+    Method level counterpart of `load_sbfl_ranks` for the bug of `path_manager`, computed
+    from the stored spectrum. `use_source` requires the buggy version to be checked out.
+    """
+    spectrum_dir = os.path.dirname(get_sbfl_file(path_manager, path_manager.sbfl_formula))
+    source_methods = None
+    if use_source:
+        source_methods = SourceMethods(os.path.join(path_manager.buggy_path, path_manager.src_prefix))
+    ranking = rank_methods(load_spectrum(spectrum_dir), path_manager.sbfl_formula, source_methods, aggregation)
+    return ranking.rank_groups(top_k)
@@ -0,0 +1,71 @@
+"""
+Tree-sitter parsers shared by the method extractor and the node parsers.
+
+A parser is built once per thread and language (a tree-sitter Parser must not be used by
+two threads at once), so extractors can be created freely in loops. Pass `init_worker` as
+the initializer of a process pool to build the parsers before the first task.
+"""
+
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Sequence
+
+from tree_sitter import Language, Parser, Query
+
+LANGUAGE = "java"
+
+_local = threading.local()
+
+
+def _new_parser(language: str) -> Parser:
+    try:
+        import tree_sitter_languages  # pants: no-infer-dep
+        return tree_sitter_languages.get_parser(language)
+    except ImportError:
+        raise ImportError(
+            "Please install tree_sitter_languages to use JavaClassSplitter."
+            "Or pass in a parser object."
+        )
+    except Exception:
+        print(
+            f"Could not get parser for language {language}. Check "
+            "https://github.com/grantjenks/py-tree-sitter-languages#license "
+            "for a list of valid languages."
+        )
+        raise
+
+
+def get_parser(language: str = LANGUAGE) -> Parser:
+    """The parser of `language` for the calling thread."""
+    parsers: Dict[str, Parser] = getattr(_local, "parsers", None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    if language not in parsers:
+        parsers[language] = _new_parser(language)
+    return parsers[language]
+
+
+@lru_cache(maxsize=None)
+def get_language(language: str = LANGUAGE) -> Language:
+    import tree_sitter_languages  # pants: no-infer-dep
+    return tree_sitter_languages.get_language(language)
+
+
+@lru_cache(maxsize=None)
+def get_node_query(node_types: Sequence[str], language: str = LANGUAGE) -> Query:
+    """A query capturing every node of `node_types` (as "@<type>"), skipping the types the grammar does not have."""
+    ts_language = get_language(language)
+    patterns = []
+    for node_type in node_types:
+        try:
+            ts_language.query(f"({node_type}) @{node_type}")
+        except Exception:
+            continue
+        patterns.append(f"({node_type}) @{node_type}")
+    return ts_language.query("\n".join(patterns))
+
+
+def init_worker(languages: Iterable[str] = (LANGUAGE,)):
+    """Initializer of pool workers, e.g. `ProcessPoolExecutor(initializer=init_worker)`."""
+    for language in languages:
+        get_parser(language)
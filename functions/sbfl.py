@@ -1,9 +1,11 @@
 import os
 import re
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from Utils.path_manager import PathManager
 
+SBFL_FORMULAS = ["tarantula", "ochiai", "jaccard", "ample", "ochiai2", "dstar"]
+
 
 def parse_sbfl(sbfl_file) -> Dict[str, List[int]]:
     """
@@ -37,7 +39,87 @@ def parse_sbfl(sbfl_file) -> Dict[str, List[int]]:
     return res
 
 
-def parse_sbfl_version_2(sbfl_file):
+SBFL_READ_BUFFER = 1 << 20
+
+
+def split_sbfl_line(line: str) -> Tuple[str, str, str, int, str]:
+    """
+    Split one GZoltar ranking line on its fixed delimiters.
+    e.g.:
+        com.fasterxml.aalto.in$XmlScanner#reportInputProblem(java.lang.String):1333;0.7071067811865475
+
+        ==>
+
+        ("com.fasterxml.aalto.in", "XmlScanner", "reportInputProblem", 1333, "0.7071067811865475")
+    """
+    pkg_end = line.find("$")
+    class_end = line.find("#", pkg_end + 1)
+    method_end = line.find("(", class_end + 1)
+    params_end = line.find("):", method_end + 1)
+    score_start = line.find(";", params_end + 2)
+    if min(pkg_end, class_end, method_end, params_end, score_start) == -1:
+        raise ValueError(f"Failed to parse line: {line}")
+    return (line[:pkg_end],
+            line[pkg_end + 1:class_end],
+            line[class_end + 1:method_end],
+            int(line[params_end + 2:score_start]),
+            line[score_start + 1:])
+
+
+def iter_sbfl_lines(sbfl_file, min_score: Optional[float] = None) -> Iterator[Tuple[str, str, str, int, str]]:
+    """
+    Yield the split lines of a GZoltar ranking file until the first zero score
+    (or the first score below `min_score`).
+    """
+    with open(sbfl_file, "r", buffering=SBFL_READ_BUFFER) as f:
+        f.readline() # skip the first line
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                break
+            record = split_sbfl_line(line)
+            score = record[4]
+            if score == "0.0":
+                break
+            if min_score is not None and float(score) < min_score:
+                break
+            yield record
+
+
+def iter_sbfl_ranks(sbfl_file,
+                    top_k: Optional[int] = None,
+                    min_score: Optional[float] = None) -> Iterator[List[Tuple[str, str, str, List[int]]]]:
+    """
+    Lazily yield the rank groups of `parse_sbfl_version_2`, one group per distinct score.
+    Reading stops after `top_k` groups or at the first score below `min_score`,
+    so callers that only need the head of a ranking never read the rest of the file.
+    """
+    if top_k is not None and top_k <= 0:
+        return
+    group = []
+    n_groups = 0
+    last_score = None
+    last_class = last_method = None
+    for pkg_name, class_name, method_name, line_num, score in iter_sbfl_lines(sbfl_file, min_score):
+        if score != last_score:
+            if group:
+                yield group
+                n_groups += 1
+                if top_k is not None and n_groups >= top_k:
+                    return
+            group = []
+            last_score = score
+            last_class = last_method = None
+        if class_name != last_class or method_name != last_method:
+            group.append((pkg_name, class_name, method_name, [line_num]))
+            last_class, last_method = class_name, method_name
+        else:
+            group[-1][3].append(line_num)
+    if group:
+        yield group
+
+
+def parse_sbfl_version_2(sbfl_file, top_k: Optional[int] = None, min_score: Optional[float] = None):
     """
     Parse the SBFL result from line level to method level.
     e.g.:
@@ -58,47 +140,25 @@ def parse_sbfl_version_2(sbfl_file):
                 ("com.fasterxml.aalto.in", "XmlScanner", "reportInputProblem", [1333])
             ]
         ]
+    
+    Only the first `top_k` rank groups are read if `top_k` is given.
     """
-    res = []
-    last_score = ""
-    with open(sbfl_file, "r") as f:
-        line = f.readline() # skip the first line
-        line = f.readline().strip("\n")
-        while line:
-            match = re.match(r"^(.*?)\$(.*?)\#(.*?)\((.*?)\):(\d+);(.*?)$", line)
-            if match:
-                pkg_name, class_name, method_name, _, line_num, score = match.groups()
-            else:
-                raise ValueError(f"Failed to parse line: {line}")
-            if score != last_score:
-                res.append([])
-            if score == "0.0":
-                break
+    return list(iter_sbfl_ranks(sbfl_file, top_k, min_score))
 
-            if len(res[-1]) == 0:
-                res[-1].append((pkg_name, class_name, method_name, [int(line_num)]))
-            elif res[-1][-1][1] != class_name or res[-1][-1][2] != method_name:
-                res[-1].append((pkg_name, class_name, method_name, [int(line_num)]))
-            else:
-                res[-1][-1][3].append(int(line_num))
 
-            last_score = score
-            line = f.readline().strip("\n")
-    return res
+def get_sbfl_file(path_manager: PathManager, formula: str) -> str:
+    return os.path.join(
+        path_manager.root_path,
+        "SBFL",
+        "results",
+        path_manager.project,
+        str(path_manager.bug_id),
+        f"{formula}.ranking.csv"
+    )
 
 
 def get_all_sbfl_res(path_manager: PathManager):
-    sbfl_names = ["tarantula","ochiai","jaccard","ample","ochiai2","dstar"]
-    sbfl_files = []
-    for name in sbfl_names:
-        sbfl_files.append(os.path.join(
-            path_manager.root_path,
-            "SBFL",
-            "results",
-            path_manager.project,
-            path_manager.bug_id,
-            f"{name}.ranking.csv"
-        ))
+    sbfl_files = [get_sbfl_file(path_manager, name) for name in SBFL_FORMULAS]
     
     sbfl_reses = []
     for sbfl_file in sbfl_files:
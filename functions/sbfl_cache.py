@@ -0,0 +1,212 @@
+"""
+Columnar on-disk cache for GZoltar ranking files.
+
+A `<formula>.ranking.csv` is converted once into a `<formula>.ranking.csv.cache/`
+directory holding one `.npy` file per column plus a `meta.json` with the interned
+package/class/method string tables. Later loads memory-map the columns instead
+of re-parsing the text file.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.sbfl import iter_sbfl_lines
+
+CACHE_SUFFIX = ".cache"
+CACHE_VERSION = 1
+META_FILE = "meta.json"
+ID_COLUMNS = ["pkg_ids", "class_ids", "method_ids"]
+COLUMNS = ID_COLUMNS + ["lines", "scores"]
+
+
+@dataclass
+class SBFLRanking():
+    """
+    A line level SBFL ranking stored column-wise, in the order of the ranking file.
+    The `*_ids` columns index into the interned string tables.
+    """
+    packages: List[str]
+    classes: List[str]
+    methods: List[str]
+    pkg_ids: np.ndarray
+    class_ids: np.ndarray
+    method_ids: np.ndarray
+    lines: np.ndarray
+    scores: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def group_starts(self) -> np.ndarray:
+        """Return the row index where each rank group (run of equal scores) starts."""
+        scores = self.scores
+        if len(scores) == 0:
+            return np.zeros(0, dtype=np.int64)
+        both_nan = np.isnan(scores[1:]) & np.isnan(scores[:-1])
+        changed = (scores[1:] != scores[:-1]) & ~both_nan
+        return np.concatenate(([0], np.flatnonzero(changed) + 1))
+
+    def rank_groups(self, top_k: Optional[int] = None):
+        """Return the same rank group structure as `parse_sbfl_version_2`."""
+        n_rows = len(self)
+        if n_rows == 0:
+            return []
+        group_starts = self.group_starts()
+        if top_k is not None:
+            if top_k <= 0:
+                return []
+            if top_k < len(group_starts):
+                n_rows = int(group_starts[top_k])
+                group_starts = group_starts[:top_k]
+
+        class_ids = np.asarray(self.class_ids[:n_rows])
+        method_ids = np.asarray(self.method_ids[:n_rows])
+        new_method = np.ones(n_rows, dtype=bool)
+        new_method[1:] = (class_ids[1:] != class_ids[:-1]) | (method_ids[1:] != method_ids[:-1])
+        new_method[group_starts] = True
+        entry_starts = np.flatnonzero(new_method)
+        entry_ends = np.append(entry_starts[1:], n_rows)
+        entry_groups = np.searchsorted(group_starts, entry_starts, side="right") - 1
+
+        pkg_ids = self.pkg_ids[entry_starts].tolist()
+        entry_classes = class_ids[entry_starts].tolist()
+        entry_methods = method_ids[entry_starts].tolist()
+        lines = np.asarray(self.lines[:n_rows]).tolist()
+
+        res = [[] for _ in range(len(group_starts))]
+        for i, (start, end) in enumerate(zip(entry_starts.tolist(), entry_ends.tolist())):
+            res[entry_groups[i]].append((self.packages[pkg_ids[i]],
+                                         self.classes[entry_classes[i]],
+                                         self.methods[entry_methods[i]],
+                                         lines[start:end]))
+        return res
+
+
+def get_cache_dir(sbfl_file) -> str:
+    return str(sbfl_file) + CACHE_SUFFIX
+
+
+def _file_sha256(path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _read_meta(cache_dir) -> Optional[Dict]:
+    try:
+        with open(os.path.join(cache_dir, META_FILE), "r") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(cache_dir, meta: Dict):
+    tmp_file = os.path.join(cache_dir, f"{META_FILE}.{os.getpid()}")
+    with open(tmp_file, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_file, os.path.join(cache_dir, META_FILE))
+
+
+def _is_fresh(sbfl_file, cache_dir, meta: Dict) -> bool:
+    """
+    The cache is fresh if the CSV still has the recorded mtime and size. If only the
+    mtime changed (e.g. the results were copied), the content hash decides.
+    """
+    stat = os.stat(sbfl_file)
+    if stat.st_mtime_ns == meta["mtime_ns"] and stat.st_size == meta["size"]:
+        return True
+    if stat.st_size != meta["size"] or _file_sha256(sbfl_file) != meta["sha256"]:
+        return False
+    meta["mtime_ns"] = stat.st_mtime_ns
+    _write_meta(cache_dir, meta)
+    return True
+
+
+def build_sbfl_cache(sbfl_file) -> str:
+    """Convert a ranking file into its columnar cache directory and return the directory."""
+    cache_dir = get_cache_dir(sbfl_file)
+    stat = os.stat(sbfl_file)
+    sha256 = _file_sha256(sbfl_file)
+
+    tables = {"packages": {}, "classes": {}, "methods": {}}
+    columns = {name: [] for name in COLUMNS}
+    for pkg_name, class_name, method_name, line_num, score in iter_sbfl_lines(sbfl_file):
+        for table, column, value in ((tables["packages"], "pkg_ids", pkg_name),
+                                     (tables["classes"], "class_ids", class_name),
+                                     (tables["methods"], "method_ids", method_name)):
+            columns[column].append(table.setdefault(value, len(table)))
+        columns["lines"].append(line_num)
+        columns["scores"].append(float(score))
+
+    # build in a private directory first, so that concurrent readers never see a half-written cache
+    parent_dir = os.path.dirname(os.path.abspath(cache_dir))
+    tmp_dir = tempfile.mkdtemp(prefix=".sbfl_cache_", dir=parent_dir)
+    try:
+        for name in ID_COLUMNS + ["lines"]:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(columns[name], dtype=np.int32))
+        np.save(os.path.join(tmp_dir, "scores.npy"), np.asarray(columns["scores"], dtype=np.float64))
+        meta = {
+            "version": CACHE_VERSION,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+        }
+        meta.update({name: list(table) for name, table in tables.items()})
+        _write_meta(tmp_dir, meta)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # another process has just published the same cache
+        if _read_meta(cache_dir) is None:
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return cache_dir
+
+
+def load_sbfl_ranking(sbfl_file, rebuild: bool = False) -> SBFLRanking:
+    """
+    Load a ranking file through its columnar cache, (re)building the cache
+    when it is missing or out of date.
+    """
+    cache_dir = get_cache_dir(sbfl_file)
+    meta = None if rebuild else _read_meta(cache_dir)
+    if meta is None or not _is_fresh(sbfl_file, cache_dir, meta):
+        build_sbfl_cache(sbfl_file)
+        meta = _read_meta(cache_dir)
+
+    arrays = {}
+    for name in COLUMNS:
+        column_file = os.path.join(cache_dir, f"{name}.npy")
+        # an empty array can not be memory-mapped
+        mmap_mode = "r" if len(meta["packages"]) > 0 else None
+        arrays[name] = np.load(column_file, mmap_mode=mmap_mode)
+    return SBFLRanking(meta["packages"], meta["classes"], meta["methods"], **arrays)
+
+
+def load_sbfl_ranks(sbfl_file, top_k: Optional[int] = None):
+    """Cached equivalent of `parse_sbfl_version_2`."""
+    return load_sbfl_ranking(sbfl_file).rank_groups(top_k)
+
+
+if __name__ == "__main__":
+    # pre-build the caches for all ranking files, e.g. `python functions/sbfl_cache.py SBFL/results`
+    results_dir = sys.argv[1]
+    for ranking_file in sorted(Path(results_dir).rglob("*.ranking.csv")):
+        load_sbfl_ranking(ranking_file)
+        print(f"cached {ranking_file}")
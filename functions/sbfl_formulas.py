@@ -0,0 +1,144 @@
+"""
+SBFL formulas computed with numpy from the ef/ep/nf/np counts of a spectrum,
+so that rankings can be (re)computed without running GZoltar's report step.
+
+usage:
+    python functions/sbfl_formulas.py SBFL/results/Lang/1 ochiai dstar gp13 --granularity method
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.spectrum import GRANULARITIES, SpectrumCounts, load_spectrum
+
+
+def _div(a, b):
+    """a / b, where x / 0 is +inf for x > 0 and 0 otherwise."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    a, b = np.broadcast_arrays(a, b)
+    res = np.zeros(a.shape, dtype=np.float64)
+    nonzero = b != 0
+    np.divide(a, b, out=res, where=nonzero)
+    res[~nonzero & (a > 0)] = np.inf
+    return res
+
+
+def _tarantula(ef, ep, nf, np_):
+    fail_ratio = _div(ef, ef + nf)
+    pass_ratio = _div(ep, ep + np_)
+    return _div(fail_ratio, fail_ratio + pass_ratio)
+
+
+def _wong3(ef, ep, nf, np_):
+    h = np.where(ep <= 2, ep, np.where(ep <= 10, 2 + 0.1 * (ep - 2), 2.8 + 0.001 * (ep - 10)))
+    return ef - h
+
+
+# the keys are the lower-case names GZoltar uses for the ranking files, e.g. "ochiai.ranking.csv"
+FORMULAS: Dict[str, Callable[..., np.ndarray]] = {
+    "tarantula": _tarantula,
+    "ochiai": lambda ef, ep, nf, np_: _div(ef, np.sqrt((ef + nf) * (ef + ep))),
+    "ochiai2": lambda ef, ep, nf, np_: _div(ef * np_, np.sqrt((ef + ep) * (nf + np_) * (ef + np_) * (ep + nf))),
+    "jaccard": lambda ef, ep, nf, np_: _div(ef, ef + nf + ep),
+    "ample": lambda ef, ep, nf, np_: np.abs(_div(ef, ef + nf) - _div(ep, ep + np_)),
+    "russel_rao": lambda ef, ep, nf, np_: _div(ef, ef + ep + nf + np_),
+    "hamann": lambda ef, ep, nf, np_: _div(ef + np_ - ep - nf, ef + ep + nf + np_),
+    "sorensen_dice": lambda ef, ep, nf, np_: _div(2 * ef, 2 * ef + ep + nf),
+    "dice": lambda ef, ep, nf, np_: _div(2 * ef, ef + ep + nf),
+    "kulczynski1": lambda ef, ep, nf, np_: _div(ef, nf + ep),
+    "kulczynski2": lambda ef, ep, nf, np_: 0.5 * (_div(ef, ef + nf) + _div(ef, ef + ep)),
+    "simple_matching": lambda ef, ep, nf, np_: _div(ef + np_, ef + ep + nf + np_),
+    "sokal": lambda ef, ep, nf, np_: _div(2 * (ef + np_), 2 * (ef + np_) + nf + ep),
+    "m1": lambda ef, ep, nf, np_: _div(ef + np_, nf + ep),
+    "m2": lambda ef, ep, nf, np_: _div(ef, ef + np_ + 2 * (nf + ep)),
+    "rogers_tanimoto": lambda ef, ep, nf, np_: _div(ef + np_, ef + np_ + 2 * (nf + ep)),
+    "goodman": lambda ef, ep, nf, np_: _div(2 * ef - nf - ep, 2 * ef + nf + ep),
+    "hamming": lambda ef, ep, nf, np_: (ef + np_).astype(np.float64),
+    "euclid": lambda ef, ep, nf, np_: np.sqrt(ef + np_),
+    "overlap": lambda ef, ep, nf, np_: _div(ef, np.minimum(np.minimum(ef, ep), nf)),
+    "anderberg": lambda ef, ep, nf, np_: _div(ef, ef + 2 * (nf + ep)),
+    "zoltar": lambda ef, ep, nf, np_: _div(ef, ef + nf + ep + _div(10000 * nf * ep, ef)),
+    "wong1": lambda ef, ep, nf, np_: ef.astype(np.float64),
+    "wong2": lambda ef, ep, nf, np_: (ef - ep).astype(np.float64),
+    "wong3": _wong3,
+    "er1a": lambda ef, ep, nf, np_: np.where(nf > 0, -1.0, np_),
+    "er1b": lambda ef, ep, nf, np_: ef - _div(ep, ep + np_ + 1),
+    "er5c": lambda ef, ep, nf, np_: np.where(nf > 0, 0.0, 1.0),
+    "gp02": lambda ef, ep, nf, np_: 2 * (ef + np.sqrt(np_)) + np.sqrt(ep),
+    "gp03": lambda ef, ep, nf, np_: np.sqrt(np.abs(ef ** 2 - np.sqrt(ep))),
+    "gp13": lambda ef, ep, nf, np_: ef * (1 + _div(1, 2 * ep + ef)),
+    "gp19": lambda ef, ep, nf, np_: ef * np.sqrt(np.abs(ep - ef + nf - np_)),
+    "sbi": lambda ef, ep, nf, np_: _div(ef, ef + ep),
+    "dstar": lambda ef, ep, nf, np_: _div(ef ** 2, ep + nf),
+}
+FORMULAS["dstar2"] = FORMULAS["dstar"]
+
+
+def compute_scores(counts: SpectrumCounts, formula: str) -> np.ndarray:
+    if formula not in FORMULAS:
+        raise ValueError(f"Unknown SBFL formula: {formula}")
+    ef = counts.ef.astype(np.float64)
+    ep = counts.ep.astype(np.float64)
+    nf = counts.nf.astype(np.float64)
+    np_ = counts.np_.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = FORMULAS[formula](ef, ep, nf, np_)
+    return np.asarray(scores, dtype=np.float64)
+
+
+def _format_score(score: float) -> str:
+    """Format a score the way Java's Double.toString does for the usual values."""
+    if np.isnan(score):
+        return "NaN"
+    if np.isinf(score):
+        return "Infinity" if score > 0 else "-Infinity"
+    return repr(float(score))
+
+
+def rank_elements(scores: np.ndarray) -> np.ndarray:
+    """Order by descending score; ties keep the spectrum order so that the ranking is deterministic."""
+    return np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable")
+
+
+def write_ranking(counts: SpectrumCounts, scores: np.ndarray, ranking_file):
+    """Write a ranking in the format of GZoltar's `<formula>.ranking.csv`."""
+    with open(ranking_file, "w") as f:
+        f.write("name;suspiciousness_value\n")
+        for i in rank_elements(scores).tolist():
+            f.write(f"{counts.elements[i]};{_format_score(scores[i])}\n")
+
+
+def rank_spectrum(spectrum_dir, formulas: List[str], output_dir=None, granularity: str = "line") -> List[str]:
+    """
+    Compute the rankings of `formulas` from the spectrum stored in `spectrum_dir`.
+    The counts are computed once and shared by all formulas.
+    """
+    output_dir = output_dir or spectrum_dir
+    os.makedirs(output_dir, exist_ok=True)
+    counts = load_spectrum(spectrum_dir).counts(granularity)
+    suffix = ".ranking.csv" if granularity == "line" else f".{granularity}.ranking.csv"
+    ranking_files = []
+    for formula in formulas:
+        ranking_file = os.path.join(output_dir, f"{formula}{suffix}")
+        write_ranking(counts, compute_scores(counts, formula), ranking_file)
+        ranking_files.append(ranking_file)
+    return ranking_files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute SBFL rankings from a GZoltar spectrum")
+    parser.add_argument("spectrum_dir", type=str, help="Directory with spectrum.npz or GZoltar's txt spectrum")
+    parser.add_argument("formulas", type=str, nargs="*", default=["ochiai"], help=f"Any of {list(FORMULAS)}")
+    parser.add_argument("--output_dir", type=str, default=None)
+    parser.add_argument("--granularity", type=str, default="line", choices=GRANULARITIES)
+    args = parser.parse_args()
+
+    for ranking_file in rank_spectrum(args.spectrum_dir, args.formulas, args.output_dir, args.granularity):
+        print(f"write {ranking_file}")
@@ -0,0 +1,105 @@
+"""
+One table for the rankings of several SBFL formulas of a bug.
+
+Each row is a covered line keyed by (class, method, line) and holds one score
+column per formula, so that all formulas can be queried with a single lookup.
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.interval_index import LineIndex
+from functions.sbfl import SBFL_FORMULAS, get_sbfl_file
+from functions.sbfl_cache import SBFLRanking, load_sbfl_ranking
+from Utils.path_manager import PathManager
+
+
+@dataclass
+class SBFLTable():
+    """
+    keys: (class full name, method name, line number) of each row, where the class full
+          name is in GZoltar format, e.g. "org.jfree.chart.plot.CategoryPlot$Inner"
+    scores: array of shape (len(keys), len(formulas)). A line missing from the
+            ranking of a formula has score 0.0 (zero scores are dropped from the results).
+    """
+    formulas: List[str]
+    keys: List[Tuple[str, str, int]]
+    scores: np.ndarray
+    _rows: Dict[Tuple[str, str, int], int] = field(default_factory=dict, repr=False)
+    _class_lines: Dict[str, LineIndex] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self._rows = {key: i for i, key in enumerate(self.keys)}
+        lines_by_class = {}
+        for class_name, _, line_num in self.keys:
+            outer_name = class_name.split("$")[0]
+            short_name = outer_name.split(".")[-1]
+            lines_by_class.setdefault(outer_name, set()).add(line_num)
+            lines_by_class.setdefault(short_name, set()).add(line_num)
+        self._class_lines = {name: LineIndex(sorted(lines)) for name, lines in lines_by_class.items()}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, class_name: str, method_name: str, line_num: int) -> Optional[Dict[str, float]]:
+        """Return the score of every formula for a covered line, or None if the line is not covered."""
+        row = self._rows.get((class_name, method_name, line_num))
+        if row is None:
+            return None
+        return dict(zip(self.formulas, self.scores[row].tolist()))
+
+    def covered_lines(self, class_name: str) -> np.ndarray:
+        """
+        Return the sorted covered lines of an outer class (including its inner classes).
+        `class_name` is either the full name ("a.b.C") or the short name ("C").
+        """
+        if class_name not in self._class_lines:
+            return np.zeros(0, dtype=np.int64)
+        return self._class_lines[class_name].lines
+
+    def covers(self, class_name: str, start_line: int, end_line: int) -> bool:
+        """If any formula ranks a line of `class_name` within [start_line, end_line]."""
+        return class_name in self._class_lines and self._class_lines[class_name].any_in(start_line, end_line)
+
+
+def _ranking_keys(ranking: SBFLRanking) -> List[Tuple[str, str, int]]:
+    pkg_ids = ranking.pkg_ids.tolist()
+    class_ids = ranking.class_ids.tolist()
+    method_ids = ranking.method_ids.tolist()
+    lines = ranking.lines.tolist()
+    packages, classes, methods = ranking.packages, ranking.classes, ranking.methods
+    return [(f"{packages[p]}.{classes[c]}" if packages[p] else classes[c], methods[m], ln)
+            for p, c, m, ln in zip(pkg_ids, class_ids, method_ids, lines)]
+
+
+def load_sbfl_table(path_manager: PathManager,
+                    formulas: List[str] = SBFL_FORMULAS,
+                    max_workers: Optional[int] = None) -> SBFLTable:
+    """Load the rankings of `formulas` concurrently and merge them into one table."""
+    sbfl_files = [get_sbfl_file(path_manager, name) for name in formulas]
+    max_workers = max_workers or min(len(sbfl_files), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rankings = list(executor.map(load_sbfl_ranking, sbfl_files))
+
+    rows = {}
+    all_keys = []
+    ranking_rows = []
+    for ranking in rankings:
+        keys = _ranking_keys(ranking)
+        for key in keys:
+            if key not in rows:
+                rows[key] = len(all_keys)
+                all_keys.append(key)
+        ranking_rows.append(np.fromiter((rows[key] for key in keys), dtype=np.int64, count=len(keys)))
+
+    scores = np.zeros((len(all_keys), len(formulas)), dtype=np.float64)
+    for j, (ranking, row_ids) in enumerate(zip(rankings, ranking_rows)):
+        scores[row_ids, j] = ranking.scores
+    return SBFLTable(list(formulas), all_keys, scores)
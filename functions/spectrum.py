@@ -0,0 +1,348 @@
+"""
+Read the program spectrum that GZoltar's txt formatter writes next to the rankings:
+
+    spectra.csv   one covered element per row, e.g. "org.jfree.chart.plot$CategoryPlot#draw(int):567"
+    matrix.txt    one test per row, "1 0 1 ... +" where "+" marks a passing and "-" a failing test
+    tests.csv     "name,outcome,runtime,stacktrace" per test (the stack trace may span lines)
+
+and keep it as a compact sparse matrix (`spectrum.npz`) instead of the dense matrix.txt.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+SPECTRA_FILE = "spectra.csv"
+MATRIX_FILE = "matrix.txt"
+TESTS_FILE = "tests.csv"
+SPECTRUM_FILES = [SPECTRA_FILE, MATRIX_FILE, TESTS_FILE]
+SPECTRUM_STORE = "spectrum.npz"
+GRANULARITIES = ["line", "method"]
+
+TEST_RECORD_RE = re.compile(r"^([^,\s]+),(PASS|FAIL),(-?\d+),")
+
+
+@dataclass
+class SpectrumCounts():
+    """
+    Per element counts of a spectrum:
+        ef / ep: number of failing / passing tests that cover the element
+        nf / np_: number of failing / passing tests that do not cover the element
+    """
+    elements: List[str]
+    ef: np.ndarray
+    ep: np.ndarray
+    n_failed: int
+    n_passed: int
+
+    @property
+    def nf(self) -> np.ndarray:
+        return self.n_failed - self.ef
+
+    @property
+    def np_(self) -> np.ndarray:
+        return self.n_passed - self.ep
+
+
+def read_elements(spectrum_dir) -> List[str]:
+    with open(os.path.join(spectrum_dir, SPECTRA_FILE), "r") as f:
+        f.readline() # skip the header
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def read_test_names(spectrum_dir) -> List[str]:
+    """Return the test names in matrix row order, e.g. "org.foo.BarTest#testX"."""
+    names = []
+    with open(os.path.join(spectrum_dir, TESTS_FILE), "r") as f:
+        f.readline() # skip the header
+        for line in f:
+            match = TEST_RECORD_RE.match(line)
+            if match:
+                names.append(match.group(1))
+    return names
+
+
+def read_test_runtimes(spectrum_dir) -> Dict[str, int]:
+    """Return the runtime GZoltar measured for each test."""
+    runtimes = {}
+    with open(os.path.join(spectrum_dir, TESTS_FILE), "r") as f:
+        f.readline() # skip the header
+        for line in f:
+            match = TEST_RECORD_RE.match(line)
+            if match:
+                runtimes[match.group(1)] = int(match.group(3))
+    return runtimes
+
+
+def iter_matrix_rows(spectrum_dir, n_elements: int):
+    """Yield (covered element mask, failed) for every test row of matrix.txt."""
+    one = ord("1")
+    with open(os.path.join(spectrum_dir, MATRIX_FILE), "rb") as f:
+        for line in f:
+            line = line.rstrip(b"\r\n")
+            if not line:
+                continue
+            verdict = line[-1:]
+            if verdict not in (b"+", b"-"):
+                raise ValueError(f"Unexpected verdict in {MATRIX_FILE}: {line[-20:]}")
+            row = np.frombuffer(line, dtype=np.uint8, count=2 * n_elements - 1 if n_elements else 0)[0::2] == one
+            yield row, verdict == b"-"
+
+
+def split_element(element: str) -> Tuple[str, str, str, int]:
+    """e.g. "a.b$C$D#m(int):12" -> ("a.b", "C$D", "m", 12)"""
+    pkg_end = element.find("$")
+    class_end = element.find("#", pkg_end + 1)
+    method_end = element.find("(", class_end + 1)
+    line_start = element.rfind(":")
+    return (element[:pkg_end],
+            element[pkg_end + 1:class_end],
+            element[class_end + 1:method_end],
+            int(element[line_start + 1:]))
+
+
+def method_of_element(element: str) -> str:
+    """e.g. "a.b$C#m(int):12" -> "a.b$C#m(int)" """
+    return element[:element.rfind(":")]
+
+
+def group_elements_by_method(elements: List[str]) -> Tuple[List[str], np.ndarray]:
+    """Return the method names (in first-seen order) and the method id of each element."""
+    method_ids = {}
+    inverse = np.fromiter((method_ids.setdefault(method_of_element(e), len(method_ids)) for e in elements),
+                          dtype=np.int64, count=len(elements))
+    return list(method_ids), inverse
+
+
+def read_spectrum_counts(spectrum_dir, granularity: str = "line") -> SpectrumCounts:
+    """
+    Count ef/ep for every line (or method) by streaming over the coverage matrix.
+    A method is covered by a test if any of its lines is.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    elements = read_elements(spectrum_dir)
+    if granularity == "method":
+        names, method_inverse = group_elements_by_method(elements)
+    else:
+        names, method_inverse = elements, None
+
+    ef = np.zeros(len(names), dtype=np.int64)
+    ep = np.zeros(len(names), dtype=np.int64)
+    n_failed = n_passed = 0
+    for row, failed in iter_matrix_rows(spectrum_dir, len(elements)):
+        if method_inverse is not None:
+            row = np.bincount(method_inverse[row], minlength=len(names)) > 0
+        if failed:
+            ef += row
+            n_failed += 1
+        else:
+            ep += row
+            n_passed += 1
+    return SpectrumCounts(names, ef, ep, n_failed, n_passed)
+
+
+def _pack_names(names: List[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(names).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_names(packed: np.ndarray) -> List[str]:
+    if len(packed) == 0:
+        return []
+    return packed.tobytes().decode("utf-8").split("\n")
+
+
+class SpectrumStore():
+    """
+    A test x element coverage matrix in CSR layout: the elements covered by test `i`
+    are `indices[indptr[i]:indptr[i + 1]]`. Test verdicts are a packed bitvector.
+
+    The arrays of a stored spectrum are only read from the `.npz` file when first used.
+    """
+
+    def __init__(self, elements: List[str], test_names: List[str],
+                 indptr: np.ndarray, indices: np.ndarray, failed: np.ndarray):
+        self.elements = elements
+        self.test_names = test_names
+        self.indptr = indptr
+        self.indices = indices
+        self.failed = failed
+
+    @property
+    def n_tests(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def n_elements(self) -> int:
+        return len(self.elements)
+
+    @property
+    def entry_tests(self) -> np.ndarray:
+        """The test (row) id of every entry of `indices`."""
+        return np.repeat(np.arange(self.n_tests), np.diff(self.indptr))
+
+    def covered_elements(self, test_id: int) -> np.ndarray:
+        return self.indices[self.indptr[test_id]:self.indptr[test_id + 1]]
+
+    def to_dense(self) -> np.ndarray:
+        matrix = np.zeros((self.n_tests, self.n_elements), dtype=bool)
+        matrix[self.entry_tests, self.indices] = True
+        return matrix
+
+    def select_tests(self, test_ids) -> "SpectrumStore":
+        """Return the spectrum of a subset of the tests, e.g. for test selection experiments."""
+        test_ids = np.asarray(test_ids, dtype=np.int64)
+        starts = self.indptr[test_ids]
+        lengths = self.indptr[test_ids + 1] - starts
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        offsets = np.repeat(starts - indptr[:-1], lengths)
+        indices = self.indices[np.arange(indptr[-1]) + offsets]
+        test_names = [self.test_names[i] for i in test_ids.tolist()] if self.test_names else []
+        return SpectrumStore(self.elements, test_names, indptr, indices, self.failed[test_ids])
+
+    def select_elements(self, element_ids) -> "SpectrumStore":
+        """Return the spectrum restricted to some elements (in the given order)."""
+        element_ids = np.asarray(element_ids, dtype=np.int64)
+        remap = np.full(self.n_elements, -1, dtype=np.int64)
+        remap[element_ids] = np.arange(len(element_ids))
+        new_ids = remap[self.indices]
+        keep = new_ids >= 0
+        row_lengths = np.bincount(self.entry_tests[keep], minlength=self.n_tests)
+        indptr = np.concatenate(([0], np.cumsum(row_lengths)))
+        elements = [self.elements[i] for i in element_ids.tolist()]
+        return SpectrumStore(elements, self.test_names, indptr, new_ids[keep].astype(np.int32), self.failed)
+
+    def select_class(self, class_name: str) -> "SpectrumStore":
+        """
+        Slice the elements of a class (and its inner classes), where `class_name`
+        is in GZoltar format, e.g. "org.jfree.chart.plot$CategoryPlot".
+        """
+        prefixes = (class_name + "#", class_name + "$")
+        return self.select_elements([i for i, e in enumerate(self.elements) if e.startswith(prefixes)])
+
+    def select_method(self, method_name: str) -> "SpectrumStore":
+        """Slice the lines of a method, e.g. "org.jfree.chart.plot$CategoryPlot#draw(int)"."""
+        return self.select_elements([i for i, e in enumerate(self.elements) if method_of_element(e) == method_name])
+
+    def counts(self, granularity: str = "line") -> SpectrumCounts:
+        """Count ef/ep per line, or per method where a method is covered if any of its lines is."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        if granularity == "method":
+            return self.group_counts(*group_elements_by_method(self.elements))
+        entry_failed = self.failed[self.entry_tests]
+        ef = np.bincount(self.indices[entry_failed], minlength=self.n_elements)
+        ep = np.bincount(self.indices[~entry_failed], minlength=self.n_elements)
+        n_failed = int(self.failed.sum())
+        return SpectrumCounts(self.elements, ef, ep, n_failed, self.n_tests - n_failed)
+
+    def group_counts(self, names: List[str], element_groups: np.ndarray) -> SpectrumCounts:
+        """
+        Count ef/ep per group of elements (e.g. per method), where `element_groups[i]` is
+        the index in `names` of the group of element `i`. A test covers a group once,
+        however many of its elements it covers.
+        """
+        n_groups = max(len(names), 1)
+        pairs = np.unique(self.entry_tests * n_groups + element_groups[self.indices])
+        group_ids = pairs % n_groups
+        pair_failed = self.failed[pairs // n_groups]
+        ef = np.bincount(group_ids[pair_failed], minlength=len(names))
+        ep = np.bincount(group_ids[~pair_failed], minlength=len(names))
+        n_failed = int(self.failed.sum())
+        return SpectrumCounts(names, ef, ep, n_failed, self.n_tests - n_failed)
+
+    def save(self, store_file):
+        np.savez_compressed(store_file,
+                            elements=_pack_names(self.elements),
+                            test_names=_pack_names(self.test_names),
+                            indptr=self.indptr,
+                            indices=self.indices,
+                            failed=np.packbits(self.failed),
+                            n_tests=np.array(self.n_tests))
+
+    @classmethod
+    def merge(cls, stores: List["SpectrumStore"]) -> "SpectrumStore":
+        """
+        Stack the tests of spectra of disjoint test sets (e.g. the shards of a test run)
+        over the union of their elements, in the order the elements are first seen.
+        """
+        element_ids: Dict[str, int] = {}
+        indptrs, indices, failed = [np.zeros(1, dtype=np.int64)], [], []
+        offset = 0
+        for store in stores:
+            remap = np.array([element_ids.setdefault(e, len(element_ids)) for e in store.elements], dtype=np.int32)
+            indices.append(remap[store.indices] if len(store.indices) else np.zeros(0, dtype=np.int32))
+            indptrs.append(store.indptr[1:] + offset)
+            offset += int(store.indptr[-1])
+            failed.append(store.failed)
+        # test names are only kept if every spectrum has them
+        test_names = []
+        if all(len(store.test_names) == store.n_tests for store in stores):
+            test_names = [name for store in stores for name in store.test_names]
+        return cls(list(element_ids),
+                   test_names,
+                   np.concatenate(indptrs).astype(np.int64),
+                   np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+                   np.concatenate(failed) if failed else np.zeros(0, dtype=bool))
+
+    @classmethod
+    def load(cls, store_file) -> "SpectrumStore":
+        return LazySpectrumStore(store_file)
+
+    @classmethod
+    def from_gzoltar(cls, spectrum_dir) -> "SpectrumStore":
+        """Build the store by streaming over GZoltar's txt spectrum."""
+        elements = read_elements(spectrum_dir)
+        rows = []
+        failed = []
+        for row, row_failed in iter_matrix_rows(spectrum_dir, len(elements)):
+            rows.append(np.flatnonzero(row).astype(np.int32))
+            failed.append(row_failed)
+        indptr = np.concatenate(([0], np.cumsum([len(row) for row in rows], dtype=np.int64)))
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        test_names = read_test_names(spectrum_dir) if os.path.exists(os.path.join(spectrum_dir, TESTS_FILE)) else []
+        return cls(elements, test_names, indptr, indices, np.array(failed, dtype=bool))
+
+
+class LazySpectrumStore(SpectrumStore):
+    """A `SpectrumStore` backed by an `.npz` file, whose arrays are read on first access."""
+
+    def __init__(self, store_file):
+        self._npz = np.load(store_file)
+        self._cache = {}
+
+    def _get(self, name):
+        if name not in self._cache:
+            value = self._npz[name]
+            if name in ("elements", "test_names"):
+                value = _unpack_names(value)
+            elif name == "failed":
+                value = np.unpackbits(value, count=int(self._npz["n_tests"])).astype(bool)
+            self._cache[name] = value
+        return self._cache[name]
+
+    elements = property(lambda self: self._get("elements"))
+    test_names = property(lambda self: self._get("test_names"))
+    indptr = property(lambda self: self._get("indptr"))
+    indices = property(lambda self: self._get("indices"))
+    failed = property(lambda self: self._get("failed"))
+
+
+def get_store_file(spectrum_dir) -> str:
+    return os.path.join(spectrum_dir, SPECTRUM_STORE)
+
+
+def load_spectrum(spectrum_dir) -> SpectrumStore:
+    """
+    Load the coverage matrix of a bug from its `spectrum.npz`, converting
+    GZoltar's txt spectrum first if the store is missing or older.
+    """
+    store_file = get_store_file(spectrum_dir)
+    matrix_file = os.path.join(spectrum_dir, MATRIX_FILE)
+    if os.path.exists(matrix_file):
+        if not os.path.exists(store_file) or os.path.getmtime(store_file) < os.path.getmtime(matrix_file):
+            SpectrumStore.from_gzoltar(spectrum_dir).save(store_file)
+    return SpectrumStore.load(store_file)
@@ -1,27 +1,171 @@
+import asyncio
+import codecs
 import os
 import re
-import subprocess as sp
+import shlex
+import signal
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Union
 
 import chardet
 
+TAIL_LINES = 1000  # lines of stdout / stderr kept in memory per command
+LOG_MAX_BYTES = 64 * 1024 * 1024
+LOG_BACKUPS = 2
+READ_SIZE = 64 * 1024
 
-def run_cmd(cmd: str):
+
+@dataclass
+class CmdResult():
+    args: List[str]
+    returncode: Optional[int]
+    out_tail: List[str] = field(default_factory=list)
+    err_tail: List[str] = field(default_factory=list)
+    timed_out: bool = False
+    elapsed: float = 0.0
+    log_file: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def out(self) -> str:
+        return "".join(self.out_tail)
+
+    @property
+    def err(self) -> str:
+        return "".join(self.err_tail)
+
+
+class RotatingLog():
+    """Append-only log file, moved to `<file>.1` ... `<file>.<backups>` when it grows over `max_bytes`."""
+
+    def __init__(self, log_file, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS):
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        self.f = open(log_file, "ab")
+
+    def write(self, data: bytes):
+        if self.f.tell() + len(data) > self.max_bytes and self.f.tell() > 0:
+            self.rotate()
+        self.f.write(data)
+
+    def rotate(self):
+        self.f.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.log_file}.{i}"):
+                os.replace(f"{self.log_file}.{i}", f"{self.log_file}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        self.f = open(self.log_file, "wb")
+
+    def close(self):
+        self.f.close()
+
+
+async def _pump(stream: asyncio.StreamReader, tail: Deque[str], log: Optional[RotatingLog], prefix: bytes):
+    """Copy a pipe to the log and keep its last lines, without holding the whole output."""
+    partial = b""
+    while True:
+        chunk = await stream.read(READ_SIZE)
+        if not chunk:
+            break
+        if log is not None:
+            log.write(prefix + chunk if prefix else chunk)
+        lines = (partial + chunk).split(b"\n")
+        partial = lines.pop()
+        # a single huge line is cut, only the tail matters
+        partial = partial[-READ_SIZE:]
+        tail.extend(line.decode("utf-8", errors="replace") + "\n" for line in lines[-tail.maxlen:])
+    if partial:
+        tail.append(partial.decode("utf-8", errors="replace"))
+
+
+def _kill_group(p: asyncio.subprocess.Process):
+    try:
+        os.killpg(p.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_command_async(cmd: Union[str, List[str]],
+                            cwd=None,
+                            timeout: Optional[float] = None,
+                            log_file=None,
+                            env: Optional[Dict[str, str]] = None,
+                            tail_lines: int = TAIL_LINES) -> CmdResult:
+    """
+    Run a command (an argument list, or a string split like a shell would) in `cwd` without
+    changing the working directory of the process. stdout and stderr are streamed to the
+    rotating `log_file` (stderr lines prefixed with "[stderr] "), and only their last
+    `tail_lines` lines are kept. The whole process group is killed after `timeout` seconds.
+    """
+    args = shlex.split(cmd) if isinstance(cmd, str) else [str(arg) for arg in cmd]
+    start_time = time.time()
+    log = RotatingLog(log_file) if log_file else None
+    result = CmdResult(args, None, log_file=log_file)
+    out_tail, err_tail = deque(maxlen=tail_lines), deque(maxlen=tail_lines)
+    p = None
+    try:
+        p = await asyncio.create_subprocess_exec(*args,
+                                                 cwd=cwd,
+                                                 env=None if env is None else dict(os.environ, **env),
+                                                 stdin=asyncio.subprocess.DEVNULL,
+                                                 stdout=asyncio.subprocess.PIPE,
+                                                 stderr=asyncio.subprocess.PIPE,
+                                                 start_new_session=True)
+        pumps = asyncio.gather(_pump(p.stdout, out_tail, log, b""), _pump(p.stderr, err_tail, log, b"[stderr] "))
+        # retrieve the error of pumps cancelled with the command, so asyncio does not report it
+        pumps.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            await asyncio.wait_for(asyncio.shield(pumps), timeout)
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            _kill_group(p)
+            await pumps
+        result.returncode = await p.wait()
+    finally:
+        # also when cancelled or interrupted (e.g. by a bug timeout), so no child outlives its session
+        if p is not None and p.returncode is None:
+            _kill_group(p)
+            # reap it while the event loop still runs
+            await p.wait()
+        if log is not None:
+            log.close()
+    result.out_tail, result.err_tail = list(out_tail), list(err_tail)
+    result.elapsed = round(time.time() - start_time, 3)
+    return result
+
+
+def run_command(cmd: Union[str, List[str]], **kwargs) -> CmdResult:
+    """`run_command_async` from synchronous code, each calling thread gets its own event loop."""
+    return asyncio.run(run_command_async(cmd, **kwargs))
+
+
+def run_cmd(cmd: Union[str, List[str]], cwd=None, timeout: Optional[float] = None, log_file=None):
+    """Run a command and return the (tails of its) stdout and stderr."""
+    result = run_command(cmd, cwd=cwd, timeout=timeout, log_file=log_file)
     print("-" * 50)
-    print(f"run command: {cmd}")
-    p = sp.Popen(cmd.split(" "), stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.PIPE)
-    output, err = p.communicate()
-    out = output.decode("utf-8")
-    err = err.decode("utf-8")
-    print(err)
-    print(out)
+    print(f"run command: {' '.join(result.args)}" + (f" (in {cwd})" if cwd else ""))
+    print(result.err)
+    print(result.out)
+    if not result.ok:
+        print(f"[exit code {result.returncode}{', timed out' if result.timed_out else ''}]")
     print("-" * 50)
-    return out, err
+    return result.out, result.err
 
-def git_clean(git_dir):
-    cwd = os.getcwd()
-    os.chdir(git_dir)
-    run_cmd("git clean -df")
-    os.chdir(cwd)
+def git_clean(git_dir, excludes=None):
+    """`git clean -df`, keeping the untracked paths matching `excludes` (e.g. compiled classes)."""
+    cmd = ["git", "clean", "-df"]
+    for exclude in excludes or []:
+        if exclude:
+            cmd += ["-e", exclude]
+    run_cmd(cmd, cwd=git_dir)
 
 def clean_doc(doc: str) -> str:
     """
@@ -37,9 +181,52 @@ def clean_doc(doc: str) -> str:
                 new_doc_lines.append(line)
     return " ".join(new_doc_lines)
 
-def auto_read(file):
+DETECT_PREFIX = 64 * 1024  # bytes given to chardet
+_project_encodings: Dict[object, str] = {}  # the last non UTF-8 encoding found in each project
+
+
+def detect_encoding(content: bytes, project=None) -> str:
+    """
+    Encoding of a file's content: UTF-8 if it decodes strictly (almost every Java source),
+    else the last encoding found in the same project if it decodes, else chardet's guess on a
+    prefix of the content.
+    """
+    if content.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        content.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    # tried in order, chardet only runs if the cheaper guesses fail
+    candidates = [lambda: _project_encodings.get(project),
+                  lambda: chardet.detect(content[:DETECT_PREFIX])["encoding"],
+                  lambda: chardet.detect(content)["encoding"]]
+    for candidate in candidates:
+        encoding = candidate()
+        if encoding is None:
+            continue
+        try:
+            content.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            continue
+        _project_encodings[project] = encoding
+        return encoding
+    return "latin-1"
+
+
+def auto_read(file, project=None) -> str:
+    """Read a text file of unknown encoding, `project` (e.g. the checkout dir) shares encodings between files."""
+    with open(file, 'rb') as f:
+        content = f.read()
+    return content.decode(detect_encoding(content, project))
+
+
+def read_source_bytes(file, project=None) -> bytes:
+    """Read a source file as UTF-8 bytes for tree-sitter, without decoding it if it is UTF-8 already."""
     with open(file, 'rb') as f:
         content = f.read()
-    detected_encoding = chardet.detect(content)['encoding']
-    text = content.decode(detected_encoding)
-    return text
+    encoding = detect_encoding(content, project)
+    if encoding == "utf-8":
+        return content
+    return content.decode(encoding).encode("utf-8")
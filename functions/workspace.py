@@ -0,0 +1,119 @@
+"""
+Cheap copies of checkouts.
+
+The buggy and fixed versions of a bug differ in a few files, so the fixed tree is made from
+the buggy one: clone the tree (reflink, else hardlinks, else `git worktree`) and check out
+the D4J_<PID>_<BID>_FIXED_VERSION tag in the clone. Tests that write into the tree run in a
+throwaway reflink clone when the file system supports it.
+"""
+
+import os
+import re
+import shutil
+import subprocess as sp
+import tempfile
+from contextlib import contextmanager
+from typing import List, Optional
+
+CLONE_MODES = ["reflink", "hardlink", "worktree", "copy"]
+D4J_CONFIG_FILE = ".defects4j.config"
+D4J_BUILD_FILE = "defects4j.build.properties"
+
+_reflink_support = {}
+
+
+def _cp(args: List[str]) -> bool:
+    return sp.run(["cp"] + args, stdout=sp.DEVNULL, stderr=sp.DEVNULL).returncode == 0
+
+
+def supports_reflink(path) -> bool:
+    """If the file system of `path` can clone files copy-on-write, checked once per directory."""
+    path = os.path.abspath(path)
+    if path not in _reflink_support:
+        with tempfile.TemporaryDirectory(dir=path) as tmp_dir:
+            src = os.path.join(tmp_dir, "src")
+            open(src, "w").close()
+            _reflink_support[path] = _cp(["--reflink=always", src, os.path.join(tmp_dir, "dst")])
+    return _reflink_support[path]
+
+
+def clone_tree(src, dst, modes: List[str] = CLONE_MODES) -> str:
+    """
+    Copy the tree `src` to `dst` with the first of `modes` that works, and return that mode.
+    Hardlinked files are shared with `src`, so they may only be replaced (as git does), not
+    written in place; use it for trees that are read only. A worktree has the tracked files
+    of `src` only.
+    """
+    shutil.rmtree(dst, ignore_errors=True)
+    parent = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(parent, exist_ok=True)
+    for mode in modes:
+        if mode == "reflink":
+            if supports_reflink(parent) and _cp(["-a", "--reflink=always", src, dst]):
+                return mode
+        elif mode == "hardlink":
+            if _cp(["-al", src, dst]):
+                return mode
+        elif mode == "worktree":
+            p = sp.run(["git", "-C", src, "worktree", "add", "--detach", "-f", os.path.abspath(dst), "HEAD"],
+                       stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+            if p.returncode == 0:
+                for name in [D4J_CONFIG_FILE, D4J_BUILD_FILE]:
+                    if os.path.exists(os.path.join(src, name)) and not os.path.exists(os.path.join(dst, name)):
+                        shutil.copy2(os.path.join(src, name), os.path.join(dst, name))
+                return mode
+        elif mode == "copy":
+            shutil.copytree(src, dst, symlinks=True)
+            return mode
+        # a failed attempt may leave a partial tree behind
+        shutil.rmtree(dst, ignore_errors=True)
+    raise RuntimeError(f"Cannot clone {src} to {dst}")
+
+
+def get_version_tag(project, bug_id, version: str) -> str:
+    return f"D4J_{project}_{bug_id}_{'BUGGY' if version == 'b' else 'FIXED'}_VERSION"
+
+
+def switch_version(tree, project, bug_id, version: str):
+    """Check out the other version of a bug in a cloned checkout, and update its `.defects4j.config`."""
+    tag = get_version_tag(project, bug_id, version)
+    p = sp.run(["git", "-C", tree, "checkout", "-f", "-q", tag], stdout=sp.PIPE, stderr=sp.PIPE)
+    if p.returncode != 0:
+        raise RuntimeError(f"Cannot check out {tag} in {tree}: {p.stderr.decode('utf-8', errors='replace')}")
+    config_file = os.path.join(tree, D4J_CONFIG_FILE)
+    if os.path.exists(config_file):
+        with open(config_file, "r") as f:
+            config = f.read()
+        # replace the file, it may be hardlinked to the other version
+        with open(f"{config_file}.tmp", "w") as f:
+            f.write(re.sub(r"^vid=.*$", f"vid={bug_id}{version}", config, flags=re.M))
+        os.replace(f"{config_file}.tmp", config_file)
+
+
+def make_version_tree(src, dst, project, bug_id, version: str) -> str:
+    """Make the checkout of `version` at `dst` from the checkout of the other version at `src`."""
+    mode = clone_tree(src, dst)
+    switch_version(dst, project, bug_id, version)
+    return mode
+
+
+@contextmanager
+def throwaway_tree(tree, sub_dir: Optional[str] = None, clean=None):
+    """
+    Yield a directory to run tests of `tree` (its `sub_dir`) in, which is removed afterwards.
+    It is a reflink clone of `tree` if the file system supports it; otherwise `tree` itself
+    is used, after `clean(tree)` removed what earlier runs left behind.
+    """
+    parent = os.path.dirname(os.path.abspath(tree))
+    if not supports_reflink(parent):
+        if clean is not None:
+            clean(tree)
+        yield os.path.join(tree, sub_dir) if sub_dir else tree
+        return
+    tmp_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(tree)}-", dir=parent)
+    scratch = os.path.join(tmp_dir, os.path.basename(tree))
+    try:
+        clone_tree(tree, scratch, modes=["reflink"])
+        yield os.path.join(scratch, sub_dir) if sub_dir else scratch
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
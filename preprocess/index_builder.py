@@ -11,9 +11,10 @@ from llama_index.core.storage.docstore import SimpleDocumentStore
 from llama_index.core.storage.docstore.types import DEFAULT_PERSIST_FNAME
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
-from functions.sbfl import get_all_sbfl_res
+from functions.sbfl_table import SBFLTable, load_sbfl_table
 from preprocess.code_extractors import CodeSummaryExtractor
 from preprocess.node_parser import JavaNodeParser
+from preprocess.project_indexer import get_covered_files, list_java_files
 from Utils.path_manager import PathManager
 
 DEFAULT_VECTOR_STORE_NAME = "chroma"
@@ -39,15 +40,26 @@ class ProjectIndexBuilder():
                         class_names.add(line.strip().split(".")[-1])
         return class_names
     
-    def _load_documents(self):
-        # load java files as documents
+    def _load_documents(self, sbfl_table=None):
+        # load java files as documents, only the files with covered methods if `sbfl_table` is given
         self.path_manager.logger.info(f"[loading] Loading java files from {self.src_path}")
-        reader = SimpleDirectoryReader(
-            input_dir=self.src_path,
-            recursive=True,
-            required_exts=[".java"],
-            encoding="utf-8"
-        )
+        if sbfl_table is None:
+            reader = SimpleDirectoryReader(
+                input_dir=self.src_path,
+                recursive=True,
+                required_exts=[".java"],
+                encoding="utf-8"
+            )
+        else:
+            covered_classes = {os.path.basename(java_file).split(".")[0] for java_file in list_java_files(self.src_path)}
+            covered_classes = {name for name in covered_classes if len(sbfl_table.covered_lines(name)) > 0}
+            covered_files = get_covered_files(self.src_path, sbfl_table.covers, covered_classes, self.path_manager.index_workers)
+            if not covered_files:
+                return []
+            reader = SimpleDirectoryReader(
+                input_files=covered_files,
+                encoding="utf-8"
+            )
         documents = reader.load_data(show_progress=True)
         for doc in documents:
             doc.text = doc.text.replace("\r", "")
@@ -78,26 +90,15 @@ class ProjectIndexBuilder():
         nodes = extractor.process_nodes(nodes, show_progress=True)
         return nodes
     
-    def _any_covered(self, node, sbfl_reses):
-        for res in sbfl_reses:
-            if self._is_covered(node, res):
-                return True
-        return False
-    
-    def _is_covered(self, node, sbfl_res: Dict[str, List[int]]):
+    def _any_covered(self, node, sbfl_table: SBFLTable):
         file_path = node.metadata["file_path"]
         start_line = node.metadata["start_line"]
         end_line = node.metadata["end_line"]
         file_name = file_path.split("/")[-1]
         class_name = file_name.split(".")[0]
-        
-        if class_name in sbfl_res:
-            for line_num in sbfl_res[class_name]:
-                if start_line <= line_num <= end_line:
-                    return True
-        return False
+        return sbfl_table.covers(class_name, start_line, end_line)
     
-    def _filter_nodes(self, nodes, sbfl_res_list, all_methods):
+    def _filter_nodes(self, nodes, sbfl_table, all_methods):
         method_nodes_dict = {}
         num_methods = 0
         num_covered = 0
@@ -105,7 +106,7 @@ class ProjectIndexBuilder():
             num_methods += 1
             
             if not all_methods:
-                if not self._any_covered(node, sbfl_res_list):
+                if not self._any_covered(node, sbfl_table):
                     continue
             num_covered += 1
             
@@ -216,13 +217,14 @@ class ProjectIndexBuilder():
                 vector_store.add(batch)
         return summarized_nodes
     
-    def build_nodes(self, sbfl_res_list, all_methods=False):
-        documents = self._load_documents()
+    def build_nodes(self, sbfl_table, all_methods=False):
+        # without all_methods only covered methods are kept, so only their files are parsed
+        documents = self._load_documents(None if all_methods else sbfl_table)
         all_nodes = self._load_nodes(documents, self.class_names, all_methods)
-        method_nodes_dict = self._filter_nodes(all_nodes, sbfl_res_list, all_methods)
+        method_nodes_dict = self._filter_nodes(all_nodes, sbfl_table, all_methods)
         return list(method_nodes_dict.values())
 
-    def build_index(self, sbfl_res_list, all_methods=False):
+    def build_index(self, sbfl_table, all_methods=False):
         """This method only read from document store and vector store"""
         self.path_manager.logger.info(f"[loading] Loading nodes from cache {self.doc_store_file}")
         if not os.path.exists(self.doc_store_file):
@@ -231,13 +233,13 @@ class ProjectIndexBuilder():
         
         # Integrity Check
         summarized_nodes = []
-        documents = self._load_documents()
+        documents = self._load_documents(None if all_methods else sbfl_table)
         project_nodes = self._load_nodes(documents, self.class_names, all_methods)
         for project_node in project_nodes:
             summarized_nodes.append(doc_store.get_node(project_node.id_))
         
         # filter nodes based on coverage
-        method_nodes_dict = self._filter_nodes(summarized_nodes, sbfl_res_list, all_methods)
+        method_nodes_dict = self._filter_nodes(summarized_nodes, sbfl_table, all_methods)
         nodes = list(method_nodes_dict.values())
 
         # load embeddings
@@ -251,12 +253,12 @@ class ProjectIndexBuilder():
     def build_summary(self, all_methods=False):
         if not all_methods:
             # get documents and nodes based on coverage
-            sbfl_res_list = get_all_sbfl_res(self.path_manager)
+            sbfl_table = load_sbfl_table(self.path_manager)
         else:
-            sbfl_res_list = []
+            sbfl_table = None
         documents = self._load_documents()
         all_nodes = self._load_nodes(documents, self.class_names, all_methods)
-        method_nodes_dict = self._filter_nodes(all_nodes, sbfl_res_list, all_methods)
+        method_nodes_dict = self._filter_nodes(all_nodes, sbfl_table, all_methods)
         nodes = self._summarize_nodes(method_nodes_dict)
     
     def build_embeddings(self):
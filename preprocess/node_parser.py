@@ -13,6 +13,7 @@ from llama_index.core.utils import get_tqdm_iterable
 from tree_sitter import Parser as TreeSitterParser
 
 sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.parser_pool import get_parser
 from preprocess.splitter import JavaClassSplitter
 
 LANGUAGE = "java"
@@ -105,10 +106,11 @@ class JavaNodeParser(NodeParser):
     node_parser_map: Dict[str, NodeParser] = Field(
         description="Map of node parser id to node parser.",
     )
-    
-    parser: TreeSitterParser = Field(
-        description="Tree-sitter parser object.",
-    )
+
+    @property
+    def parser(self) -> TreeSitterParser:
+        """The parser of the calling thread, from the shared parser pool."""
+        return get_parser(LANGUAGE)
 
     @classmethod
     def from_defaults(
@@ -120,25 +122,6 @@ class JavaNodeParser(NodeParser):
         callback_manager: Optional[CallbackManager] = None,
     ) -> "JavaNodeParser":
         callback_manager = callback_manager or CallbackManager([])
-        from tree_sitter import Parser  # pants: no-infer-dep
-
-        try:
-            import tree_sitter_languages  # pants: no-infer-dep
-            parser = tree_sitter_languages.get_parser(LANGUAGE)
-        except ImportError:
-            raise ImportError(
-                "Please install tree_sitter_languages to use JavaClassSplitter."
-                "Or pass in a parser object."
-            )
-        except Exception:
-            print(
-                f"Could not get parser for language {LANGUAGE}. Check "
-                "https://github.com/grantjenks/py-tree-sitter-languages#license "
-                "for a list of valid languages."
-            )
-            raise
-        if not isinstance(parser, Parser):
-            raise ValueError("Parser must be a tree-sitter Parser object.")
 
         node_parser_map = {
             "java_class_splitter": JavaClassSplitter.from_defaults(),
@@ -150,7 +133,6 @@ class JavaNodeParser(NodeParser):
             include_metadata=include_metadata,
             include_prev_next_rel=include_prev_next_rel,
             callback_manager=callback_manager,
-            parser=parser,
         )
 
     @classmethod
@@ -0,0 +1,181 @@
+"""
+Index the methods of all Java files of a project in parallel.
+
+Files are parsed by a process pool whose workers build their tree-sitter parser once (see
+`functions/parser_pool.py`) and go through the method cache, and the methods of all files
+are gathered in one flat, array-backed `MethodTable`.
+
+usage:
+    python project_indexer.py <src dir> [--workers N] [--output methods.npz]
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.interval_index import MethodIntervalIndex
+from functions.method_cache import CachedJavaMethodExtractor
+from functions.MethodExtractor.java_method_extractor import SourceLines, body_hash
+from functions.parser_pool import init_worker
+from functions.utils import read_source_bytes
+
+CHUNK_SIZE = 16  # files per task
+
+
+def list_java_files(src_path) -> List[str]:
+    """All .java files under `src_path`, sorted so that file ids are stable."""
+    java_files = []
+    for dirpath, _, filenames in os.walk(src_path):
+        java_files.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(".java"))
+    return sorted(java_files)
+
+
+def index_file(java_file, project=None) -> List[Tuple]:
+    """
+    (class, name, start line, end line, start byte, end byte, body hash) of the methods of a
+    file, lines are 1-based. The body hash is the one of `method.code`, as in the method diff
+    and the ground-truth store. `project` keys the encoding cache of `read_source_bytes`.
+    """
+    source = SourceLines(read_source_bytes(java_file, project))
+    rows = []
+    for method in CachedJavaMethodExtractor().get_java_methods(source.source):
+        (start_row, start_col), (end_row, end_col) = method.loc
+        # tree-sitter columns are byte offsets in their line
+        start_byte = int(source.line_starts[start_row]) + start_col
+        end_byte = int(source.line_starts[end_row]) + end_col
+        rows.append((method.class_name, method.name, start_row + 1, end_row + 1,
+                     start_byte, end_byte, body_hash(method.code)))
+    return rows
+
+
+def _index_files(job: Tuple[List[str], Optional[str]]) -> List[List[Tuple]]:
+    java_files, project = job
+    return [index_file(java_file, project) for java_file in java_files]
+
+
+@dataclass
+class MethodTable():
+    """The methods of a project, one row per method, in file order."""
+    files: List[str]
+    file_ids: np.ndarray
+    class_names: np.ndarray
+    names: np.ndarray
+    start_lines: np.ndarray
+    end_lines: np.ndarray
+    start_bytes: np.ndarray
+    end_bytes: np.ndarray
+    body_hashes: np.ndarray
+
+    @classmethod
+    def from_rows(cls, files: List[str], file_rows: List[List[Tuple]]) -> "MethodTable":
+        file_ids = np.repeat(np.arange(len(files), dtype=np.int64), [len(rows) for rows in file_rows])
+        rows = [row for rows in file_rows for row in rows]
+        columns = list(zip(*rows)) if rows else [()] * 7
+        return cls(files,
+                   file_ids,
+                   np.array(columns[0], dtype=object),
+                   np.array(columns[1], dtype=object),
+                   np.array(columns[2], dtype=np.int64),
+                   np.array(columns[3], dtype=np.int64),
+                   np.array(columns[4], dtype=np.int64),
+                   np.array(columns[5], dtype=np.int64),
+                   np.array(columns[6], dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.file_ids)
+
+    def of_file(self, file_id: int) -> np.ndarray:
+        """Row ids of the methods of a file (rows are grouped by file)."""
+        lo, hi = np.searchsorted(self.file_ids, [file_id, file_id + 1])
+        return np.arange(lo, hi)
+
+    def interval_index(self, file_id: int) -> MethodIntervalIndex:
+        rows = self.of_file(file_id)
+        return MethodIntervalIndex(self.start_lines[rows], self.end_lines[rows])
+
+    def covered_files(self, covers: Callable[[str, int, int], bool]) -> List[str]:
+        """
+        Files with a method for which `covers(class name, start line, end line)` holds, the
+        class name being the file name without extension, as in the SBFL results.
+        """
+        covered = set()
+        for row in range(len(self)):
+            file_id = int(self.file_ids[row])
+            if file_id in covered:
+                continue
+            class_name = os.path.basename(self.files[file_id]).split(".")[0]
+            if covers(class_name, int(self.start_lines[row]), int(self.end_lines[row])):
+                covered.add(file_id)
+        return [self.files[file_id] for file_id in sorted(covered)]
+
+    def save(self, output_file):
+        np.savez_compressed(output_file,
+                            files=np.array(self.files, dtype=str),
+                            file_ids=self.file_ids,
+                            class_names=self.class_names.astype(str),
+                            names=self.names.astype(str),
+                            start_lines=self.start_lines,
+                            end_lines=self.end_lines,
+                            start_bytes=self.start_bytes,
+                            end_bytes=self.end_bytes,
+                            body_hashes=self.body_hashes)
+
+    @classmethod
+    def load(cls, input_file) -> "MethodTable":
+        with np.load(input_file) as data:
+            return cls(data["files"].tolist(),
+                       data["file_ids"],
+                       data["class_names"].astype(object),
+                       data["names"].astype(object),
+                       data["start_lines"],
+                       data["end_lines"],
+                       data["start_bytes"],
+                       data["end_bytes"],
+                       data["body_hashes"])
+
+
+def index_project(src_path, workers: int = 1, java_files: Optional[List[str]] = None) -> MethodTable:
+    """
+    Index the methods of `java_files` (all files under `src_path` by default) with `workers`
+    processes. Callers that already run in parallel (e.g. `run_all --workers`) keep it at 1.
+    """
+    if java_files is None:
+        java_files = list_java_files(src_path)
+    chunks = [(java_files[i: i + CHUNK_SIZE], src_path) for i in range(0, len(java_files), CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) <= 1:
+        file_rows = _index_files((java_files, src_path))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=init_worker) as executor:
+            file_rows = [rows for chunk_rows in executor.map(_index_files, chunks) for rows in chunk_rows]
+    return MethodTable.from_rows(java_files, file_rows)
+
+
+def get_covered_files(src_path, covers: Callable[[str, int, int], bool], covered_classes, workers: int = 1) -> List[str]:
+    """
+    Java files under `src_path` with a method covered by the SBFL results (see
+    `MethodTable.covered_files`). Only the files of `covered_classes` (class names with a
+    covered line) are indexed.
+    """
+    java_files = [java_file for java_file in list_java_files(src_path)
+                  if os.path.basename(java_file).split(".")[0] in covered_classes]
+    return index_project(src_path, workers, java_files).covered_files(covers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the methods of a Java project")
+    parser.add_argument("src_path", type=str)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    table = index_project(args.src_path, args.workers)
+    print(f"{len(table)} methods in {len(table.files)} files")
+    if args.output:
+        table.save(args.output)
@@ -2,15 +2,28 @@ import os
 
 from llama_index.core import SimpleDirectoryReader
 
+from functions.interval_index import LineIndex
 from preprocess.node_parser import JavaNodeParser
+from preprocess.project_indexer import get_covered_files
 
 
 def get_methods_for_sbfl(path_manager, sbfl_res):
+    # covered lines of each class, valued by their score
+    line_indexes = {
+        class_name: LineIndex([line_num for line_num, _ in lines], [score for _, score in lines])
+        for class_name, lines in sbfl_res.items()
+    }
+
+    # only the files of covered methods are parsed into nodes
     src_path = os.path.join(path_manager.buggy_path, path_manager.src_prefix)
+    covered_files = get_covered_files(src_path,
+                                      lambda class_name, start, end: class_name in line_indexes and line_indexes[class_name].any_in(start, end),
+                                      line_indexes,
+                                      path_manager.index_workers)
+    if not covered_files:
+        return []
     reader = SimpleDirectoryReader(
-        input_dir=src_path,
-        recursive=True,
-        required_exts=[".java"],
+        input_files=covered_files,
         encoding="utf-8"
     )
     documents = reader.load_data(show_progress=True)
@@ -26,7 +39,7 @@ def get_methods_for_sbfl(path_manager, sbfl_res):
         all_methods=True)
     
     all_nodes = [node for node in nodes if node.metadata["node_type"] == "method_node"]
-    
+
     for node in all_nodes:
         file_path = node.metadata["file_path"]
         start_line = node.metadata["start_line"]
@@ -34,14 +47,10 @@ def get_methods_for_sbfl(path_manager, sbfl_res):
         file_name = file_path.split("/")[-1]
         class_name = file_name.split(".")[0]
         
-        if class_name in sbfl_res:
-            for line_num, score in sbfl_res[class_name]:
-                if start_line <= line_num <= end_line:
-                    if "sbfl_score" not in node.metadata:
-                        node.metadata["sbfl_score"] = score
-                    else:
-                        if score > node.metadata["sbfl_score"]:
-                            node.metadata["sbfl_score"] = score
+        if class_name in line_indexes:
+            scores = line_indexes[class_name].values_in(start_line, end_line)
+            if len(scores) > 0:
+                node.metadata["sbfl_score"] = scores.max().item()
     
     filtered_nodes = [node for node in all_nodes if "sbfl_score" in node.metadata]
     sorted_nodes = sorted(filtered_nodes, key=lambda x: x.metadata["sbfl_score"], reverse=True)
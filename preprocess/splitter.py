@@ -5,7 +5,6 @@ from abc import abstractmethod
 from pathlib import Path
 from typing import Any, Callable, List, Optional, Sequence, Tuple
 
-from llama_index.core.bridge.pydantic import PrivateAttr
 from llama_index.core.callbacks import CallbackManager, CBEventType, EventPayload
 from llama_index.core.callbacks.base import CallbackManager
 from llama_index.core.callbacks.schema import CBEventType, EventPayload
@@ -14,8 +13,10 @@ from llama_index.core.schema import BaseNode, Document
 from llama_index.core.utils import get_tqdm_iterable
 from pydantic import Field
 from tree_sitter import Node as TreeSitterNode
+from tree_sitter import Parser as TreeSitterParser
 
 sys.path.append(Path(__file__).resolve().parents[1].as_posix())
+from functions.parser_pool import LANGUAGE, get_parser
 from preprocess.my_utils import (
     CLASS_TYPES,
     METHOD_TYPES,
@@ -47,7 +48,10 @@ class JavaClassSplitter(ASTSplitter):
     """Split a java class using a AST parser.
     """
 
-    _parser: Any = PrivateAttr()
+    @property
+    def parser(self) -> TreeSitterParser:
+        """The parser of the calling thread, from the shared parser pool."""
+        return get_parser(LANGUAGE)
 
     def __init__(
         self,
@@ -5,9 +5,11 @@ import pickle
 import shutil
 import sys
 
-from Evaluation.evaluate import evaluate
+from Evaluation.evaluate import evaluate_sf
 from functions.d4j import check_out, get_failed_tests, get_properties
+from functions.ground_truth import get_ground_truth_db
 from functions.sbfl import parse_sbfl, parse_sbfl_version_2
+from functions.sbfl_cache import load_sbfl_ranks
 from preprocess.read_nodes import get_methods_for_sbfl
 from Utils.path_manager import PathManager
 
@@ -49,10 +51,9 @@ def main():
     
     # get cahed buggy method information
     path_manager.logger.info("[get buggy method infos] start...")
-    with open(path_manager.buggy_methods_file, "r") as f:
-        buggy_methods = json.load(f)
-    if bug_name not in buggy_methods:
-        path_manager.logger.error(f"Bug {bug_name} not found in the buggy methods cached file")
+    buggy_methods = get_ground_truth_db().load("sf", bug_name, path_manager.buggy_methods_file)
+    if len(buggy_methods) == 0:
+        path_manager.logger.error(f"Bug {bug_name} not found in the ground-truth database")
         return
     
     # get bug specific information
@@ -64,7 +65,7 @@ def main():
     # ----------------------------------------
 
     sbfl_res = None
-    sbfl_res = parse_sbfl_version_2(path_manager.sbfl_file)
+    sbfl_res = load_sbfl_ranks(path_manager.sbfl_file)
     if len(sbfl_res) == 0:
         path_manager.logger.error(f"Empty SBFL results in {path_manager.sbfl_file}")
         return
@@ -83,7 +84,7 @@ def main():
     #          Evaluate
     # ----------------------------------------
     
-    evaluate(path_manager, sbfl_res, buggy_methods)
+    evaluate_sf(path_manager, sbfl_res, buggy_methods[0])
     
     if args.clear:
         shutil.rmtree(path_manager.buggy_path, ignore_errors=True)
@@ -1,13 +1,20 @@
 import argparse
 import json
 import os
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import time
+import traceback
 from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 
 from Evaluation.evaluate import evaluate_mf, evaluate_sf
-from functions.generate_dataset import make_fix_dataset, sample_fix_dataset
-from functions.sbfl import parse_sbfl_version_2
+from functions.generate_dataset import TOP_RANKS, make_fix_dataset, sample_datasets, sample_fix_dataset
+from functions.sbfl_cache import load_sbfl_ranks
 from projects import SBF
 from SBFL.runMultiprocess_GrowingBugs_partial import projDict
 from Utils.path_manager import PathManager
@@ -18,26 +25,148 @@ sys.path.append(root)
 # ALL_BUGS = SBF
 ALL_BUGS = projDict
 
-def run_all_bugs(config_name: str, top_k: int, clear: bool = True):
-    version = "GrowingBugs"
-    for proj in ALL_BUGS:
-        bugIDs = ALL_BUGS[proj][0]
-        deprecatedIDs = ALL_BUGS[proj][1]
-        subproj = ALL_BUGS[proj][2]
+# statuses of a bug in the manifest, a bug with a dataset is "done" or "skipped"
+BUG_STATUSES = ["pending", "done", "skipped", "empty", "failed", "timeout"]
+
+
+class BugTimeout(BaseException):
+    """Not an Exception, so the `except Exception` blocks (and WorkDir) of a bug's pipeline let it through."""
+    pass
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raise BugTimeout in the body after `seconds` (no limit if None)."""
+    def handler(signum, frame):
+        raise BugTimeout(f"timeout after {seconds}s")
+
+    if not seconds:
+        yield
+        return
+    old_handler = signal.signal(signal.SIGALRM, handler)
+    signal.alarm(int(seconds))
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, old_handler)
+
+
+def get_bug_jobs(all_bugs):
+    """(project, bug id, subproject) of every bug that is not deprecated."""
+    jobs = []
+    for proj in all_bugs:
+        bugIDs = all_bugs[proj][0]
+        deprecatedIDs = all_bugs[proj][1]
+        subproj = all_bugs[proj][2]
         if subproj == 'None':
             subproj = ""
         for bug_id in bugIDs:
-            
-            bug_name = f"{proj}-{bug_id}"
-            
             if bug_id in deprecatedIDs:
                 continue
-            
-            run_one_bug(config_name, version, proj, bug_id, clear, subproj)
-    
-    sample_fix_dataset(ALL_BUGS, top_k)
-
-def run_one_bug(config_name, version, proj, bug_id, clear, subproj):
+            jobs.append((proj, bug_id, subproj))
+    return jobs
+
+
+def run_bug_job(config_name, version, proj, bug_id, clear, subproj, timeout=None):
+    """
+    Run one bug in its own temporary working directory, never raising, and return
+    its manifest entry. The checkouts of a failed bug are removed so that a rerun starts clean.
+    """
+    entry = {"status": "failed", "error": None, "dataset_file": None, "elapsed": None}
+    start_time = time.time()
+    cwd = os.getcwd()
+    path_manager = None
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"{proj}-{bug_id}-") as work_dir:
+            os.chdir(work_dir)
+            try:
+                with time_limit(timeout):
+                    path_manager = get_path_manager(config_name, version, proj, bug_id, clear, subproj)
+                    entry["status"] = process_bug(path_manager)
+            finally:
+                os.chdir(cwd)
+    except BugTimeout as e:
+        entry["status"] = "timeout"
+        entry["error"] = str(e)
+    except Exception:
+        entry["status"] = "failed"
+        entry["error"] = traceback.format_exc()
+
+    if path_manager is not None:
+        if entry["status"] in ["failed", "timeout"]:
+            path_manager.logger.error(f"{proj}-{bug_id} {entry['status']}: {entry['error']}")
+            shutil.rmtree(path_manager.buggy_path, ignore_errors=True)
+            shutil.rmtree(path_manager.fixed_path, ignore_errors=True)
+        if os.path.exists(path_manager.dataset_file):
+            entry["dataset_file"] = path_manager.dataset_file
+    entry["elapsed"] = round(time.time() - start_time, 3)
+    return entry
+
+
+def write_manifest(manifest, manifest_file):
+    tmp_file = f"{manifest_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+
+def run_all_bugs(config_name: str,
+                 top_k: int,
+                 clear: bool = True,
+                 workers: int = 1,
+                 timeout: int = None,
+                 manifest_file: str = None):
+    """
+    Make the dataset of every bug with `workers` processes, each bug limited to `timeout`
+    seconds. The status of every bug is written to `manifest_file` as soon as it finishes,
+    then the datasets of the manifest are sampled.
+    """
+    version = "GrowingBugs"
+    if manifest_file is None:
+        manifest_file = os.path.join(root, "DebugResult", config_name, version, "manifest.json")
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+
+    jobs = get_bug_jobs(ALL_BUGS)
+    manifest = {
+        "config": config_name,
+        "version": version,
+        "workers": workers,
+        "timeout": timeout,
+        "bugs": {f"{proj}-{bug_id}": {"status": "pending"} for proj, bug_id, _ in jobs},
+    }
+    write_manifest(manifest, manifest_file)
+
+    if workers <= 1:
+        for proj, bug_id, subproj in jobs:
+            manifest["bugs"][f"{proj}-{bug_id}"] = run_bug_job(config_name, version, proj, bug_id, clear, subproj, timeout)
+            write_manifest(manifest, manifest_file)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(run_bug_job, config_name, version, proj, bug_id, clear, subproj, timeout): f"{proj}-{bug_id}"
+                for proj, bug_id, subproj in jobs
+            }
+            for future in as_completed(futures):
+                bug_name = futures[future]
+                try:
+                    manifest["bugs"][bug_name] = future.result()
+                except Exception:
+                    # the worker process died, e.g. killed by the OOM killer
+                    manifest["bugs"][bug_name] = {"status": "failed", "error": traceback.format_exc(),
+                                                  "dataset_file": None, "elapsed": None}
+                write_manifest(manifest, manifest_file)
+                print(f"[{bug_name}] {manifest['bugs'][bug_name]['status']}")
+
+    statuses = [entry["status"] for entry in manifest["bugs"].values()]
+    print(", ".join(f"{status}: {statuses.count(status)}" for status in BUG_STATUSES if statuses.count(status)))
+
+    dataset_files = {bug_name: entry["dataset_file"]
+                     for bug_name, entry in manifest["bugs"].items() if entry.get("dataset_file")}
+    sample_datasets(dataset_files, top_k, os.path.dirname(manifest_file))
+
+
+def get_path_manager(config_name, version, proj, bug_id, clear, subproj):
     args = Namespace(
         config=config_name,
         version=version,
@@ -46,24 +175,30 @@ def run_one_bug(config_name, version, proj, bug_id, clear, subproj):
         subproj=subproj,
         clear=clear
     )
+    return PathManager(args)
+
+
+def run_one_bug(config_name, version, proj, bug_id, clear, subproj):
+    return process_bug(get_path_manager(config_name, version, proj, bug_id, clear, subproj))
+
 
-    path_manager = PathManager(args)
+def process_bug(path_manager: PathManager) -> str:
     path_manager.logger.info("*" * 100)
-    path_manager.logger.info(f"Start debugging bug {args.version}-{args.project}-{args.bugID}")
+    path_manager.logger.info(f"Start debugging bug {path_manager.version}-{path_manager.project}-{path_manager.bug_id}")
 
     if os.path.exists(path_manager.dataset_file):
-        path_manager.logger.info(f"d4j{args.version}-{args.project}-{args.bugID} already finished, skip!")
-        return
+        path_manager.logger.info(f"d4j{path_manager.version}-{path_manager.project}-{path_manager.bug_id} already finished, skip!")
+        return "skipped"
 
     # ----------------------------------------
     #          SBFL results
     # ----------------------------------------
 
     sbfl_res = None
-    sbfl_res = parse_sbfl_version_2(path_manager.sbfl_file)
+    sbfl_res = load_sbfl_ranks(path_manager.sbfl_file, top_k=TOP_RANKS)
     if len(sbfl_res) == 0:
         path_manager.logger.error(f"Empty SBFL results in {path_manager.sbfl_file}")
-        return
+        return "empty"
 
     # ----------------------------------------
     #          make dataset for fix tool
@@ -81,16 +216,20 @@ def run_one_bug(config_name, version, proj, bug_id, clear, subproj):
     #     evaluate_mf(path_manager, sbfl_res, buggy_method)
     # else:
     #     raise ValueError(f"Unknown config name: {config_name}")
+    return "done"
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-k", type=int, required=False, default=1)
+    parser.add_argument("--workers", type=int, required=False, default=1, help="Number of bugs run in parallel")
+    parser.add_argument("--timeout", type=int, required=False, default=None, help="Timeout of a bug in seconds")
+    parser.add_argument("--manifest", type=str, required=False, default=None, help="Path of the results manifest")
     args = parser.parse_args()
 
     config_name = "sf-evaluation"
-    run_all_bugs(config_name, args.k, True)
+    run_all_bugs(config_name, args.k, True, args.workers, args.timeout, args.manifest)
 
     # config_name = "mf-evaluation"
     # mf_file = "/root/APR/FLtools/MethodLevelSBFL/Evaluation/GrowingBug-mf.json"